@@ -2,125 +2,41 @@ import anthropic
 import base64
 import json
 import logging
-from typing import Dict, List, Optional
-from config import ANTHROPIC_API_KEY
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+from config import (
+    ANTHROPIC_API_KEY, ANALYSIS_CONCURRENCY, ANALYSIS_MAX_RETRIES, ANALYSIS_CACHE_ENABLED,
+    ANALYSIS_BATCH_SIZE, PROMPT_CACHING_ENABLED, IMAGE_PAYLOAD_BUDGET
+)
+from rate_limiter import RateLimitSemaphore
+from memory_budget import MemoryBudget, payload_estimate, request_payload_size
+from analysis_cache import AnalysisCache
+from image_preprocessor import ImagePreprocessor
 
 logger = logging.getLogger(__name__)
 
-class FloorAnalyzer:
-    def __init__(self, api_key: str = ANTHROPIC_API_KEY):
-        if not api_key:
-            # Используем переменную окружения если ключ не передан
-            import os
-            api_key = os.getenv('ANTHROPIC_API_KEY')
-        
-        if api_key:
-            self.client = anthropic.Anthropic(api_key=api_key)
-        else:
-            # Создаем заглушку если нет ключа
-            self.client = None
-            logger.warning("Anthropic API key not provided, image analysis will be disabled")
-    
-    def analyze_floor_image(self, image_path: str, context: str = "") -> Dict:
-        """
-        Анализирует изображение пола с учетом контекста разговора
-        
-        Args:
-            image_path: Путь к изображению
-            context: Контекст разговора с клиентом
-            
-        Returns:
-            Dict с результатами анализа
-        """
-        if not self.client:
-            return {
-                'success': False,
-                'error': 'Anthropic API key not configured',
-                'floor_type': 'unknown',
-                'condition': 'unknown',
-                'damages': [],
-                'area_estimate': 20,
-                'recommendations': ['Требуется настройка Anthropic API'],
-                'cost_estimate': 0
-            }
-        
-        try:
-            # Конвертируем изображение в base64
-            with open(image_path, 'rb') as image_file:
-                image_data = base64.b64encode(image_file.read()).decode('utf-8')
-            
-            # Определяем тип изображения
-            image_type = "image/jpeg"
-            if image_path.lower().endswith('.png'):
-                image_type = "image/png"
-            elif image_path.lower().endswith('.webp'):
-                image_type = "image/webp"
-            
-            # Создаем промпт с контекстом
-            prompt = self._create_analysis_prompt(context)
-            
-            # Отправляем запрос к Claude
-            response = self.client.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=1500,
-                temperature=0.1,
-                messages=[{
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": image_type,
-                                "data": image_data
-                            }
-                        },
-                        {
-                            "type": "text",
-                            "text": prompt
-                        }
-                    ]
-                }]
-            )
-            
-            # Парсим ответ
-            analysis_text = response.content[0].text
-            return self._parse_analysis_response(analysis_text)
-            
-        except Exception as e:
-            logger.error(f"Error analyzing floor image: {e}")
-            return {
-                'success': False,
-                'error': str(e),
-                'floor_type': 'unknown',
-                'condition': 'unknown',
-                'damages': [],
-                'area_estimate': 0,
-                'recommendations': [],
-                'cost_estimate': 0
-            }
-    
-    def _create_analysis_prompt(self, context: str) -> str:
-        """Создает промпт для анализа изображения"""
-        prompt = f"""
-Ты эксперт по напольным покрытиям в Израиле с 15-летним опытом работы.
+RATE_LIMIT_STATUS_CODES = {429, 529}
 
-КОНТЕКСТ РАЗГОВОРА С КЛИЕНТОМ:
-{context if context else "Контекст отсутствует"}
+ANALYSIS_MODEL = "claude-3-5-sonnet-20241022"
+# Увеличивать при любом изменении промпта, чтобы не использовать старые результаты из кэша
+PROMPT_VERSION = "2"
 
-Проанализируй изображение пола и предоставь детальную оценку в формате JSON:
+# Поля usage, которые суммируются по всем запросам задачи
+USAGE_FIELDS = ('input_tokens', 'output_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens')
 
-{{
+# JSON схема результата анализа одного изображения
+ANALYSIS_JSON_SCHEMA = """{
     "floor_type": "тип покрытия (parquet/laminate/tiles/linoleum/carpet/concrete)",
     "floor_type_hebrew": "название на иврите",
     "condition": "состояние (excellent/good/fair/poor)",
     "condition_description": "подробное описание состояния",
     "damages": [
-        {{
+        {
             "type": "тип повреждения",
             "severity": "серьезность (minor/moderate/severe)",
             "description": "описание повреждения"
-        }}
+        }
     ],
     "area_estimate": "примерная площадь в кв.м (число)",
     "room_type": "тип помещения (living_room/bedroom/kitchen/bathroom/hallway/balcony)",
@@ -133,18 +49,355 @@ class FloorAnalyzer:
     "estimated_duration": "время выполнения в днях",
     "special_notes": "особые замечания",
     "confidence_level": "уверенность в анализе (0-100)"
-}}
+}"""
 
-ВАЖНЫЕ ОСОБЕННОСТИ ИЗРАИЛЬСКОГО РЫНКА:
+MARKET_NOTES = """ВАЖНЫЕ ОСОБЕННОСТИ ИЗРАИЛЬСКОГО РЫНКА:
 - Учитывай климатические условия (жаркое лето, влажность)
 - Стандартные размеры помещений в израильских квартирах
 - Популярные материалы: керамическая плитка, ламинат, паркет
-- Типичные проблемы: трещины от жары, износ от песка
+- Типичные проблемы: трещины от жары, износ от песка"""
+
+# Колбэк прогресса: (готово изображений, всего, предварительный объединенный анализ)
+ProgressCallback = Callable[[int, int, Dict], None]
+
+CONDITION_PRIORITY = {'excellent': 4, 'good': 3, 'fair': 2, 'poor': 1, 'unknown': 0}
+COMPLEXITY_PRIORITY = {'low': 1, 'medium': 2, 'high': 3}
+
+class AnalysisAccumulator:
+    """
+    Объединяет анализы изображений по мере поступления.
+
+    Каждое добавление обновляет сводку за O(1), поэтому предварительный
+    результат можно получать после каждого изображения. result() возвращает
+    то же, что FloorAnalyzer._combine_analyses для добавленных анализов.
+    """
+
+    def __init__(self, context: str = ""):
+        self.context = context
+        self.analyses = []
+        self.floor_type_counts = {}
+        self.worst_condition = None
+        self.max_area = None
+        self.max_complexity = None
+        self.damages = []
+        self.recommendations = {}  # dict как упорядоченное множество
+        self.bytes_saved = 0
+        self.usages = []
+
+    def add(self, analysis: Dict):
+        self.analyses.append(analysis)
+        self.bytes_saved += analysis.get('upload_stats', {}).get('bytes_saved', 0)
+        if analysis.get('usage'):
+            self.usages.append(analysis['usage'])
+
+        if not analysis.get('success'):
+            return
+
+        floor_type = analysis.get('floor_type', 'unknown')
+        self.floor_type_counts[floor_type] = self.floor_type_counts.get(floor_type, 0) + 1
+
+        # Общее состояние - худшее из всех
+        condition = analysis.get('condition', 'unknown')
+        if self.worst_condition is None or \
+                CONDITION_PRIORITY.get(condition, 0) < CONDITION_PRIORITY.get(self.worst_condition, 0):
+            self.worst_condition = condition
+
+        # Площадь - максимальная оценка
+        area = analysis.get('area_estimate', 0)
+        if self.max_area is None or area > self.max_area:
+            self.max_area = area
+
+        complexity = analysis.get('work_complexity', 'medium')
+        if self.max_complexity is None or \
+                COMPLEXITY_PRIORITY.get(complexity, 2) > COMPLEXITY_PRIORITY.get(self.max_complexity, 2):
+            self.max_complexity = complexity
+
+        if analysis.get('damages'):
+            self.damages.extend(analysis['damages'])
+        for recommendation in analysis.get('recommendations') or []:
+            self.recommendations[recommendation] = None
+
+    def add_usage(self, usage: Dict):
+        """Токены запроса, не привязанные к одному изображению (пакетный режим)"""
+        self.usages.append(usage)
+
+    def token_usage(self) -> Dict:
+        return {field: sum(u.get(field, 0) for u in self.usages) for field in USAGE_FIELDS}
+
+    def result(self) -> Dict:
+        if not self.analyses:
+            return {
+                'success': False,
+                'error': 'No images to analyze'
+            }
+
+        if self.floor_type_counts:
+            floor_type = max(self.floor_type_counts, key=self.floor_type_counts.get)
+        else:
+            floor_type = 'unknown'
+
+        return {
+            'success': True,
+            'floor_type': floor_type,
+            'condition': self.worst_condition or 'unknown',
+            'total_area_estimate': self.max_area if self.max_area is not None else 20,
+            'damages': list(self.damages),
+            'recommendations': list(self.recommendations),
+            'work_complexity': self.max_complexity or 'medium',
+            'images_analyzed': len(self.analyses),
+            'bytes_saved': self.bytes_saved,
+            'token_usage': self.token_usage(),
+            'individual_analyses': list(self.analyses),
+            'context': self.context
+        }
+
+class BaseFloorAnalyzer:
+    """
+    Общая часть синхронного и asyncio анализаторов: настройки, сборка
+    запросов, кэш, разбор ответов и объединение результатов.
+
+    Отправку запросов, ожидание памяти и порядок работы (потоки или
+    корутины) реализуют подклассы. Клиент, лимит запросов и бюджет памяти
+    создаются из атрибутов класса.
+    """
+    
+    client_class = anthropic.Anthropic
+    rate_limiter_class = RateLimitSemaphore
+    memory_budget_class = MemoryBudget
+    
+    def __init__(self, api_key: str = ANTHROPIC_API_KEY, concurrency: int = ANALYSIS_CONCURRENCY,
+                 max_retries: int = ANALYSIS_MAX_RETRIES, cache: Optional[AnalysisCache] = None,
+                 preprocessor: Optional[ImagePreprocessor] = None, batch_size: int = ANALYSIS_BATCH_SIZE,
+                 prompt_caching: bool = PROMPT_CACHING_ENABLED,
+                 memory_budget: Optional[MemoryBudget] = None):
+        if not api_key:
+            # Используем переменную окружения если ключ не передан
+            api_key = os.getenv('ANTHROPIC_API_KEY')
+        
+        if api_key:
+            # Повторы при 429/529 и общую паузу делает _create_message, а не SDK
+            self.client = self.client_class(api_key=api_key, max_retries=0)
+        else:
+            # Создаем заглушку если нет ключа
+            self.client = None
+            logger.warning("Anthropic API key not provided, image analysis will be disabled")
+        
+        # Общий лимит одновременных запросов для всех чатов
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.rate_limiter = self.rate_limiter_class(self.concurrency)
+        
+        # Общий для всех чатов бюджет памяти на фото в обработке и в запросах
+        self.memory_budget = memory_budget or self.memory_budget_class(IMAGE_PAYLOAD_BUDGET)
+        
+        # Кэш результатов по содержимому изображения
+        if cache is None and ANALYSIS_CACHE_ENABLED:
+            cache = AnalysisCache()
+        self.cache = cache
+        
+        # Уменьшение и перекодирование фото перед отправкой
+        self.preprocessor = preprocessor or ImagePreprocessor()
+        
+        # Сколько изображений отправлять в одном запросе
+        self.batch_size = max(1, batch_size)
+        
+        # Кэширование статической инструкции и контекста переписки на стороне API
+        self.prompt_caching = prompt_caching
+    
+    def _single_image_request(self, image_block: Dict, context: str) -> Dict:
+        """
+        Параметры запроса для одного изображения: статическая инструкция
+        и контекст переписки кэшируются, меняется только изображение
+        """
+        return {
+            'model': ANALYSIS_MODEL,
+            'max_tokens': 1500,
+            'temperature': 0.1,
+            'system': self._create_system_blocks(),
+            'messages': [{
+                "role": "user",
+                "content": [
+                    self._create_context_block(context),
+                    image_block,
+                    {
+                        "type": "text",
+                        "text": "Проанализируй это изображение пола и ответь JSON по схеме из инструкции."
+                    }
+                ]
+            }]
+        }
+    
+    def _batch_request(self, content: List[Dict], image_count: int) -> Dict:
+        """Параметры запроса для группы изображений (content из _prepare_batch_content)"""
+        return {
+            'model': ANALYSIS_MODEL,
+            'max_tokens': min(8192, 1000 + 1000 * image_count),
+            'temperature': 0.1,
+            'system': self._create_system_blocks(),
+            'messages': [{
+                "role": "user",
+                "content": content + [{"type": "text", "text": self._create_batch_prompt(image_count)}]
+            }]
+        }
+    
+    def _no_client_result(self) -> Dict:
+        """Результат, когда ключ Anthropic API не настроен"""
+        return {
+            'success': False,
+            'error': 'Anthropic API key not configured',
+            'floor_type': 'unknown',
+            'condition': 'unknown',
+            'damages': [],
+            'area_estimate': 20,
+            'recommendations': ['Требуется настройка Anthropic API'],
+            'cost_estimate': 0
+        }
+    
+    def _error_result(self, error: str) -> Dict:
+        """Результат неудачного анализа изображения"""
+        return {
+            'success': False,
+            'error': error,
+            'floor_type': 'unknown',
+            'condition': 'unknown',
+            'damages': [],
+            'area_estimate': 0,
+            'recommendations': [],
+            'cost_estimate': 0
+        }
+    
+    def _failed_analysis(self, image_file: Dict, error: str) -> Dict:
+        """Результат для изображения, которое не удалось проанализировать"""
+        analysis = self._error_result(error)
+        analysis['image_name'] = image_file['name']
+        return analysis
+    
+    def _read_image(self, image_path: str) -> bytes:
+        with open(image_path, 'rb') as image_file:
+            return image_file.read()
+    
+    def _lookup_cache(self, image_path: str, image_bytes: bytes, context: str,
+                      batch: bool = False) -> Tuple[Optional[str], Optional[Dict]]:
+        """
+        Возвращает ключ кэша и закэшированный анализ (или None).
+        Результаты пакетного запроса получены по другому промпту, поэтому
+        хранятся под отдельным ключом и не подменяют одиночный анализ.
+        """
+        if not self.cache:
+            return None, None
+        
+        prompt_id = f"{ANALYSIS_MODEL}:{PROMPT_VERSION}" + (":batch" if batch else "")
+        cache_key = AnalysisCache.make_key(image_bytes, context, prompt_id)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Analysis cache hit for {image_path}")
+        return cache_key, cached
+    
+    def _prepare_image_block(self, image_path: str, image_bytes: bytes) -> Tuple[Dict, Dict]:
+        """
+        Уменьшает изображение и создает блок image для запроса. Байты
+        уменьшенного фото после кодирования не хранятся - остается только
+        статистика в prepared.
+        """
+        prepared = self.preprocessor.prepare(image_path, image_bytes)
+        image_block = {
+            "type": "image",
+            "source": {
+                "type": "base64",
+                "media_type": prepared['media_type'],
+                "data": base64.b64encode(prepared.pop('data')).decode('utf-8')
+            }
+        }
+        return image_block, prepared
+    
+    def _prepare_batch_content(self, images: List[Dict], context: str) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+        """
+        Читает и уменьшает изображения группы
+
+        Returns:
+            (блоки запроса с контекстом и пронумерованными изображениями,
+             блоки image, статистика загрузки по каждому изображению)
+        """
+        content = [self._create_context_block(context)]
+        image_blocks = []
+        upload_stats = []
+        for number, image_file in enumerate(images, 1):
+            image_block, prepared = self._prepare_image_block(
+                image_file['path'], self._read_image(image_file['path']))
+            content.append({"type": "text", "text": f"Изображение {number}:"})
+            content.append(image_block)
+            image_blocks.append(image_block)
+            upload_stats.append(self._upload_stats(prepared))
+        return content, image_blocks, upload_stats
+    
+    def _batch_payload_estimate(self, images: List[Dict]) -> int:
+        return sum(payload_estimate(os.path.getsize(image_file['path'])) for image_file in images)
+    
+    def _payload_size(self, image_blocks: List[Dict]) -> int:
+        """Память, которую занимают готовые блоки image до конца запроса"""
+        return sum(request_payload_size(len(block['source']['data'])) for block in image_blocks)
+    
+    def _upload_stats(self, prepared: Dict) -> Dict:
+        """Статистика экономии трафика для одного изображения"""
+        logger.info(f"Uploaded {prepared['processed_bytes']} bytes, saved {prepared['bytes_saved']} bytes")
+        return {
+            'original_bytes': prepared['original_bytes'],
+            'uploaded_bytes': prepared['processed_bytes'],
+            'bytes_saved': prepared['bytes_saved']
+        }
+    
+    def _message_create(self):
+        """Метод клиента для отправки запроса"""
+        if self.prompt_caching:
+            return self.client.beta.prompt_caching.messages.create
+        return self.client.messages.create
+    
+    def _get_retry_after(self, error: Exception) -> Optional[float]:
+        """Извлекает Retry-After из ответа API"""
+        try:
+            value = error.response.headers.get('retry-after')
+            return float(value) if value is not None else None
+        except (AttributeError, ValueError):
+            return None
+    
+    def _get_usage(self, response) -> Dict:
+        """Токены запроса, включая чтение и запись кэша промпта"""
+        usage = getattr(response, 'usage', None)
+        return {field: getattr(usage, field, None) or 0 for field in USAGE_FIELDS}
+    
+    def _cache_control(self, block: Dict) -> Dict:
+        """Помечает блок как границу кэшируемого префикса"""
+        if self.prompt_caching:
+            block["cache_control"] = {"type": "ephemeral"}
+        return block
+    
+    def _create_system_blocks(self) -> List[Dict]:
+        """Статическая инструкция, одинаковая для всех запросов"""
+        return [self._cache_control({"type": "text", "text": self._create_system_prompt()})]
+    
+    def _create_system_prompt(self) -> str:
+        """Создает статическую часть промпта: роль, JSON схему и особенности рынка"""
+        prompt = f"""
+Ты эксперт по напольным покрытиям в Израиле с 15-летним опытом работы.
+
+Ты анализируешь фотографии полов от клиентов и даешь детальную оценку.
+Результат анализа одного изображения - JSON по схеме:
+
+{ANALYSIS_JSON_SCHEMA}
+
+{MARKET_NOTES}
 
 Будь максимально точным и практичным в рекомендациях.
 """
         return prompt
     
+    def _create_context_block(self, context: str) -> Dict:
+        """Контекст переписки - общий для всех изображений одного экспорта"""
+        return self._cache_control({
+            "type": "text",
+            "text": f"КОНТЕКСТ РАЗГОВОРА С КЛИЕНТОМ:\n{context if context else 'Контекст отсутствует'}"
+        })
+    
     def _parse_analysis_response(self, response_text: str) -> Dict:
         """Парсит ответ от Claude"""
         try:
@@ -204,80 +457,332 @@ class FloorAnalyzer:
         
         return analysis
     
-    def analyze_multiple_images(self, image_files: List[Dict], context: str = "") -> Dict:
+    def _create_batch_prompt(self, image_count: int) -> str:
+        """Создает инструкцию для анализа нескольких изображений в одном запросе"""
+        prompt = f"""
+Выше {image_count} изображений пола одного объекта, пронумерованных от 1 до {image_count}.
+Проанализируй каждое изображение по схеме из инструкции, а затем дай общую оценку всего объекта.
+Ответь одним JSON объектом:
+
+{{
+    "images": [
+        {{"image_index": 1, ...поля по схеме анализа одного изображения...}}
+    ],
+    "overall": {{
+        "floor_type": "основной тип покрытия",
+        "condition": "общее состояние (excellent/good/fair/poor)",
+        "total_area_estimate": "общая площадь всех помещений в кв.м без повторного учета одного помещения (число)",
+        "work_complexity": "сложность работ (low/medium/high)",
+        "recommendations": ["рекомендация 1", "рекомендация 2"]
+    }}
+}}
+"""
+        return prompt
+    
+    def _parse_batch_response(self, response_text: str, image_count: int) -> Tuple[List[Dict], Optional[Dict]]:
+        """Парсит ответ на пакетный запрос: анализ по каждому изображению и общую оценку"""
+        try:
+            start_idx = response_text.find('{')
+            end_idx = response_text.rfind('}') + 1
+            if start_idx == -1 or end_idx == 0:
+                raise json.JSONDecodeError("No JSON found in response", response_text, 0)
+            data = json.loads(response_text[start_idx:end_idx])
+        except json.JSONDecodeError:
+            logger.warning("Failed to parse batch JSON response")
+            data = {}
+        
+        items = data.get('images') if isinstance(data.get('images'), list) else []
+        by_index = {}
+        for position, item in enumerate(items, 1):
+            if isinstance(item, dict):
+                try:
+                    index = int(item.get('image_index', position))
+                except (TypeError, ValueError):
+                    index = position
+                by_index.setdefault(index, item)
+        
+        analyses = []
+        for index in range(1, image_count + 1):
+            item = by_index.get(index)
+            if item is None:
+                analyses.append(self._error_result('No result for image in batch response'))
+            else:
+                item = dict(item)
+                item.pop('image_index', None)
+                item['success'] = True
+                analyses.append(item)
+        
+        overall = None
+        if isinstance(data.get('overall'), dict):
+            overall = {key: data['overall'][key] for key in
+                       ('floor_type', 'condition', 'work_complexity', 'recommendations')
+                       if data['overall'].get(key)}
+            try:
+                overall['total_area_estimate'] = float(data['overall']['total_area_estimate'])
+            except (KeyError, TypeError, ValueError):
+                pass
+        
+        return analyses, overall
+    
+    def _batch_result(self, response, images: List[Dict], upload_stats: List[Dict]) -> Tuple[List[Dict], Optional[Dict], Dict]:
+        """Анализы группы с именами файлов и статистикой, общая оценка и usage запроса"""
+        analyses, overall = self._parse_batch_response(response.content[0].text, len(images))
+        for analysis, image_file, stats in zip(analyses, images, upload_stats):
+            analysis['image_name'] = image_file['name']
+            analysis['upload_stats'] = stats
+        return analyses, overall, self._get_usage(response)
+    
+    def _failed_batch(self, images: List[Dict], error: str) -> Tuple[List[Dict], None, None]:
+        return [self._failed_analysis(image_file, error) for image_file in images], None, None
+    
+    def _merge_batches(self, images: List[Dict], individual_analyses: List[Optional[Dict]], pending: List[Tuple],
+                       chunks: List[List[Tuple]], batch_results: List[Tuple],
+                       context: str) -> Tuple[Dict, List[Tuple[str, Dict]]]:
+        """
+        Раскладывает результаты пакетов по исходным позициям и объединяет их
+
+        Returns:
+            (объединенный анализ, пары ключ/анализ для записи в кэш)
+        """
+        to_cache = []
+        for chunk, (analyses, overall, usage) in zip(chunks, batch_results):
+            for (i, image_file, cache_key), analysis in zip(chunk, analyses):
+                if cache_key and analysis.get('success'):
+                    to_cache.append((cache_key, {k: v for k, v in analysis.items()
+                                                 if k not in ('image_name', 'upload_stats', 'usage')}))
+                individual_analyses[i] = analysis
+        
+        batch_usage = [usage for _, _, usage in batch_results if usage]
+        combined = self._combine_analyses(individual_analyses, context, batch_usage)
+        
+        # Если все изображения были в одном запросе, общая оценка модели
+        # точнее эвристик объединения (например, площадь по нескольким ракурсам)
+        if len(chunks) == 1 and len(pending) == len(images):
+            overall = batch_results[0][1]
+            if combined.get('success') and overall:
+                combined.update(overall)
+        
+        return combined, to_cache
+    
+    def _combine_analyses(self, analyses: List[Dict], context: str,
+                          request_usage: Optional[List[Dict]] = None) -> Dict:
+        """Объединяет результаты анализа нескольких изображений"""
+        accumulator = AnalysisAccumulator(context)
+        for analysis in analyses:
+            accumulator.add(analysis)
+        
+        # Токены по всем запросам задачи, включая чтение/запись кэша промпта
+        for usage in request_usage or []:
+            accumulator.add_usage(usage)
+        if accumulator.usages:
+            logger.info(f"Token usage: {accumulator.token_usage()}")
+        
+        return accumulator.result()
+
+class FloorAnalyzer(BaseFloorAnalyzer):
+    """Анализ изображений пола через Claude: запросы из пула потоков"""
+    
+    def analyze_floor_image(self, image_path: str, context: str = "") -> Dict:
+        """
+        Анализирует изображение пола с учетом контекста разговора
+        
+        Args:
+            image_path: Путь к изображению
+            context: Контекст разговора с клиентом
+            
+        Returns:
+            Dict с результатами анализа
+        """
+        if not self.client:
+            return self._no_client_result()
+        
+        try:
+            # Память на фото занимается до чтения файла и освобождается после ответа
+            with self.memory_budget.reserve(payload_estimate(os.path.getsize(image_path))) as reservation:
+                image_bytes = self._read_image(image_path)
+                
+                # Проверяем кэш: те же фото часто присылают повторно
+                cache_key, cached = self._lookup_cache(image_path, image_bytes, context)
+                if cached is not None:
+                    return cached
+                
+                # Уменьшаем изображение и конвертируем в base64
+                image_block, prepared = self._prepare_image_block(image_path, image_bytes)
+                del image_bytes
+                reservation.shrink(self._payload_size([image_block]))
+                
+                # Отправляем запрос к Claude
+                response = self._create_message(**self._single_image_request(image_block, context))
+            
+            # Парсим ответ
+            analysis_text = response.content[0].text
+            analysis = self._parse_analysis_response(analysis_text)
+            
+            if cache_key and analysis.get('success'):
+                self.cache.set(cache_key, analysis)
+            
+            analysis['upload_stats'] = self._upload_stats(prepared)
+            analysis['usage'] = self._get_usage(response)
+            
+            return analysis
+            
+        except Exception as e:
+            logger.error(f"Error analyzing floor image: {e}")
+            return self._error_result(str(e))
+    
+    def _create_message(self, **kwargs):
+        """Отправляет запрос к Claude с учетом лимита одновременных запросов и повторами при 429/529"""
+        create = self._message_create()
+        
+        attempt = 0
+        while True:
+            with self.rate_limiter:
+                try:
+                    response = create(**kwargs)
+                    self.rate_limiter.report_success()
+                    return response
+                except anthropic.APIStatusError as e:
+                    if e.status_code not in RATE_LIMIT_STATUS_CODES or attempt >= self.max_retries:
+                        raise
+                    retry_after = self._get_retry_after(e)
+            
+            # Пауза включается вне семафора, чтобы не держать слот
+            attempt += 1
+            self.rate_limiter.report_rate_limit(retry_after)
+    
+    def analyze_multiple_images(self, image_files: List[Dict], context: str = "",
+                                concurrency: Optional[int] = None, batch_size: Optional[int] = None,
+                                on_progress: Optional[ProgressCallback] = None) -> Dict:
         """
         Анализирует несколько изображений и объединяет результаты
         
         Args:
             image_files: Список файлов изображений
             context: Контекст разговора
+            concurrency: Число параллельных запросов (по умолчанию self.concurrency, 1 - последовательно)
+            batch_size: Изображений в одном запросе (по умолчанию self.batch_size, 1 - по одному)
+            on_progress: Вызывается в потоке вызывающего после каждого готового
+                изображения (или пакета) с предварительным объединенным анализом
             
         Returns:
             Объединенный анализ всех изображений
         """
-        individual_analyses = []
+        images = [f for f in image_files if f['type'] == 'image']
+        batch_size = batch_size or self.batch_size
+        
+        if batch_size > 1 and len(images) > 1:
+            return self._analyze_in_batches(images, context, batch_size, concurrency, on_progress)
+        
+        workers = min(concurrency or self.concurrency, len(images))
+        progress = AnalysisAccumulator(context)
         
-        for i, image_file in enumerate(image_files):
-            if image_file['type'] == 'image':
-                logger.info(f"Analyzing image {i+1}/{len(image_files)}: {image_file['name']}")
-                analysis = self.analyze_floor_image(image_file['path'], context)
-                analysis['image_name'] = image_file['name']
-                individual_analyses.append(analysis)
+        def analyze(i, image_file):
+            logger.info(f"Analyzing image {i+1}/{len(images)}: {image_file['name']}")
+            analysis = self.analyze_floor_image(image_file['path'], context)
+            analysis['image_name'] = image_file['name']
+            return analysis
+        
+        individual_analyses = [None] * len(images)
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='floor-analysis') as executor:
+                futures = {executor.submit(analyze, i, image_file): i for i, image_file in enumerate(images)}
+                for future in as_completed(futures):
+                    # Результат кладем на исходную позицию изображения
+                    individual_analyses[futures[future]] = future.result()
+                    self._report_progress(on_progress, progress, [future.result()], len(images))
+        else:
+            for i, image_file in enumerate(images):
+                individual_analyses[i] = analyze(i, image_file)
+                self._report_progress(on_progress, progress, [individual_analyses[i]], len(images))
         
         # Объединяем результаты
         return self._combine_analyses(individual_analyses, context)
     
-    def _combine_analyses(self, analyses: List[Dict], context: str) -> Dict:
-        """Объединяет результаты анализа нескольких изображений"""
-        if not analyses:
-            return {
-                'success': False,
-                'error': 'No images to analyze'
-            }
+    def _report_progress(self, on_progress: Optional[ProgressCallback], progress: AnalysisAccumulator,
+                         analyses: List[Dict], total: int):
+        """Добавляет готовые анализы в предварительную сводку и сообщает о прогрессе"""
+        if on_progress is None or not analyses:
+            return
+        for analysis in analyses:
+            progress.add(analysis)
+        try:
+            on_progress(len(progress.analyses), total, progress.result())
+        except Exception as e:
+            # Ошибка отображения прогресса не должна прерывать анализ
+            logger.warning(f"Progress callback failed: {e}")
+    
+    def _analyze_in_batches(self, images: List[Dict], context: str, batch_size: int,
+                            concurrency: Optional[int] = None,
+                            on_progress: Optional[ProgressCallback] = None) -> Dict:
+        """
+        Отправляет изображения группами по batch_size в одном запросе с общим
+        контекстом. Уже закэшированные изображения в запросы не попадают.
+        """
+        individual_analyses = [None] * len(images)
+        pending = []  # (индекс, файл, ключ кэша)
         
-        # Определяем наиболее частый тип пола
-        floor_types = [a.get('floor_type', 'unknown') for a in analyses if a.get('success')]
-        most_common_floor_type = max(set(floor_types), key=floor_types.count) if floor_types else 'unknown'
+        for i, image_file in enumerate(images):
+            cache_key, cached = None, None
+            if self.client:
+                try:
+                    with self.memory_budget.reserve(os.path.getsize(image_file['path'])):
+                        cache_key, cached = self._lookup_cache(
+                            image_file['path'], self._read_image(image_file['path']), context, batch=True)
+                except OSError as e:
+                    logger.error(f"Error reading image {image_file['name']}: {e}")
+            if cached is not None:
+                cached['image_name'] = image_file['name']
+                individual_analyses[i] = cached
+            else:
+                pending.append((i, image_file, cache_key))
         
-        # Определяем общее состояние (худшее из всех)
-        conditions = [a.get('condition', 'unknown') for a in analyses if a.get('success')]
-        condition_priority = {'excellent': 4, 'good': 3, 'fair': 2, 'poor': 1, 'unknown': 0}
-        worst_condition = min(conditions, key=lambda x: condition_priority.get(x, 0)) if conditions else 'unknown'
+        progress = AnalysisAccumulator(context)
+        self._report_progress(on_progress, progress, [a for a in individual_analyses if a is not None], len(images))
         
-        # Собираем все повреждения
-        all_damages = []
-        for analysis in analyses:
-            if analysis.get('success') and analysis.get('damages'):
-                all_damages.extend(analysis['damages'])
+        chunks = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        workers = min(concurrency or self.concurrency, len(chunks))
         
-        # Суммируем площадь (берем максимальную оценку)
-        areas = [a.get('area_estimate', 0) for a in analyses if a.get('success')]
-        total_area = max(areas) if areas else 20
+        def analyze(indexed_chunk):
+            n, chunk = indexed_chunk
+            logger.info(f"Analyzing batch {n+1}/{len(chunks)} ({len(chunk)} images)")
+            return self._analyze_batch([image_file for _, image_file, _ in chunk], context)
         
-        # Собираем все рекомендации
-        all_recommendations = []
-        for analysis in analyses:
-            if analysis.get('success') and analysis.get('recommendations'):
-                all_recommendations.extend(analysis['recommendations'])
+        batch_results = [None] * len(chunks)
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='floor-analysis') as executor:
+                futures = {executor.submit(analyze, item): item[0] for item in enumerate(chunks)}
+                for future in as_completed(futures):
+                    batch_results[futures[future]] = future.result()
+                    self._report_progress(on_progress, progress, future.result()[0], len(images))
+        else:
+            for item in enumerate(chunks):
+                batch_results[item[0]] = analyze(item)
+                self._report_progress(on_progress, progress, batch_results[item[0]][0], len(images))
         
-        # Убираем дубликаты рекомендаций
-        unique_recommendations = list(set(all_recommendations))
+        combined, to_cache = self._merge_batches(images, individual_analyses, pending, chunks, batch_results, context)
+        for cache_key, analysis in to_cache:
+            self.cache.set(cache_key, analysis)
+        return combined
+    
+    def _analyze_batch(self, images: List[Dict], context: str) -> Tuple[List[Dict], Optional[Dict], Optional[Dict]]:
+        """
+        Анализирует группу изображений одним запросом
         
-        # Определяем общую сложность работ
-        complexities = [a.get('work_complexity', 'medium') for a in analyses if a.get('success')]
-        complexity_priority = {'low': 1, 'medium': 2, 'high': 3}
-        max_complexity = max(complexities, key=lambda x: complexity_priority.get(x, 2)) if complexities else 'medium'
+        Returns:
+            (анализы по каждому изображению в исходном порядке, общая оценка или None,
+             usage запроса или None)
+        """
+        if not self.client:
+            return self._failed_batch(images, 'Anthropic API key not configured')
         
-        return {
-            'success': True,
-            'floor_type': most_common_floor_type,
-            'condition': worst_condition,
-            'total_area_estimate': total_area,
-            'damages': all_damages,
-            'recommendations': unique_recommendations,
-            'work_complexity': max_complexity,
-            'images_analyzed': len(analyses),
-            'individual_analyses': analyses,
-            'context': context
-        }
-
+        try:
+            with self.memory_budget.reserve(self._batch_payload_estimate(images)) as reservation:
+                content, image_blocks, upload_stats = self._prepare_batch_content(images, context)
+                reservation.shrink(self._payload_size(image_blocks))
+                response = self._create_message(**self._batch_request(content, len(images)))
+            
+            return self._batch_result(response, images, upload_stats)
+            
+        except Exception as e:
+            logger.error(f"Error analyzing image batch: {e}")
+            return self._failed_batch(images, str(e))
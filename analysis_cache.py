@@ -0,0 +1,211 @@
+import copy
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from config import (
+    ANALYSIS_CACHE_DIR, ANALYSIS_CACHE_MEMORY_ENTRIES,
+    ANALYSIS_CACHE_DISK_MB, ANALYSIS_CACHE_TTL
+)
+
+logger = logging.getLogger(__name__)
+
+class AnalysisCache:
+    """
+    Кэш результатов анализа изображений.
+
+    Ключ - хэш содержимого изображения, нормализованного контекста и версии
+    промпта/модели. Два уровня: LRU в памяти и JSON-файлы на диске,
+    которые переживают перезапуск. Записи удаляются по TTL, а диск
+    ограничен по суммарному размеру.
+    """
+
+    # Проверяем размер дискового кэша не чаще, чем раз в N записей
+    PRUNE_EVERY = 50
+
+    def __init__(self, cache_dir: Optional[str] = ANALYSIS_CACHE_DIR,
+                 max_memory_entries: int = ANALYSIS_CACHE_MEMORY_ENTRIES,
+                 max_disk_bytes: int = ANALYSIS_CACHE_DISK_MB * 1024 * 1024,
+                 ttl_seconds: float = ANALYSIS_CACHE_TTL):
+        self.cache_dir = cache_dir
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.cache_dir:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+            except OSError as e:
+                logger.warning(f"Analysis disk cache disabled: {e}")
+                self.cache_dir = None
+
+    @staticmethod
+    def make_key(image_bytes: bytes, context: str, version: str) -> str:
+        """Строит ключ из содержимого изображения, контекста и версии промпта/модели"""
+        normalized_context = re.sub(r'\s+', ' ', context or '').strip()
+        digest = hashlib.sha256()
+        for part in (
+            hashlib.sha256(image_bytes).digest(),
+            hashlib.sha256(normalized_context.encode('utf-8')).digest(),
+            version.encode('utf-8')
+        ):
+            digest.update(part)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Возвращает копию закэшированного анализа или None"""
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if now - stored_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return copy.deepcopy(value)
+                del self._memory[key]
+                self.evictions += 1
+
+        entry = self._read_disk(key, now)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, entry['stored_at'], entry['value'])
+        return copy.deepcopy(entry['value'])
+
+    def set(self, key: str, value: Dict):
+        """Сохраняет анализ в оба уровня кэша"""
+        stored_at = time.time()
+        value = copy.deepcopy(value)
+
+        with self._lock:
+            self._remember(key, stored_at, value)
+            self._writes_since_prune += 1
+            should_prune = self._writes_since_prune >= self.PRUNE_EVERY
+            if should_prune:
+                self._writes_since_prune = 0
+
+        self._write_disk(key, stored_at, value)
+        if should_prune:
+            self._prune_disk()
+
+    def _remember(self, key: str, stored_at: float, value: Dict):
+        """Кладет запись в LRU (вызывается под блокировкой)"""
+        self._memory[key] = (stored_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _read_disk(self, key: str, now: float) -> Optional[Dict]:
+        if not self.cache_dir:
+            return None
+
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Corrupted analysis cache entry {key}: {e}")
+            self._remove_file(path)
+            return None
+
+        if now - entry.get('stored_at', 0) > self.ttl_seconds:
+            self._remove_file(path)
+            with self._lock:
+                self.evictions += 1
+            return None
+
+        return entry
+
+    def _write_disk(self, key: str, stored_at: float, value: Dict):
+        if not self.cache_dir:
+            return
+
+        path = self._disk_path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'stored_at': stored_at, 'value': value}, f, ensure_ascii=False)
+            # Атомарная замена, чтобы параллельные читатели не увидели половину файла
+            os.replace(temp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Failed to write analysis cache entry: {e}")
+            self._remove_file(temp_path)
+
+    def _prune_disk(self):
+        """Удаляет просроченные записи и самые старые, если превышен лимит размера"""
+        now = time.time()
+        entries = []
+        total_size = 0
+
+        for root, dirs, files in os.walk(self.cache_dir):
+            for file in files:
+                path = os.path.join(root, file)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if now - stat.st_mtime > self.ttl_seconds:
+                    self._remove_file(path)
+                    with self._lock:
+                        self.evictions += 1
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total_size += stat.st_size
+
+        if total_size <= self.max_disk_bytes:
+            return
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if total_size <= self.max_disk_bytes:
+                break
+            self._remove_file(path)
+            total_size -= size
+            with self._lock:
+                self.evictions += 1
+
+    def _remove_file(self, path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self) -> Dict:
+        """Возвращает счетчики попаданий и промахов"""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            hits = self.memory_hits + self.disk_hits
+            return {
+                'memory_entries': len(self._memory),
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Telegram бот для автоматизации оценки полов - asyncio версия
+Webhook на aiohttp, AsyncTeleBot и AsyncAnthropic в одном цикле событий
+
+Запуск: python -c "from app_async import main; main()"
+"""
+
+import os
+import asyncio
+import logging
+
+from aiohttp import web
+from telebot import asyncio_helper, types
+from telebot.async_telebot import AsyncTeleBot
+
+from async_bot_handlers import AsyncBotHandlers
+from metrics import REGISTRY, PROMETHEUS_CONTENT_TYPE
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Конфигурация
+BOT_TOKEN = os.getenv('BOT_TOKEN')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+PORT = int(os.getenv('PORT', 5000))
+# Сколько обновлений обрабатывается одновременно; остальные ждут без потоков
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', 500))
+# Сколько принятых, но не обработанных обновлений допускается; сверх - 503
+MAX_PENDING_UPDATES = int(os.getenv('MAX_PENDING_UPDATES', 1000))
+
+class UpdateRunner:
+    """Запускает обработку обновлений фоновыми задачами с ограничением параллелизма"""
+
+    def __init__(self, bot: AsyncTeleBot, max_concurrent: int, max_pending: int = MAX_PENDING_UPDATES):
+        self.bot = bot
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_pending = max(1, max_pending)
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self._tasks = set()
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def submit(self, update: types.Update) -> bool:
+        """
+        Запускает обработку обновления фоновой задачей
+
+        Returns:
+            False если принятых обновлений уже max_pending
+        """
+        if len(self._tasks) >= self.max_pending:
+            self.rejected += 1
+            logger.warning("Too many pending updates, rejecting update")
+            return False
+        task = asyncio.create_task(self._process(update))
+        # Держим ссылку, иначе задачу может собрать сборщик мусора
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _process(self, update: types.Update):
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                await self.bot.process_new_updates([update])
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error processing update: {e}")
+            finally:
+                self.in_flight -= 1
+
+    async def stop(self, timeout: float = 30.0):
+        """Дожидается текущих задач при остановке"""
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=timeout)
+
+    def stats(self):
+        return {
+            'max_concurrent': self.max_concurrent,
+            'max_pending': self.max_pending,
+            'pending': len(self._tasks),
+            'in_flight': self.in_flight,
+            'processed': self.processed,
+            'failed': self.failed,
+            'rejected': self.rejected
+        }
+
+# Бот, обработчики и очередь обновлений создаются в create_app()
+bot = None
+bot_handlers = None
+runner = None
+
+async def index(request: web.Request) -> web.Response:
+    """Главная страница для проверки работы"""
+    return web.json_response({
+        'status': 'running',
+        'bot': 'Vanya Floor Analyzer Bot',
+        'version': '1.0',
+        'runtime': 'asyncio',
+        'handlers': 'initialized' if bot_handlers else 'failed',
+        'updates': runner.stats()
+    })
+
+async def webhook(request: web.Request) -> web.Response:
+    """Обработчик webhook от Telegram"""
+    try:
+        if request.content_type == 'application/json':
+            json_string = await request.text()
+            update = types.Update.de_json(json_string)
+            # Отвечаем сразу, анализ идет в фоновой задаче
+            if not runner.submit(update):
+                # Telegram повторит доставку позже
+                return web.json_response({'error': 'Too many pending updates'}, status=503)
+            return web.json_response({'status': 'ok'})
+        else:
+            logger.warning('Invalid content type for webhook')
+            return web.json_response({'error': 'Invalid content type'}, status=400)
+    except Exception as e:
+        logger.error(f"Error processing webhook: {e}")
+        return web.json_response({'error': str(e)}, status=500)
+
+async def metrics(request: web.Request) -> web.Response:
+    """Метрики в текстовом формате Prometheus"""
+    return web.Response(body=REGISTRY.render().encode('utf-8'),
+                        headers={'Content-Type': PROMETHEUS_CONTENT_TYPE})
+
+async def health(request: web.Request) -> web.Response:
+    """Проверка здоровья приложения"""
+    try:
+        # Проверяем доступность Telegram API
+        me = await bot.get_me()
+
+        return web.json_response({
+            'status': 'healthy',
+            'bot_info': {
+                'id': me.id,
+                'username': me.username,
+                'first_name': me.first_name
+            },
+            'handlers': 'ok' if bot_handlers else 'error',
+            'updates': runner.stats()
+        })
+    except Exception as e:
+        logger.error(f"Health check failed: {e}")
+        return web.json_response({
+            'status': 'unhealthy',
+            'error': str(e)
+        }, status=500)
+
+async def setup_webhook(app: web.Application):
+    """Настройка webhook при запуске"""
+    if WEBHOOK_URL:
+        try:
+            # Удаляем старый webhook
+            await bot.remove_webhook()
+
+            # Устанавливаем новый webhook
+            result = await bot.set_webhook(url=f"{WEBHOOK_URL}/webhook")
+            if result:
+                logger.info(f"Webhook set successfully: {WEBHOOK_URL}/webhook")
+            else:
+                logger.error("Failed to set webhook")
+        except Exception as e:
+            logger.error(f"Error setting up webhook: {e}")
+    else:
+        logger.warning("No WEBHOOK_URL provided, webhook not set")
+
+async def shutdown(app: web.Application):
+    """Дожидается обработки обновлений и закрывает соединения"""
+    await runner.stop()
+    if bot_handlers:
+        await bot_handlers.close()
+    if asyncio_helper.session_manager.session is not None:
+        await bot.close_session()
+
+def create_app() -> web.Application:
+    """Создает бота, обработчики и aiohttp приложение"""
+    global bot, bot_handlers, runner
+
+    if not BOT_TOKEN:
+        raise RuntimeError("BOT_TOKEN environment variable is not set")
+    bot = AsyncTeleBot(BOT_TOKEN)
+
+    # Инициализация обработчиков
+    try:
+        bot_handlers = AsyncBotHandlers(bot)
+        logger.info("Bot handlers initialized successfully")
+    except Exception as e:
+        logger.error(f"Failed to initialize bot handlers: {e}")
+        bot_handlers = None
+
+    runner = UpdateRunner(bot, MAX_CONCURRENT_UPDATES, MAX_PENDING_UPDATES)
+
+    # Метрики обработки обновлений
+    REGISTRY.gauge('vanya_async_updates_pending', 'Updates accepted but not finished').set_function(
+        lambda: runner.stats()['pending'])
+    REGISTRY.gauge('vanya_async_updates_in_flight', 'Updates being processed').set_function(
+        lambda: runner.stats()['in_flight'])
+
+    app = web.Application()
+    app.router.add_get('/', index)
+    app.router.add_post('/webhook', webhook)
+    app.router.add_get('/metrics', metrics)
+    app.router.add_get('/health', health)
+    app.on_startup.append(setup_webhook)
+    app.on_cleanup.append(shutdown)
+    return app
+
+def main():
+    logger.info("Starting Vanya Floor Bot (asyncio)...")
+    web.run_app(create_app(), host='0.0.0.0', port=PORT)
+
+if __name__ == '__main__':
+    main()
@@ -2,13 +2,17 @@
 """
 Telegram бот для автоматизации оценки полов - версия для Heroku
 Поддерживает webhook для постоянной работы
+
+Запуск: python -c "from app_heroku import main; main()" (см. Procfile).
 """
 
 import os
 import logging
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import telebot
 from bot_handlers import BotHandlers
+from job_queue import UpdateDispatcher
+from metrics import REGISTRY, PROMETHEUS_CONTENT_TYPE
 
 # Настройка логирования
 logging.basicConfig(
@@ -21,20 +25,47 @@ logger = logging.getLogger(__name__)
 BOT_TOKEN = os.getenv('BOT_TOKEN', '8346136918:AAHwREKIctQJSuWWBySju7naWT_FiDdJBwo')
 WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
 PORT = int(os.getenv('PORT', 5000))
+WORKER_COUNT = int(os.getenv('WORKER_COUNT', 4))
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', 1000))
 
-# Создание Flask приложения
+# Создание Flask приложения; бот и очередь создаются в create_app()
 app = Flask(__name__)
 
-# Создание бота
-bot = telebot.TeleBot(BOT_TOKEN)
+bot = None
+bot_handlers = None
+dispatcher = None
+
+def create_app() -> Flask:
+    """Создает бота, обработчики и очередь обновлений и запускает ее потоки"""
+    global bot, bot_handlers, dispatcher
+
+    # Создание бота (обновления обрабатывает наш диспетчер, а не встроенный пул telebot)
+    bot = telebot.TeleBot(BOT_TOKEN, threaded=False)
+
+    # Инициализация обработчиков
+    try:
+        bot_handlers = BotHandlers(bot)
+        logger.info("Bot handlers initialized successfully")
+    except Exception as e:
+        logger.error(f"Failed to initialize bot handlers: {e}")
+        bot_handlers = None
+
+    # Очередь обновлений: webhook отвечает сразу, анализ выполняется в фоне
+    dispatcher = UpdateDispatcher(
+        lambda update: bot.process_new_updates([update]),
+        workers=WORKER_COUNT,
+        max_queue_size=UPDATE_QUEUE_SIZE
+    )
+    dispatcher.start()
 
-# Инициализация обработчиков
-try:
-    bot_handlers = BotHandlers(bot)
-    logger.info("Bot handlers initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize bot handlers: {e}")
-    bot_handlers = None
+    # Метрики очереди обновлений
+    REGISTRY.gauge('vanya_update_queue_depth', 'Updates waiting in the queue').set_function(
+        lambda: dispatcher.stats()['queue_depth'])
+    REGISTRY.gauge('vanya_update_queue_in_flight', 'Updates being processed').set_function(
+        lambda: dispatcher.stats()['in_flight'])
+    REGISTRY.gauge('vanya_update_queue_max_wait_seconds', 'Longest time an update waited in the queue').set_function(
+        lambda: dispatcher.stats()['max_wait_seconds'])
+    return app
 
 @app.route('/')
 def index():
@@ -43,7 +74,8 @@ def index():
         'status': 'running',
         'bot': 'Vanya Floor Analyzer Bot',
         'version': '1.0',
-        'handlers': 'initialized' if bot_handlers else 'failed'
+        'handlers': 'initialized' if bot_handlers else 'failed',
+        'queue': dispatcher.stats()
     })
 
 @app.route('/webhook', methods=['POST'])
@@ -53,7 +85,9 @@ def webhook():
         if request.headers.get('content-type') == 'application/json':
             json_string = request.get_data().decode('utf-8')
             update = telebot.types.Update.de_json(json_string)
-            bot.process_new_updates([update])
+            if not dispatcher.submit(update):
+                # Telegram повторит доставку позже
+                return jsonify({'error': 'Update queue is full'}), 503
             return jsonify({'status': 'ok'})
         else:
             logger.warning('Invalid content type for webhook')
@@ -62,6 +96,16 @@ def webhook():
         logger.error(f"Error processing webhook: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/queue_stats')
+def queue_stats():
+    """Состояние очереди обновлений"""
+    return jsonify(dispatcher.stats())
+
+@app.route('/metrics')
+def metrics():
+    """Метрики в текстовом формате Prometheus"""
+    return Response(REGISTRY.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
 @app.route('/set_webhook')
 def set_webhook():
     """Установка webhook (для отладки)"""
@@ -111,7 +155,8 @@ def health():
                 'username': me.username,
                 'first_name': me.first_name
             },
-            'handlers': 'ok' if bot_handlers else 'error'
+            'handlers': 'ok' if bot_handlers else 'error',
+            'queue': dispatcher.stats()
         })
     except Exception as e:
         logger.error(f"Health check failed: {e}")
@@ -138,8 +183,9 @@ def setup_webhook():
     else:
         logger.warning("No WEBHOOK_URL provided, webhook not set")
 
-if __name__ == '__main__':
+def main():
     logger.info("Starting Vanya Floor Bot for Heroku...")
+    create_app()
     
     # Настройка webhook
     setup_webhook()
@@ -151,3 +197,5 @@ if __name__ == '__main__':
         debug=False
     )
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+import os
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import anthropic
+
+from ai_analyzer import BaseFloorAnalyzer, AnalysisAccumulator, ProgressCallback, RATE_LIMIT_STATUS_CODES
+from rate_limiter import AsyncRateLimitSemaphore
+from memory_budget import AsyncMemoryBudget, payload_estimate
+
+logger = logging.getLogger(__name__)
+
+class AsyncFloorAnalyzer(BaseFloorAnalyzer):
+    """
+    Анализ изображений через AsyncAnthropic для asyncio-режима бота.
+
+    Запросы к API не занимают потоки: ожидание ответа - это просто
+    приостановленная корутина. Чтение файлов, кэш и подготовка изображений
+    выполняются в пуле потоков, чтобы не блокировать цикл событий.
+    """
+
+    client_class = anthropic.AsyncAnthropic
+    rate_limiter_class = AsyncRateLimitSemaphore
+    memory_budget_class = AsyncMemoryBudget
+
+    async def analyze_floor_image(self, image_path: str, context: str = "") -> Dict:
+        """
+        Анализирует изображение пола с учетом контекста разговора
+
+        Args:
+            image_path: Путь к изображению
+            context: Контекст разговора с клиентом
+
+        Returns:
+            Dict с результатами анализа
+        """
+        if not self.client:
+            return self._no_client_result()
+
+        try:
+            # Память на фото занимается до чтения файла и освобождается после ответа
+            file_size = await asyncio.to_thread(os.path.getsize, image_path)
+            async with self.memory_budget.reserve(payload_estimate(file_size)) as reservation:
+                image_bytes = await asyncio.to_thread(self._read_image, image_path)
+
+                # Проверяем кэш: те же фото часто присылают повторно
+                cache_key, cached = await asyncio.to_thread(self._lookup_cache, image_path, image_bytes, context)
+                if cached is not None:
+                    return cached
+
+                # Уменьшаем изображение и конвертируем в base64
+                image_block, prepared = await asyncio.to_thread(self._prepare_image_block, image_path, image_bytes)
+                del image_bytes
+                reservation.shrink(self._payload_size([image_block]))
+
+                # Отправляем запрос к Claude
+                response = await self._create_message(**self._single_image_request(image_block, context))
+
+            # Парсим ответ
+            analysis_text = response.content[0].text
+            analysis = self._parse_analysis_response(analysis_text)
+
+            if cache_key and analysis.get('success'):
+                await asyncio.to_thread(self.cache.set, cache_key, analysis)
+
+            analysis['upload_stats'] = self._upload_stats(prepared)
+            analysis['usage'] = self._get_usage(response)
+
+            return analysis
+
+        except Exception as e:
+            logger.error(f"Error analyzing floor image: {e}")
+            return self._error_result(str(e))
+
+    async def _create_message(self, **kwargs):
+        """Отправляет запрос к Claude с учетом лимита одновременных запросов и повторами при 429/529"""
+        create = self._message_create()
+
+        attempt = 0
+        while True:
+            async with self.rate_limiter:
+                try:
+                    response = await create(**kwargs)
+                    self.rate_limiter.report_success()
+                    return response
+                except anthropic.APIStatusError as e:
+                    if e.status_code not in RATE_LIMIT_STATUS_CODES or attempt >= self.max_retries:
+                        raise
+                    retry_after = self._get_retry_after(e)
+
+            # Пауза включается вне семафора, чтобы не держать слот
+            attempt += 1
+            self.rate_limiter.report_rate_limit(retry_after)
+
+    async def analyze_multiple_images(self, image_files: List[Dict], context: str = "",
+                                      concurrency: Optional[int] = None, batch_size: Optional[int] = None,
+                                      on_progress: Optional[ProgressCallback] = None) -> Dict:
+        """
+        Анализирует несколько изображений и объединяет результаты
+
+        Args:
+            image_files: Список файлов изображений
+            context: Контекст разговора
+            concurrency: Не используется - общий лимит задает rate_limiter
+            batch_size: Изображений в одном запросе (по умолчанию self.batch_size, 1 - по одному)
+            on_progress: Вызывается после каждого готового изображения (или пакета)
+                с предварительным объединенным анализом (может быть корутиной)
+
+        Returns:
+            Объединенный анализ всех изображений
+        """
+        images = [f for f in image_files if f['type'] == 'image']
+        batch_size = batch_size or self.batch_size
+
+        if batch_size > 1 and len(images) > 1:
+            return await self._analyze_in_batches(images, context, batch_size, on_progress)
+
+        progress = AnalysisAccumulator(context)
+
+        async def analyze(i: int, image_file: Dict) -> Dict:
+            logger.info(f"Analyzing image {i+1}/{len(images)}: {image_file['name']}")
+            analysis = await self.analyze_floor_image(image_file['path'], context)
+            analysis['image_name'] = image_file['name']
+            await self._report_progress(on_progress, progress, [analysis], len(images))
+            return analysis
+
+        # gather сохраняет исходный порядок изображений
+        individual_analyses = await asyncio.gather(
+            *(analyze(i, image_file) for i, image_file in enumerate(images))
+        )
+
+        # Объединяем результаты
+        return self._combine_analyses(list(individual_analyses), context)
+
+    async def _report_progress(self, on_progress: Optional[ProgressCallback], progress: AnalysisAccumulator,
+                               analyses: List[Dict], total: int):
+        """Добавляет готовые анализы в предварительную сводку и сообщает о прогрессе"""
+        if on_progress is None or not analyses:
+            return
+        for analysis in analyses:
+            progress.add(analysis)
+        try:
+            result = on_progress(len(progress.analyses), total, progress.result())
+            if asyncio.iscoroutine(result):
+                await result
+        except Exception as e:
+            # Ошибка отображения прогресса не должна прерывать анализ
+            logger.warning(f"Progress callback failed: {e}")
+
+    async def _analyze_in_batches(self, images: List[Dict], context: str, batch_size: int,
+                                  on_progress: Optional[ProgressCallback] = None) -> Dict:
+        """
+        Отправляет изображения группами по batch_size в одном запросе с общим
+        контекстом. Уже закэшированные изображения в запросы не попадают.
+        """
+        individual_analyses = [None] * len(images)
+        pending = []  # (индекс, файл, ключ кэша)
+
+        for i, image_file in enumerate(images):
+            cache_key, cached = None, None
+            if self.client:
+                try:
+                    file_size = await asyncio.to_thread(os.path.getsize, image_file['path'])
+                    async with self.memory_budget.reserve(file_size):
+                        image_bytes = await asyncio.to_thread(self._read_image, image_file['path'])
+                        cache_key, cached = await asyncio.to_thread(
+                            self._lookup_cache, image_file['path'], image_bytes, context, True)
+                except OSError as e:
+                    logger.error(f"Error reading image {image_file['name']}: {e}")
+            if cached is not None:
+                cached['image_name'] = image_file['name']
+                individual_analyses[i] = cached
+            else:
+                pending.append((i, image_file, cache_key))
+
+        progress = AnalysisAccumulator(context)
+        await self._report_progress(on_progress, progress, [a for a in individual_analyses if a is not None],
+                                    len(images))
+
+        chunks = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+
+        async def analyze(n: int, chunk: List[Tuple]) -> Tuple:
+            logger.info(f"Analyzing batch {n+1}/{len(chunks)} ({len(chunk)} images)")
+            result = await self._analyze_batch([image_file for _, image_file, _ in chunk], context)
+            await self._report_progress(on_progress, progress, result[0], len(images))
+            return result
+
+        batch_results = await asyncio.gather(*(analyze(n, chunk) for n, chunk in enumerate(chunks)))
+
+        combined, to_cache = self._merge_batches(images, individual_analyses, pending, chunks,
+                                                 list(batch_results), context)
+        for cache_key, analysis in to_cache:
+            await asyncio.to_thread(self.cache.set, cache_key, analysis)
+        return combined
+
+    async def _analyze_batch(self, images: List[Dict], context: str) -> Tuple[List[Dict], Optional[Dict], Optional[Dict]]:
+        """
+        Анализирует группу изображений одним запросом
+
+        Returns:
+            (анализы по каждому изображению в исходном порядке, общая оценка или None,
+             usage запроса или None)
+        """
+        if not self.client:
+            return self._failed_batch(images, 'Anthropic API key not configured')
+
+        try:
+            estimate = await asyncio.to_thread(self._batch_payload_estimate, images)
+            async with self.memory_budget.reserve(estimate) as reservation:
+                content, image_blocks, upload_stats = await asyncio.to_thread(
+                    self._prepare_batch_content, images, context)
+                reservation.shrink(self._payload_size(image_blocks))
+                response = await self._create_message(**self._batch_request(content, len(images)))
+
+            return self._batch_result(response, images, upload_stats)
+
+        except Exception as e:
+            logger.error(f"Error analyzing image batch: {e}")
+            return self._failed_batch(images, str(e))
@@ -0,0 +1,46 @@
+import asyncio
+import inspect
+import logging
+from typing import Callable, Generator
+
+from async_analyzer import AsyncFloorAnalyzer
+from telegram_downloader import AsyncTelegramDownloader
+from progress_reporter import AsyncProgressReporter
+from bot_handlers import BaseBotHandlers
+
+logger = logging.getLogger(__name__)
+
+class AsyncBotHandlers(BaseBotHandlers):
+    """
+    Обработчики бота для asyncio-режима.
+
+    Сценарии те же, что у BotHandlers, но сетевые вызовы (Telegram, Anthropic)
+    не блокируют потоки. Разбор архива и работа с хранилищем выполняются
+    в пуле потоков.
+    """
+
+    analyzer_class = AsyncFloorAnalyzer
+    downloader_class = AsyncTelegramDownloader
+    progress_reporter_class = AsyncProgressReporter
+
+    async def _run(self, flow: Generator):
+        # Ошибку шага возвращаем в сценарий, чтобы сработали его try/finally
+        result, error = None, None
+        while True:
+            try:
+                step = flow.throw(error) if error is not None else flow.send(result)
+            except StopIteration as stop:
+                return stop.value
+            result, error = None, None
+            try:
+                result = await step if inspect.isawaitable(step) else step
+            except BaseException as e:
+                error = e
+
+    def _blocking(self, fn: Callable, *args):
+        return asyncio.to_thread(fn, *args)
+
+    async def close(self):
+        """Закрывает пул соединений загрузчика и пул процессов изображений"""
+        await self.downloader.close()
+        self.report_generator.quote_exporter.shutdown()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк классификации сообщений чата
+
+Сравнивает MessageClassifier.classify_many (пачками, как в WhatsAppParser)
+с прежними отдельными проверками каждого сообщения: `any(keyword in message)`
+по каждому списку признаков и поиск телефона регулярным выражением. Заодно
+проверяет, что оба способа дают одинаковые признаки.
+
+Примеры:
+    python -m benchmarks.classify_messages
+    python -m benchmarks.classify_messages --messages 10000,1000000 --repeat 5
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+from typing import List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.synthetic_export import generate_chat
+from config import MEDIA_INDICATORS, SYSTEM_INDICATORS, FLOOR_KEYWORDS, ADDRESS_KEYWORDS, PHONE_PATTERN
+from message_classifier import MessageClassifier, MEDIA, SYSTEM, FLOOR, ADDRESS, PHONE
+from whatsapp_parser import WhatsAppParser, CLASSIFY_CHUNK_SIZE
+
+def classify_separately(text: str) -> int:
+    """Прежний способ: отдельный просмотр текста на каждое ключевое слово"""
+    flags = 0
+    if any(indicator in text for indicator in MEDIA_INDICATORS):
+        flags |= MEDIA
+    if any(indicator in text for indicator in SYSTEM_INDICATORS):
+        flags |= SYSTEM
+    text_lower = text.lower()
+    if any(keyword in text_lower for keyword in FLOOR_KEYWORDS):
+        flags |= FLOOR
+    if any(word in text_lower for word in ADDRESS_KEYWORDS):
+        flags |= ADDRESS
+    if re.search(PHONE_PATTERN, text):
+        flags |= PHONE
+    return flags
+
+def _best_time(function, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def _classify_in_chunks(classifier: MessageClassifier, texts: List[str]) -> List[int]:
+    flags = []
+    for start in range(0, len(texts), CLASSIFY_CHUNK_SIZE):
+        flags.extend(classifier.classify_many(texts[start:start + CLASSIFY_CHUNK_SIZE]))
+    return flags
+
+def _parse_int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(',') if item]
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Benchmark one-pass message classification')
+    parser.add_argument('--messages', type=_parse_int_list, default=[10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per method, the best time is reported')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    classifier = MessageClassifier()
+    print(f"{'messages':>10} {'separate, s':>12} {'batched, s':>12} {'speedup':>8} {'mismatches':>11}")
+
+    for message_count in args.messages:
+        chat = generate_chat(message_count, message_count // 20, 'bracketed', seed=args.seed)
+        texts = [msg['message'] for msg in WhatsAppParser(classifier=classifier).iter_chat_messages(chat.splitlines())]
+
+        separate_flags = [classify_separately(text) for text in texts]
+        mismatches = sum(1 for a, b in zip(_classify_in_chunks(classifier, texts), separate_flags) if a != b)
+        separate = _best_time(lambda: [classify_separately(text) for text in texts], args.repeat)
+        one_pass = _best_time(lambda: _classify_in_chunks(classifier, texts), args.repeat)
+
+        print(f"{len(texts):>10} {separate:>12.3f} {one_pass:>12.3f} {separate / one_pass:>7.1f}x {mismatches:>11}")
+
+if __name__ == '__main__':
+    main()
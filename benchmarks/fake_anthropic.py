@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+"""
+Локальная замена Anthropic Messages API для нагрузочных тестов
+
+Отвечает корректным JSON анализа пола по схеме FloorAnalyzer, с настраиваемой
+задержкой, долей ответов 429/529 и долей испорченного JSON. Ответы для одного
+и того же изображения одинаковы, а блоки с cache_control учитываются как
+запись/чтение кэша промпта, поэтому можно измерять параллелизм, повторы и кэш.
+
+Два варианта использования:
+
+В процессе - подменить клиент анализатора:
+    analyzer.client = FakeAnthropicClient(FakeBackend(latency='lognormal:0.8,0.4', rate_limit_rate=0.05))
+
+HTTP сервер - для настоящего anthropic.Anthropic:
+    python -m benchmarks.fake_anthropic --port 8099 --latency uniform:0.5,2 --overloaded-rate 0.02
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8099 python app_heroku.py
+"""
+
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import anthropic
+import httpx
+
+FLOOR_TYPES = ['parquet', 'laminate', 'tiles', 'linoleum', 'carpet', 'concrete']
+CONDITIONS = ['excellent', 'good', 'fair', 'poor']
+SEVERITIES = ['minor', 'moderate', 'severe']
+ROOM_TYPES = ['living_room', 'bedroom', 'kitchen', 'bathroom', 'hallway', 'balcony']
+COMPLEXITIES = ['low', 'medium', 'high']
+
+# Примерная стоимость изображения в токенах (~1.15 Мпикс / 750)
+IMAGE_TOKENS = 1600
+
+# Время жизни кэша промпта в API
+PROMPT_CACHE_TTL = 300.0
+
+ERROR_TYPES = {
+    429: 'rate_limit_error',
+    529: 'overloaded_error'
+}
+
+def parse_latency(spec: Union[str, float, None]) -> Callable[[random.Random], float]:
+    """
+    Распределение задержки ответа в секундах:
+        "0.5" или "fixed:0.5"
+        "uniform:MIN,MAX"
+        "normal:MEAN,STDDEV"
+        "lognormal:MEDIAN,SIGMA"
+    """
+    if spec is None or spec == '':
+        return lambda rng: 0.0
+    if isinstance(spec, (int, float)):
+        return lambda rng: float(spec)
+
+    kind, _, params = spec.partition(':')
+    if not params:
+        kind, params = 'fixed', kind
+    values = [float(value) for value in params.split(',')]
+
+    if kind == 'fixed' and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == 'uniform' and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == 'normal' and len(values) == 2:
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == 'lognormal' and len(values) == 2:
+        # Медиана lognormal равна exp(mu)
+        mu = math.log(values[0]) if values[0] > 0 else 0.0
+        return lambda rng: rng.lognormvariate(mu, values[1])
+    raise ValueError(f"Invalid latency spec: {spec}")
+
+@dataclass
+class FakeReply:
+    status: int
+    headers: Dict[str, str]
+    body: Dict
+    delay: float
+
+class FakeBackend:
+    """Формирует ответы и ведет статистику; общий для клиента в процессе и HTTP сервера"""
+
+    def __init__(self, latency: Union[str, float, None] = None, rate_limit_rate: float = 0.0,
+                 overloaded_rate: float = 0.0, malformed_rate: float = 0.0,
+                 retry_after: Optional[float] = 1.0, error_latency: float = 0.05, seed: int = 0):
+        self.latency = parse_latency(latency)
+        self.rate_limit_rate = rate_limit_rate
+        self.overloaded_rate = overloaded_rate
+        self.malformed_rate = malformed_rate
+        self.retry_after = retry_after
+        self.error_latency = error_latency
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._prompt_cache = {}  # хэш префикса -> время истечения
+        self._in_flight = 0
+        self._stats = {
+            'requests': 0,
+            'succeeded': 0,
+            'rate_limited': 0,
+            'overloaded': 0,
+            'malformed': 0,
+            'wrapped': 0,
+            'images': 0,
+            'max_in_flight': 0,
+            'input_tokens': 0,
+            'output_tokens': 0,
+            'cache_creation_input_tokens': 0,
+            'cache_read_input_tokens': 0
+        }
+
+    @contextmanager
+    def track(self):
+        """Учитывает запрос как выполняемый на все время ответа, включая задержку"""
+        with self._lock:
+            self._in_flight += 1
+            self._stats['max_in_flight'] = max(self._stats['max_in_flight'], self._in_flight)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._stats, in_flight=self._in_flight)
+
+    def respond(self, request: Dict) -> FakeReply:
+        """Ответ на тело запроса POST /v1/messages"""
+        with self._lock:
+            self._stats['requests'] += 1
+            roll = self._rng.random()
+            malformed = self._rng.random() < self.malformed_rate
+            delay = self.latency(self._rng)
+
+        if roll < self.rate_limit_rate:
+            return self._error_reply(429, 'rate_limited', 'Number of request tokens has exceeded your rate limit')
+        if roll < self.rate_limit_rate + self.overloaded_rate:
+            return self._error_reply(529, 'overloaded', 'Overloaded')
+
+        blocks = self._flatten_blocks(request)
+        images = [block for block in blocks if block.get('type') == 'image']
+        is_batch = any('"overall"' in block.get('text', '') for block in blocks if block.get('type') == 'text')
+
+        if is_batch:
+            payload = self._batch_payload(images)
+        else:
+            payload = self._analysis(images[0] if images else None)
+
+        text = json.dumps(payload, ensure_ascii=False, indent=2)
+        corruption = None
+        if malformed:
+            text, corruption = self._corrupt(text)
+        usage = self._usage(blocks, text)
+
+        with self._lock:
+            self._stats['succeeded'] += 1
+            self._stats['images'] += len(images)
+            if corruption:
+                self._stats[corruption] += 1
+            for field, value in usage.items():
+                self._stats[field] += value
+
+        body = {
+            'id': 'msg_fake_' + hashlib.sha1(text.encode('utf-8')).hexdigest()[:24],
+            'type': 'message',
+            'role': 'assistant',
+            'model': request.get('model', 'fake'),
+            'content': [{'type': 'text', 'text': text}],
+            'stop_reason': 'end_turn',
+            'stop_sequence': None,
+            'usage': usage
+        }
+        return FakeReply(200, {}, body, delay)
+
+    def _error_reply(self, status: int, counter: str, message: str) -> FakeReply:
+        with self._lock:
+            self._stats[counter] += 1
+        headers = {}
+        if status == 429 and self.retry_after is not None:
+            headers['retry-after'] = str(self.retry_after)
+        body = {'type': 'error', 'error': {'type': ERROR_TYPES[status], 'message': message}}
+        return FakeReply(status, headers, body, self.error_latency)
+
+    def _flatten_blocks(self, request: Dict) -> List[Dict]:
+        """Блоки system и сообщений в порядке, в котором их кэширует API"""
+        blocks = []
+        system = request.get('system')
+        if isinstance(system, str):
+            blocks.append({'type': 'text', 'text': system})
+        elif system:
+            blocks.extend(system)
+        for message in request.get('messages', []):
+            content = message.get('content')
+            if isinstance(content, str):
+                blocks.append({'type': 'text', 'text': content})
+            else:
+                blocks.extend(content or [])
+        return blocks
+
+    def _block_tokens(self, block: Dict) -> int:
+        if block.get('type') == 'image':
+            return IMAGE_TOKENS
+        return max(1, len(block.get('text', '')) // 4)
+
+    def _usage(self, blocks: List[Dict], output_text: str) -> Dict:
+        """Токены запроса с учетом кэша промпта до последнего блока с cache_control"""
+        total = sum(self._block_tokens(block) for block in blocks)
+        cached_until = max((i for i, block in enumerate(blocks) if block.get('cache_control')), default=-1)
+
+        cache_creation = cache_read = 0
+        if cached_until >= 0:
+            prefix = blocks[:cached_until + 1]
+            prefix_tokens = sum(self._block_tokens(block) for block in prefix)
+            key = hashlib.sha256(json.dumps(prefix, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+            now = time.monotonic()
+            with self._lock:
+                if self._prompt_cache.get(key, 0) > now:
+                    cache_read = prefix_tokens
+                else:
+                    cache_creation = prefix_tokens
+                self._prompt_cache[key] = now + PROMPT_CACHE_TTL
+
+        return {
+            'input_tokens': total - cache_creation - cache_read,
+            'output_tokens': max(1, len(output_text) // 4),
+            'cache_creation_input_tokens': cache_creation,
+            'cache_read_input_tokens': cache_read
+        }
+
+    def _analysis(self, image_block: Optional[Dict]) -> Dict:
+        """Анализ по схеме FloorAnalyzer, одинаковый для одинаковых изображений"""
+        data = image_block.get('source', {}).get('data', '') if image_block else ''
+        rng = random.Random(hashlib.sha256(data.encode('ascii', 'ignore')).hexdigest())
+        floor_type = rng.choice(FLOOR_TYPES)
+        condition = rng.choice(CONDITIONS)
+        damages = [
+            {
+                'type': rng.choice(['scratches', 'cracks', 'swelling', 'gaps', 'stains']),
+                'severity': rng.choice(SEVERITIES),
+                'description': 'Синтетическое повреждение'
+            }
+            for _ in range(rng.randint(0, 3))
+        ]
+        return {
+            'floor_type': floor_type,
+            'floor_type_hebrew': floor_type,
+            'condition': condition,
+            'condition_description': f"Синтетическая оценка: {condition}",
+            'damages': damages,
+            'area_estimate': rng.randint(8, 40),
+            'room_type': rng.choice(ROOM_TYPES),
+            'recommendations': ['Шлифовка', 'Покрытие лаком'][:rng.randint(1, 2)],
+            'work_complexity': rng.choice(COMPLEXITIES),
+            'urgency': rng.choice(COMPLEXITIES),
+            'estimated_duration': rng.randint(1, 5),
+            'special_notes': '',
+            'confidence_level': rng.randint(60, 95)
+        }
+
+    def _batch_payload(self, images: List[Dict]) -> Dict:
+        analyses = [dict(self._analysis(image), image_index=index) for index, image in enumerate(images, 1)]
+        floor_types = [analysis['floor_type'] for analysis in analyses] or ['unknown']
+        return {
+            'images': analyses,
+            'overall': {
+                'floor_type': max(set(floor_types), key=floor_types.count),
+                # Худшее состояние из всех изображений
+                'condition': max((a['condition'] for a in analyses), key=CONDITIONS.index, default='unknown'),
+                'total_area_estimate': sum(a['area_estimate'] for a in analyses),
+                'work_complexity': 'medium',
+                'recommendations': ['Общая рекомендация']
+            }
+        }
+
+    def _corrupt(self, text: str) -> Tuple[str, str]:
+        """
+        Типичные поломки ответа модели: обрыв JSON, текст вокруг, одиночные кавычки.
+
+        Returns:
+            (текст ответа, счетчик в статистике). JSON внутри текста парсер
+            извлекает, поэтому такие ответы считаются 'wrapped', а не 'malformed'
+        """
+        with self._lock:
+            kind = self._rng.randrange(3)
+        if kind == 0:
+            return text[:len(text) // 2], 'malformed'
+        if kind == 1:
+            return f"Вот анализ изображения:\n{text}\nНадеюсь, это поможет!", 'wrapped'
+        return text.replace('"', "'"), 'malformed'
+
+class _FakeMessages:
+    def __init__(self, backend: FakeBackend):
+        self.backend = backend
+
+    def _result(self, reply: FakeReply):
+        if reply.status != 200:
+            response = httpx.Response(
+                reply.status, headers=reply.headers, json=reply.body,
+                request=httpx.Request('POST', 'http://fake-anthropic/v1/messages')
+            )
+            error_class = anthropic.RateLimitError if reply.status == 429 else anthropic.InternalServerError
+            raise error_class(reply.body['error']['message'], response=response, body=reply.body)
+
+        body = reply.body
+        return SimpleNamespace(
+            id=body['id'],
+            model=body['model'],
+            role=body['role'],
+            stop_reason=body['stop_reason'],
+            content=[SimpleNamespace(**block) for block in body['content']],
+            usage=SimpleNamespace(**body['usage'])
+        )
+
+    def create(self, **kwargs):
+        with self.backend.track():
+            reply = self.backend.respond(kwargs)
+            if reply.delay:
+                time.sleep(reply.delay)
+        return self._result(reply)
+
+class _AsyncFakeMessages(_FakeMessages):
+    async def create(self, **kwargs):
+        with self.backend.track():
+            reply = self.backend.respond(kwargs)
+            if reply.delay:
+                await asyncio.sleep(reply.delay)
+        return self._result(reply)
+
+class FakeAnthropicClient:
+    """Клиент в процессе: client.messages.create и client.beta.prompt_caching.messages.create"""
+
+    messages_class = _FakeMessages
+
+    def __init__(self, backend: Optional[FakeBackend] = None):
+        self.backend = backend or FakeBackend()
+        self.messages = self.messages_class(self.backend)
+        self.beta = SimpleNamespace(prompt_caching=SimpleNamespace(messages=self.messages))
+
+class AsyncFakeAnthropicClient(FakeAnthropicClient):
+    """То же для AsyncFloorAnalyzer"""
+
+    messages_class = _AsyncFakeMessages
+
+def make_handler(backend: FakeBackend):
+    class FakeAnthropicHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            if not self.path.split('?')[0].endswith('/v1/messages'):
+                self._send(404, {}, {'type': 'error', 'error': {'type': 'not_found_error', 'message': self.path}})
+                return
+            try:
+                length = int(self.headers.get('content-length', 0))
+                request = json.loads(self.rfile.read(length))
+            except ValueError as e:
+                self._send(400, {}, {'type': 'error', 'error': {'type': 'invalid_request_error', 'message': str(e)}})
+                return
+
+            with backend.track():
+                reply = backend.respond(request)
+                if reply.delay:
+                    time.sleep(reply.delay)
+            self._send(reply.status, reply.headers, reply.body)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                self._send(200, {}, backend.stats())
+            else:
+                self._send(404, {}, {'type': 'error', 'error': {'type': 'not_found_error', 'message': self.path}})
+
+        def _send(self, status: int, headers: Dict[str, str], body: Dict):
+            data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FakeAnthropicHandler
+
+def serve(backend: FakeBackend, host: str = '127.0.0.1', port: int = 8099) -> ThreadingHTTPServer:
+    """Создает HTTP сервер (запуск - serve_forever() или в отдельном потоке)"""
+    server = ThreadingHTTPServer((host, port), make_handler(backend))
+    server.daemon_threads = True
+    return server
+
+def add_backend_arguments(parser: argparse.ArgumentParser):
+    """Параметры FakeBackend для командной строки (общие с бенчмарками)"""
+    parser.add_argument('--latency', default='0',
+                        help='Latency distribution: SECONDS, uniform:MIN,MAX, normal:MEAN,SD or lognormal:MEDIAN,SIGMA')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Share of requests answered with 429')
+    parser.add_argument('--overloaded-rate', type=float, default=0.0, help='Share of requests answered with 529')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='Share of responses with broken or prose-wrapped JSON')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After header for 429, seconds')
+    parser.add_argument('--backend-seed', type=int, default=0)
+
+def backend_from_arguments(args: argparse.Namespace) -> FakeBackend:
+    return FakeBackend(
+        latency=args.latency,
+        rate_limit_rate=args.rate_limit_rate,
+        overloaded_rate=args.overloaded_rate,
+        malformed_rate=args.malformed_rate,
+        retry_after=args.retry_after,
+        seed=args.backend_seed
+    )
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Local fake of the Anthropic Messages API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    add_backend_arguments(parser)
+    args = parser.parse_args(argv)
+
+    backend = backend_from_arguments(args)
+    server = serve(backend, args.host, args.port)
+    print(f"Fake Anthropic API on http://{args.host}:{args.port} (stats at /stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(backend.stats(), indent=2))
+
+if __name__ == '__main__':
+    main()
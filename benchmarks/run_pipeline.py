@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк конвейера разбор -> анализ -> расчет стоимости -> отчет
+
+Для каждого сочетания размера чата, числа фото и формата даты генерируется
+синтетический экспорт, и конвейер запускается в отдельном процессе, чтобы
+пиковая память (RSS) одного прогона не влияла на другой. Claude заменен
+локальным FakeBackend (benchmarks/fake_anthropic.py), поэтому прогон не требует
+ключа API и сети; задержку и долю ошибок можно настроить.
+
+Примеры:
+    python -m benchmarks.run_pipeline --preset smoke
+    python -m benchmarks.run_pipeline --messages 1000,100000 --images 0,50 --formats bracketed
+    python -m benchmarks.run_pipeline --preset full --compare benchmarks/results/previous.json
+    python -m benchmarks.run_pipeline --images 50 --latency lognormal:1.5,0.4 --rate-limit-rate 0.05
+    python -m benchmarks.run_pipeline --base-url http://127.0.0.1:8099  # через HTTP сервер fake_anthropic
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import subprocess
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import anthropic
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.synthetic_export import TIMESTAMP_FORMATS, write_export
+from benchmarks.fake_anthropic import add_backend_arguments, backend_from_arguments
+
+PRESETS = {
+    'smoke': {'messages': [1000], 'images': [0, 10]},
+    'default': {'messages': [1000, 100000], 'images': [0, 50]},
+    'full': {'messages': [1000, 10000, 100000, 1000000], 'images': [0, 50, 500]}
+}
+
+DEFAULT_DATA_DIR = '/tmp/vanya_bench'
+DEFAULT_RESULTS_DIR = os.path.join(REPO_ROOT, 'benchmarks', 'results')
+
+def _peak_rss_bytes() -> int:
+    # ru_maxrss в килобайтах на Linux и в байтах на macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+class StageTimer:
+    """Замеряет время, пиковый RSS и выделения памяти для стадий одного прогона"""
+
+    def __init__(self, trace_allocations: bool):
+        self.trace_allocations = trace_allocations
+        self.stages = {}
+
+    def run(self, name: str, function, *args, **kwargs):
+        if self.trace_allocations:
+            tracemalloc.reset_peak()
+        blocks_before = sys.getallocatedblocks()
+        start = time.perf_counter()
+
+        result = function(*args, **kwargs)
+
+        stage = {
+            'wall_seconds': time.perf_counter() - start,
+            'peak_rss_bytes': _peak_rss_bytes(),
+            'allocated_blocks_delta': sys.getallocatedblocks() - blocks_before
+        }
+        if self.trace_allocations:
+            current, peak = tracemalloc.get_traced_memory()
+            stage['traced_peak_bytes'] = peak
+        self.stages[name] = stage
+        return result
+
+def run_case(archive_path: str, case: Dict, args: argparse.Namespace) -> Dict:
+    """Прогоняет конвейер на одном архиве (вызывается в дочернем процессе)"""
+    # Кэш результатов на диске исказил бы повторные прогоны
+    os.environ['ANALYSIS_CACHE_ENABLED'] = '0'
+
+    from whatsapp_parser import WhatsAppParser
+    from ai_analyzer import FloorAnalyzer
+    from pricing_calculator import PricingCalculator
+    from report_generator import ReportGenerator
+    from benchmarks.fake_anthropic import FakeAnthropicClient
+
+    if args.trace_allocations:
+        tracemalloc.start()
+
+    parser = WhatsAppParser()
+    analyzer = FloorAnalyzer(api_key='benchmark')
+    backend = None
+    if args.base_url:
+        analyzer.client = anthropic.Anthropic(api_key='benchmark', base_url=args.base_url, max_retries=0)
+    else:
+        backend = backend_from_arguments(args)
+        analyzer.client = FakeAnthropicClient(backend)
+    pricing_calculator = PricingCalculator()
+    report_generator = ReportGenerator()
+    timer = StageTimer(args.trace_allocations)
+    start = time.perf_counter()
+
+    parse_result = timer.run('parse', parser.process_whatsapp_export, archive_path)
+    try:
+        if not parse_result['success']:
+            raise RuntimeError(parse_result['error'])
+
+        image_files = [f for f in parse_result['media_files'] if f['type'] == 'image']
+        analysis = None
+        if image_files:
+            # Как и бот, без фото анализ и расчет не выполняются
+            analysis = timer.run('analyze', analyzer.analyze_multiple_images,
+                                 image_files, parse_result['conversation_context'])
+
+        if analysis and analysis['success']:
+            cost_info = timer.run('pricing', pricing_calculator.calculate_project_cost, analysis)
+            timeline = pricing_calculator.get_work_timeline(analysis, cost_info)
+
+            def render_reports():
+                report_generator.create_quick_summary(analysis, cost_info)
+                report_generator.create_analysis_report(analysis, cost_info, timeline, parse_result['client_info'])
+                report_generator.create_client_response_template(
+                    analysis, cost_info, timeline, parse_result['client_info']
+                )
+
+            timer.run('report', render_reports)
+    finally:
+        parser.cleanup_export(parse_result)
+        analyzer.preprocessor.shutdown()
+
+    total_seconds = time.perf_counter() - start
+    stages = timer.stages
+    stages['parse']['messages_per_second'] = len(parse_result['chat_messages']) / stages['parse']['wall_seconds']
+    stages['parse']['megabytes_per_second'] = (
+        case['archive_bytes'] / (1024 * 1024) / stages['parse']['wall_seconds']
+    )
+    if 'analyze' in stages:
+        stages['analyze']['images_analyzed'] = analysis.get('images_analyzed', 0)
+        stages['analyze']['images_per_second'] = (
+            stages['analyze']['images_analyzed'] / stages['analyze']['wall_seconds']
+        )
+        if backend is not None:
+            stages['analyze']['api'] = backend.stats()
+        stages['analyze']['memory_budget'] = {
+            'limit_bytes': analyzer.memory_budget.limit_bytes,
+            'peak_reserved_bytes': analyzer.memory_budget.peak_reserved,
+            'waits': analyzer.memory_budget.waits
+        }
+
+    return {
+        **case,
+        'parsed_messages': len(parse_result['chat_messages']),
+        'extracted_images': len(image_files),
+        'total_seconds': total_seconds,
+        'peak_rss_bytes': _peak_rss_bytes(),
+        'stages': stages
+    }
+
+def _run_case_in_subprocess(archive_path: str, case: Dict, args) -> Dict:
+    command = [
+        sys.executable, '-m', 'benchmarks.run_pipeline', '--run-case', archive_path,
+        '--case-json', json.dumps(case),
+        '--latency', args.latency,
+        '--rate-limit-rate', str(args.rate_limit_rate),
+        '--overloaded-rate', str(args.overloaded_rate),
+        '--malformed-rate', str(args.malformed_rate),
+        '--retry-after', str(args.retry_after),
+        '--backend-seed', str(args.backend_seed)
+    ]
+    if args.base_url:
+        command.extend(['--base-url', args.base_url])
+    if args.trace_allocations:
+        command.append('--trace-allocations')
+    completed = subprocess.run(command, cwd=REPO_ROOT, capture_output=True, text=True)
+    if completed.returncode != 0:
+        stderr_lines = completed.stderr.strip().splitlines()
+        return {**case, 'error': stderr_lines[-1] if stderr_lines else 'unknown error'}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def _ensure_archive(data_dir: str, messages: int, images: int, timestamp_format: str, seed: int) -> Tuple[str, Dict]:
+    """Генерирует архив или берет уже сгенерированный с теми же параметрами"""
+    path = os.path.join(data_dir, f"export_{messages}m_{images}i_{timestamp_format}_s{seed}.zip")
+    if os.path.exists(path):
+        return path, {
+            'messages': messages,
+            'images': images,
+            'timestamp_format': timestamp_format,
+            'seed': seed,
+            'archive_bytes': os.path.getsize(path)
+        }
+    return path, write_export(path, messages, images, timestamp_format, seed)
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _case_key(case: Dict) -> tuple:
+    return case['messages'], case['images'], case['timestamp_format']
+
+def compare(previous: Dict, current: Dict) -> List[str]:
+    """Строки с изменением времени стадий относительно предыдущего прогона"""
+    previous_cases = {_case_key(case): case for case in previous['cases'] if 'error' not in case}
+    lines = [f"{'case':<32} {'stage':<8} {'before, s':>10} {'after, s':>10} {'change':>8}"]
+    for case in current['cases']:
+        before = previous_cases.get(_case_key(case))
+        if before is None or 'error' in case:
+            continue
+        name = f"{case['messages']}m/{case['images']}i/{case['timestamp_format']}"
+        for stage, stats in case['stages'].items():
+            if stage not in before['stages']:
+                continue
+            old = before['stages'][stage]['wall_seconds']
+            new = stats['wall_seconds']
+            change = (new - old) / old * 100 if old else 0.0
+            lines.append(f"{name:<32} {stage:<8} {old:>10.4f} {new:>10.4f} {change:>+7.1f}%")
+    return lines
+
+def _parse_int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(',') if item]
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Benchmark the parse -> analyze -> price -> report pipeline')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='default')
+    parser.add_argument('--messages', type=_parse_int_list, help='Comma-separated message counts')
+    parser.add_argument('--images', type=_parse_int_list, help='Comma-separated image counts')
+    parser.add_argument('--formats', default='all',
+                        help=f"Comma-separated timestamp formats: {', '.join(TIMESTAMP_FORMATS)} or 'all'")
+    parser.add_argument('--seed', type=int, default=0)
+    add_backend_arguments(parser)
+    parser.add_argument('--base-url', help='Send requests to this Anthropic-compatible server instead')
+    parser.add_argument('--trace-allocations', action='store_true',
+                        help='Record tracemalloc peaks (slows the run down)')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='Where generated exports are kept')
+    parser.add_argument('--output', help='Result JSON path (default: benchmarks/results/<timestamp>.json)')
+    parser.add_argument('--compare', help='Previous result JSON to compare against')
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    parser.add_argument('--case-json', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_case:
+        result = run_case(args.run_case, json.loads(args.case_json), args)
+        print(json.dumps(result))
+        return
+
+    preset = PRESETS[args.preset]
+    message_counts = args.messages or preset['messages']
+    image_counts = args.images if args.images is not None else preset['images']
+    formats = list(TIMESTAMP_FORMATS) if args.formats == 'all' else args.formats.split(',')
+    for timestamp_format in formats:
+        if timestamp_format not in TIMESTAMP_FORMATS:
+            parser.error(f"Unknown timestamp format: {timestamp_format}")
+
+    started_at = datetime.now(timezone.utc)
+    cases = []
+    for messages in message_counts:
+        for images in image_counts:
+            for timestamp_format in formats:
+                archive_path, case = _ensure_archive(args.data_dir, messages, images, timestamp_format, args.seed)
+                result = _run_case_in_subprocess(archive_path, case, args)
+                cases.append(result)
+
+                if 'error' in result:
+                    print(f"{messages:>8}m {images:>4}i {timestamp_format:<10} ERROR {result['error']}")
+                else:
+                    print(f"{messages:>8}m {images:>4}i {timestamp_format:<10} "
+                          f"{result['total_seconds']:8.3f}s  "
+                          f"peak RSS {result['peak_rss_bytes'] / (1024 * 1024):7.1f} MB  "
+                          f"parse {result['stages']['parse']['messages_per_second']:,.0f} msg/s")
+
+    report = {
+        'created_at': started_at.isoformat(),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {
+            'preset': args.preset,
+            'seed': args.seed,
+            'api': args.base_url or {
+                'latency': args.latency,
+                'rate_limit_rate': args.rate_limit_rate,
+                'overloaded_rate': args.overloaded_rate,
+                'malformed_rate': args.malformed_rate,
+                'retry_after': args.retry_after
+            },
+            'trace_allocations': args.trace_allocations
+        },
+        'cases': cases
+    }
+
+    output = args.output or os.path.join(
+        DEFAULT_RESULTS_DIR, started_at.strftime('%Y%m%dT%H%M%SZ') + '.json'
+    )
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        print('\n'.join(compare(previous, report)))
+
+if __name__ == '__main__':
+    main()
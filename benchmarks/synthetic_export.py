@@ -0,0 +1,115 @@
+"""
+Генерация синтетических экспортов WhatsApp для бенчмарков
+
+Экспорт детерминирован: одинаковые параметры и seed дают одинаковый архив.
+"""
+
+import io
+import os
+import random
+import zipfile
+from datetime import datetime, timedelta
+from typing import Dict
+
+import numpy as np
+from PIL import Image
+
+# Форматы строки заголовка, которые понимает WhatsAppParser (см. CHAT_LINE_PATTERNS)
+TIMESTAMP_FORMATS = {
+    'bracketed': lambda ts: ts.strftime('[%d.%m.%Y, %H:%M:%S] '),
+    'dashed': lambda ts: ts.strftime('%d.%m.%Y, %H:%M - '),
+    'us': lambda ts: f"{ts.month}/{ts.day}/{ts.strftime('%y')}, {int(ts.strftime('%I'))}:{ts.strftime('%M %p')} - "
+}
+
+SENDERS = ['Иван', 'Клиент Петров']
+
+PHRASES = [
+    'Добрый день! Нужно посмотреть пол в гостиной',
+    'Паркет в спальне скрипит и местами вздулся',
+    'Ламинат на кухне разошелся в стыках',
+    'Когда сможете приехать?',
+    'Адрес: улица Герцль 15, квартира 4',
+    'Мой телефон +972 52-123-4567',
+    'Спасибо, жду расчет',
+    'Плитка в коридоре треснула',
+    'Хорошо, договорились',
+    'Сколько будет стоить покрытие лаком?'
+]
+
+SYSTEM_MESSAGES = [
+    'Messages and calls are end-to-end encrypted. No one outside of this chat can read them.',
+    'Клиент Петров changed the group description'
+]
+
+IMAGE_SIZE = (640, 480)
+
+def image_name(index: int) -> str:
+    return f"IMG-20240101-WA{index:04d}.jpg"
+
+def generate_chat(message_count: int, image_count: int, timestamp_format: str,
+                  seed: int = 0) -> str:
+    """Текст чата с message_count сообщениями, из них image_count - вложения"""
+    rng = random.Random(seed)
+    format_header = TIMESTAMP_FORMATS[timestamp_format]
+    timestamp = datetime(2024, 1, 1, 8, 0, 0)
+
+    # Вложения равномерно распределены по чату
+    attachment_positions = {}
+    if image_count:
+        step = max(1, message_count // image_count)
+        for index in range(min(image_count, message_count)):
+            attachment_positions[index * step] = index
+
+    lines = [format_header(timestamp) + SYSTEM_MESSAGES[0]]
+    for position in range(message_count):
+        timestamp += timedelta(seconds=rng.randint(5, 600))
+        header = format_header(timestamp)
+        sender = SENDERS[position % 2 if rng.random() < 0.8 else 1 - position % 2]
+
+        if position in attachment_positions:
+            lines.append(f"{header}{sender}: {image_name(attachment_positions[position])} (file attached)")
+        elif rng.random() < 0.01:
+            lines.append(header + rng.choice(SYSTEM_MESSAGES))
+        elif rng.random() < 0.1:
+            # Многострочное сообщение
+            lines.append(f"{header}{sender}: {rng.choice(PHRASES)}")
+            lines.append(rng.choice(PHRASES))
+        else:
+            lines.append(f"{header}{sender}: {rng.choice(PHRASES)}")
+
+    return '\n'.join(lines) + '\n'
+
+def generate_image(index: int, seed: int = 0) -> bytes:
+    """Небольшое JPEG с шумом поверх градиента - не сжимается до нуля и не дублируется"""
+    rng = np.random.default_rng(seed * 100003 + index)
+    width, height = IMAGE_SIZE
+    gradient = np.linspace(0, 255, width, dtype=np.float64)[np.newaxis, :, np.newaxis]
+    pixels = gradient * rng.random(3) + rng.normal(0, 40, (height, width, 3))
+    image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=80)
+    return buffer.getvalue()
+
+def write_export(path: str, message_count: int, image_count: int, timestamp_format: str,
+                 seed: int = 0) -> Dict:
+    """
+    Записывает ZIP экспорт в path
+
+    Returns:
+        Dict с параметрами и размером архива
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('_chat.txt', generate_chat(message_count, image_count, timestamp_format, seed))
+        for index in range(image_count):
+            # JPEG уже сжат - храним без повторного сжатия, как WhatsApp
+            archive.writestr(image_name(index), generate_image(index, seed), compress_type=zipfile.ZIP_STORED)
+
+    return {
+        'messages': message_count,
+        'images': image_count,
+        'timestamp_format': timestamp_format,
+        'seed': seed,
+        'archive_bytes': os.path.getsize(path)
+    }
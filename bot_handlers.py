@@ -1,56 +1,24 @@
 import telebot
 from telebot import types
 import os
-import tempfile
+import time
 import logging
-from typing import Dict
+from typing import Callable, Dict, Generator, List, Optional
 
 from whatsapp_parser import WhatsAppParser
 from ai_analyzer import FloorAnalyzer
 from pricing_calculator import PricingCalculator
-from report_generator import ReportGenerator
+from report_generator import ANALYSIS_REPORT, CLIENT_TEMPLATE, ReportGenerator, new_report_version
+from session_store import SessionStore
+from chat_index import ChatIndex
+from metrics import track_stage
+from telegram_downloader import TelegramDownloader
+from progress_reporter import ProgressReporter
+from price_adjustment import AdjustmentError, parse_adjustments, reprice
 
 logger = logging.getLogger(__name__)
 
-class BotHandlers:
-    def __init__(self, bot: telebot.TeleBot):
-        self.bot = bot
-        self.whatsapp_parser = WhatsAppParser()
-        self.floor_analyzer = FloorAnalyzer()
-        self.pricing_calculator = PricingCalculator()
-        self.report_generator = ReportGenerator()
-        
-        # Временное хранилище для данных пользователей
-        self.user_data = {}
-        
-        self.setup_handlers()
-    
-    def setup_handlers(self):
-        """Настраивает все обработчики бота"""
-        
-        @self.bot.message_handler(commands=['start'])
-        def start_command(message):
-            self.handle_start(message)
-        
-        @self.bot.message_handler(commands=['help'])
-        def help_command(message):
-            self.handle_help(message)
-        
-        @self.bot.message_handler(content_types=['document'])
-        def handle_document(message):
-            self.handle_zip_file(message)
-        
-        @self.bot.message_handler(content_types=['photo'])
-        def handle_photo(message):
-            self.handle_single_photo(message)
-        
-        @self.bot.callback_query_handler(func=lambda call: True)
-        def handle_callbacks(call):
-            self.handle_callback_query(call)
-    
-    def handle_start(self, message):
-        """Обрабатывает команду /start"""
-        welcome_text = """🏠 **Добро пожаловать в бот Ивана!**
+WELCOME_TEXT = """🏠 **Добро пожаловать в бот Ивана!**
 
 Я помогаю анализировать полы и рассчитывать стоимость ремонта.
 
@@ -71,22 +39,7 @@ class BotHandlers:
 
 Отправьте ZIP файл или фотографии для начала анализа! 📸"""
 
-        keyboard = types.InlineKeyboardMarkup()
-        keyboard.add(
-            types.InlineKeyboardButton("📋 Помощь", callback_data="help"),
-            types.InlineKeyboardButton("📞 Контакты", callback_data="contacts")
-        )
-        
-        self.bot.send_message(
-            message.chat.id, 
-            welcome_text, 
-            reply_markup=keyboard,
-            parse_mode='Markdown'
-        )
-    
-    def handle_help(self, message):
-        """Обрабатывает команду /help"""
-        help_text = """🔧 **ИНСТРУКЦИЯ ПО ИСПОЛЬЗОВАНИЮ**
+HELP_TEXT = """🔧 **ИНСТРУКЦИЯ ПО ИСПОЛЬЗОВАНИЮ**
 
 📁 **Анализ WhatsApp чата:**
 1. Откройте чат с клиентом в WhatsApp
@@ -114,207 +67,466 @@ class BotHandlers:
 📋 **Команды:**
 /start - Начать работу
 /help - Эта справка
+/search текст - Поиск по перепискам клиентов
 
 ❓ **Вопросы?** Обращайтесь к Ивану: +972 52-477-2115"""
 
-        self.bot.send_message(message.chat.id, help_text, parse_mode='Markdown')
+CONTACTS_TEXT = """📞 **КОНТАКТЫ ИВАНА**
+
+👤 Имя: Иван
+📱 Телефон: +972 52-477-2115
+🏠 Специализация: Ремонт полов и паркета
+
+🕒 Время работы: Воскресенье - Четверг, 8:00 - 18:00
+📍 Обслуживаемые районы: Весь Израиль
+
+💬 Для заказа работ звоните или пишите в WhatsApp!"""
+
+def start_keyboard() -> types.InlineKeyboardMarkup:
+    """Кнопки приветствия"""
+    keyboard = types.InlineKeyboardMarkup()
+    keyboard.add(
+        types.InlineKeyboardButton("📋 Помощь", callback_data="help"),
+        types.InlineKeyboardButton("📞 Контакты", callback_data="contacts")
+    )
+    return keyboard
+
+def single_photo_keyboard() -> types.InlineKeyboardMarkup:
+    """Кнопки после анализа одной фотографии"""
+    keyboard = types.InlineKeyboardMarkup()
+    keyboard.add(
+        types.InlineKeyboardButton("📋 Подробный отчет", callback_data="detailed_single"),
+        types.InlineKeyboardButton("📱 Ответ клиенту", callback_data="client_template_single"),
+        types.InlineKeyboardButton("💰 Изменить цену", callback_data="adjust_price"),
+        types.InlineKeyboardButton("📄 Документ клиенту", callback_data="quote_document")
+    )
+    return keyboard
+
+def results_keyboard() -> types.InlineKeyboardMarkup:
+    """Кнопки действий после анализа чата"""
+    keyboard = types.InlineKeyboardMarkup(row_width=2)
+    keyboard.add(
+        types.InlineKeyboardButton("📋 Полный отчет", callback_data="full_report"),
+        types.InlineKeyboardButton("📱 Ответ клиенту", callback_data="client_template"),
+        types.InlineKeyboardButton("💰 Изменить цену", callback_data="adjust_price"),
+        types.InlineKeyboardButton("📊 Детали анализа", callback_data="analysis_details"),
+        types.InlineKeyboardButton("📄 Документ клиенту", callback_data="quote_document"),
+        types.InlineKeyboardButton("🔄 Новый анализ", callback_data="new_analysis")
+    )
+    return keyboard
+
+# Скидки, которые можно выбрать кнопкой
+DISCOUNT_PRESETS = (5, 10, 15)
+
+ADJUSTMENT_EXAMPLE = "Пример: площадь 35, тип ламинат, состояние хорошее, скидка 10"
+
+def adjustment_keyboard() -> types.InlineKeyboardMarkup:
+    """Кнопки быстрой правки цены"""
+    keyboard = types.InlineKeyboardMarkup(row_width=3)
+    keyboard.add(*(
+        types.InlineKeyboardButton(f"🏷️ -{discount}%", callback_data=f"discount_{discount}")
+        for discount in DISCOUNT_PRESETS
+    ))
+    keyboard.add(types.InlineKeyboardButton("↩️ Сбросить правки", callback_data="reset_adjustments"))
+    return keyboard
+
+def session_keyboard(user_data: Dict) -> types.InlineKeyboardMarkup:
+    """Кнопки под результатом - для одного фото или для чата"""
+    return single_photo_keyboard() if user_data.get('is_single_photo') else results_keyboard()
+
+def discount_from_callback(data: str) -> int:
+    """Скидка из callback_data вида discount_10"""
+    return int(data[len('discount_'):])
+
+def build_single_analysis(analysis: Dict, context: str) -> Dict:
+    """Упрощенный результат проекта по анализу одного изображения"""
+    return {
+        'success': True,
+        'floor_type': analysis.get('floor_type', 'unknown'),
+        'condition': analysis.get('condition', 'unknown'),
+        'total_area_estimate': analysis.get('area_estimate', 20),
+        'damages': analysis.get('damages', []),
+        'recommendations': analysis.get('recommendations', []),
+        'work_complexity': analysis.get('work_complexity', 'medium'),
+        'images_analyzed': 1,
+        'context': context
+    }
+
+def images_found_text(image_files: List[Dict], parse_result: Dict) -> str:
+    """Статус перед анализом с учетом отбора фото"""
+    unselected = len(parse_result.get('unselected_media', []))
+    if unselected:
+        return (f"🔍 Найдено {len(image_files) + unselected} изображений, "
+                f"для анализа отобрано {len(image_files)}. Анализирую...")
+    return f"🔍 Найдено {len(image_files)} изображений. Анализирую..."
+
+def progress_text(done: int, total: int, provisional: Dict, pricing_calculator: PricingCalculator,
+                  report_generator: ReportGenerator) -> str:
+    """Статус во время анализа с предварительной ценой по уже готовым фото"""
+    cost_info = None
+    if any(a.get('success') for a in provisional.get('individual_analyses', [])):
+        cost_info = pricing_calculator.calculate_project_cost(provisional)
+    return report_generator.create_progress_update(done, total, provisional, cost_info)
+
+class BaseBotHandlers:
+    """
+    Сценарии обработчиков, общие для синхронного и asyncio ботов.
+
+    Каждый сценарий - генератор. Вызовы Telegram, анализатора и загрузчика
+    передаются через yield как есть, блокирующая работа (разбор архива,
+    хранилище, индекс, документ) - через yield self._blocking(...).
+    Подкласс выполняет шаги в _run: синхронная версия получает результат
+    сразу, asyncio-версия дожидается корутин и уносит блокирующие вызовы
+    в пул потоков.
+    """
+    
+    analyzer_class = FloorAnalyzer
+    downloader_class = TelegramDownloader
+    progress_reporter_class = ProgressReporter
+    
+    def __init__(self, bot, sessions: SessionStore = None, chat_index: ChatIndex = None):
+        self.bot = bot
+        self.whatsapp_parser = WhatsAppParser()
+        self.floor_analyzer = self.analyzer_class()
+        self.pricing_calculator = PricingCalculator()
+        self.report_generator = ReportGenerator()
+        self.downloader = self.downloader_class(bot.token)
+        
+        # Хранилище результатов анализа по чатам
+        self.sessions = sessions or SessionStore()
+        
+        # Поиск по всем обработанным перепискам
+        self.chat_index = chat_index or ChatIndex()
+        
+        self.setup_handlers()
+    
+    def _run(self, flow: Generator):
+        """Выполняет сценарий и возвращает его результат"""
+        raise NotImplementedError
+    
+    def _blocking(self, fn: Callable, *args):
+        """Шаг сценария с блокирующей работой"""
+        raise NotImplementedError
+    
+    def setup_handlers(self):
+        """Настраивает все обработчики бота"""
+        
+        @self.bot.message_handler(commands=['start'])
+        def start_command(message):
+            return self.handle_start(message)
+        
+        @self.bot.message_handler(commands=['help'])
+        def help_command(message):
+            return self.handle_help(message)
+        
+        @self.bot.message_handler(commands=['search'])
+        def search_command(message):
+            return self.handle_search(message)
+        
+        @self.bot.message_handler(content_types=['document'])
+        def handle_document(message):
+            return self.handle_zip_file(message)
+        
+        @self.bot.message_handler(content_types=['photo'])
+        def handle_photo(message):
+            return self.handle_single_photo(message)
+        
+        @self.bot.message_handler(content_types=['text'])
+        def handle_text(message):
+            return self.handle_text(message)
+        
+        @self.bot.callback_query_handler(func=lambda call: True)
+        def handle_callbacks(call):
+            return self.handle_callback_query(call)
+    
+    def handle_start(self, message):
+        """Обрабатывает команду /start"""
+        return self._run(self._start_flow(message))
+    
+    def handle_help(self, message):
+        """Обрабатывает команду /help"""
+        return self._run(self._help_flow(message))
+    
+    def handle_search(self, message):
+        """Обрабатывает команду /search - поиск по сообщениям обработанных переписок"""
+        return self._run(self._search_flow(message))
     
     def handle_zip_file(self, message):
         """Обрабатывает ZIP файл с экспортом WhatsApp"""
-        try:
-            # Проверяем что это ZIP файл
-            if not message.document.file_name.endswith('.zip'):
-                self.bot.send_message(
-                    message.chat.id,
-                    "❌ Поддерживаются только ZIP архивы с экспортами WhatsApp"
-                )
-                return
-            
-            # Проверяем размер файла
-            if message.document.file_size > 50 * 1024 * 1024:  # 50MB
-                self.bot.send_message(
-                    message.chat.id,
-                    "❌ Файл слишком большой. Максимальный размер: 50MB"
-                )
-                return
-            
-            # Показываем что бот работает
-            self.bot.send_chat_action(message.chat.id, 'typing')
-            status_msg = self.bot.send_message(
-                message.chat.id,
-                "📦 Скачиваю и распаковываю архив..."
-            )
-            
-            # Скачиваем файл
-            file_info = self.bot.get_file(message.document.file_id)
-            downloaded_file = self.bot.download_file(file_info.file_path)
-            
-            # Обновляем статус
-            self.bot.edit_message_text(
-                "🔍 Анализирую содержимое архива...",
-                message.chat.id,
-                status_msg.message_id
-            )
-            
-            # Парсим WhatsApp экспорт
-            parse_result = self.whatsapp_parser.process_whatsapp_export(downloaded_file)
-            
-            if not parse_result['success']:
-                self.bot.edit_message_text(
-                    f"❌ Ошибка при обработке архива: {parse_result.get('error', 'Неизвестная ошибка')}",
-                    message.chat.id,
-                    status_msg.message_id
-                )
-                return
-            
-            # Проверяем наличие изображений
-            image_files = [f for f in parse_result['media_files'] if f['type'] == 'image']
-            
-            if not image_files:
-                self.bot.edit_message_text(
-                    "❌ В архиве не найдено изображений для анализа",
-                    message.chat.id,
-                    status_msg.message_id
-                )
-                return
-            
-            # Обновляем статус
-            self.bot.edit_message_text(
-                f"🔍 Найдено {len(image_files)} изображений. Анализирую...",
-                message.chat.id,
-                status_msg.message_id
-            )
-            
-            # Анализируем изображения
-            analysis_result = self.floor_analyzer.analyze_multiple_images(
-                image_files, 
-                parse_result['conversation_context']
-            )
-            
-            if not analysis_result['success']:
-                self.bot.edit_message_text(
-                    f"❌ Ошибка при анализе изображений: {analysis_result.get('error', 'Неизвестная ошибка')}",
-                    message.chat.id,
-                    status_msg.message_id
-                )
-                return
-            
-            # Рассчитываем стоимость
-            cost_info = self.pricing_calculator.calculate_project_cost(analysis_result)
-            timeline = self.pricing_calculator.get_work_timeline(analysis_result, cost_info)
-            
-            # Удаляем статусное сообщение
-            self.bot.delete_message(message.chat.id, status_msg.message_id)
-            
-            # Сохраняем данные для пользователя
-            self.user_data[message.chat.id] = {
-                'analysis': analysis_result,
-                'cost_info': cost_info,
-                'timeline': timeline,
-                'client_info': parse_result['client_info'],
-                'parse_result': parse_result
-            }
-            
-            # Отправляем результаты
-            self.send_analysis_results(message.chat.id)
-            
-        except Exception as e:
-            logger.error(f"Error processing ZIP file: {e}")
-            self.bot.send_message(
-                message.chat.id,
-                f"❌ Произошла ошибка при обработке файла: {str(e)}"
-            )
+        return self._run(self._zip_file_flow(message))
     
     def handle_single_photo(self, message):
         """Обрабатывает отдельную фотографию"""
-        try:
-            self.bot.send_chat_action(message.chat.id, 'typing')
-            status_msg = self.bot.send_message(
-                message.chat.id,
-                "🔍 Анализирую изображение..."
-            )
-            
-            # Скачиваем фото
-            file_info = self.bot.get_file(message.photo[-1].file_id)
-            downloaded_file = self.bot.download_file(file_info.file_path)
-            
-            # Сохраняем во временный файл
-            with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as temp_file:
-                temp_file.write(downloaded_file)
-                temp_file_path = temp_file.name
-            
+        return self._run(self._single_photo_flow(message))
+    
+    def handle_text(self, message):
+        """Принимает ручные правки цены после кнопки «Изменить цену»"""
+        return self._run(self._text_flow(message))
+    
+    def handle_callback_query(self, call):
+        """Обрабатывает нажатия на кнопки"""
+        return self._run(self._callback_query_flow(call))
+    
+    def store_quote_images(self, chat_id: int, image_paths: List[str]):
+        """Сохраняет в данные чата миниатюры фото для документа клиенту"""
+        return self._run(self._store_quote_images_flow(chat_id, image_paths))
+    
+    def send_analysis_results(self, chat_id: int):
+        """Отправляет результаты анализа"""
+        return self._run(self._analysis_results_flow(chat_id))
+    
+    def send_repriced_results(self, chat_id: int, user_data: Dict, changes: Optional[Dict]):
+        """Пересчитывает цену по сохраненному анализу (без запросов к Claude) и отправляет сводку"""
+        return self._run(self._repriced_results_flow(chat_id, user_data, changes))
+    
+    def _start_flow(self, message):
+        yield self.bot.send_message(
+            message.chat.id, 
+            WELCOME_TEXT, 
+            reply_markup=start_keyboard(),
+            parse_mode='Markdown'
+        )
+    
+    def _help_flow(self, message):
+        yield self.bot.send_message(message.chat.id, HELP_TEXT, parse_mode='Markdown')
+    
+    def _search_flow(self, message):
+        query = telebot.util.extract_arguments(message.text).strip()
+        if not query:
+            yield self.bot.send_message(message.chat.id, "Использование: /search паркет на балконе")
+            return
+        
+        with track_stage('search', 'total'):
+            hits = yield self._blocking(self.chat_index.search, message.chat.id, query)
+        
+        yield self.bot.send_message(
+            message.chat.id,
+            self.report_generator.create_search_results(query, hits),
+            parse_mode='Markdown'
+        )
+    
+    def _zip_file_flow(self, message):
+        with track_stage('zip', 'total'):
             try:
-                # Анализируем изображение
-                context = message.caption if message.caption else ""
-                analysis = self.floor_analyzer.analyze_floor_image(temp_file_path, context)
-                
-                if not analysis['success']:
-                    self.bot.edit_message_text(
-                        f"❌ Ошибка при анализе: {analysis.get('error', 'Неизвестная ошибка')}",
+                # Проверяем что это ZIP файл
+                if not message.document.file_name.endswith('.zip'):
+                    yield self.bot.send_message(
                         message.chat.id,
-                        status_msg.message_id
+                        "❌ Поддерживаются только ZIP архивы с экспортами WhatsApp"
                     )
                     return
                 
-                # Создаем упрощенный результат для одного изображения
-                single_analysis = {
-                    'success': True,
-                    'floor_type': analysis.get('floor_type', 'unknown'),
-                    'condition': analysis.get('condition', 'unknown'),
-                    'total_area_estimate': analysis.get('area_estimate', 20),
-                    'damages': analysis.get('damages', []),
-                    'recommendations': analysis.get('recommendations', []),
-                    'work_complexity': analysis.get('work_complexity', 'medium'),
-                    'images_analyzed': 1,
-                    'context': context
-                }
-                
-                # Рассчитываем стоимость
-                cost_info = self.pricing_calculator.calculate_project_cost(single_analysis)
-                timeline = self.pricing_calculator.get_work_timeline(single_analysis, cost_info)
+                # Проверяем размер файла
+                if message.document.file_size > 50 * 1024 * 1024:  # 50MB
+                    yield self.bot.send_message(
+                        message.chat.id,
+                        "❌ Файл слишком большой. Максимальный размер: 50MB"
+                    )
+                    return
                 
-                # Удаляем статусное сообщение
-                self.bot.delete_message(message.chat.id, status_msg.message_id)
+                # Показываем что бот работает
+                yield self.bot.send_chat_action(message.chat.id, 'typing')
+                status_msg = yield self.bot.send_message(
+                    message.chat.id,
+                    "📦 Скачиваю и распаковываю архив..."
+                )
                 
-                # Создаем краткий отчет
-                quick_summary = self.report_generator.create_quick_summary(single_analysis, cost_info)
+                # Скачиваем файл
+                with track_stage('zip', 'download'):
+                    file_info = yield self.bot.get_file(message.document.file_id)
+                    downloaded_file = yield self.downloader.download(file_info.file_path)
                 
-                keyboard = types.InlineKeyboardMarkup()
-                keyboard.add(
-                    types.InlineKeyboardButton("📋 Подробный отчет", callback_data="detailed_single"),
-                    types.InlineKeyboardButton("📱 Ответ клиенту", callback_data="client_template_single")
+                # Обновляем статус
+                yield self.bot.edit_message_text(
+                    "🔍 Анализирую содержимое архива...",
+                    message.chat.id,
+                    status_msg.message_id
                 )
                 
-                # Сохраняем данные
-                self.user_data[message.chat.id] = {
-                    'analysis': single_analysis,
-                    'cost_info': cost_info,
-                    'timeline': timeline,
-                    'client_info': {'name': 'Клиент'},
-                    'is_single_photo': True
-                }
+                # Парсим WhatsApp экспорт
+                try:
+                    with track_stage('zip', 'parse'):
+                        parse_result = yield self._blocking(
+                            self.whatsapp_parser.process_whatsapp_export, downloaded_file
+                        )
+                finally:
+                    # Архив больше не нужен - медиафайлы уже извлечены
+                    downloaded_file.close()
+                
+                try:
+                    if not parse_result['success']:
+                        yield self.bot.edit_message_text(
+                            f"❌ Ошибка при обработке архива: {parse_result.get('error', 'Неизвестная ошибка')}",
+                            message.chat.id,
+                            status_msg.message_id
+                        )
+                        return
+                    
+                    # Проверяем наличие изображений
+                    image_files = [f for f in parse_result['media_files'] if f['type'] == 'image']
+                    
+                    if not image_files:
+                        yield self.bot.edit_message_text(
+                            "❌ В архиве не найдено изображений для анализа",
+                            message.chat.id,
+                            status_msg.message_id
+                        )
+                        return
+                    
+                    # Обновляем статус; дальше он показывает прогресс и предварительную цену
+                    reporter = self.progress_reporter_class(
+                        self.bot, message.chat.id, status_msg.message_id,
+                        lambda done, total, provisional: progress_text(
+                            done, total, provisional, self.pricing_calculator, self.report_generator
+                        )
+                    )
+                    yield reporter.update(images_found_text(image_files, parse_result), force=True)
+                    
+                    # Анализируем изображения
+                    with track_stage('zip', 'analysis'):
+                        analysis_result = yield self.floor_analyzer.analyze_multiple_images(
+                            image_files, 
+                            parse_result['conversation_context'],
+                            on_progress=reporter
+                        )
+                    
+                    if not analysis_result['success']:
+                        yield self.bot.edit_message_text(
+                            f"❌ Ошибка при анализе изображений: {analysis_result.get('error', 'Неизвестная ошибка')}",
+                            message.chat.id,
+                            status_msg.message_id
+                        )
+                        return
+                    
+                    # Рассчитываем стоимость
+                    with track_stage('zip', 'pricing'):
+                        cost_info = self.pricing_calculator.calculate_project_cost(analysis_result)
+                        timeline = self.pricing_calculator.get_work_timeline(analysis_result, cost_info)
+                    
+                    # Удаляем статусное сообщение
+                    yield self.bot.delete_message(message.chat.id, status_msg.message_id)
+                    
+                    # Сохраняем данные для пользователя
+                    yield self._blocking(self.sessions.set, message.chat.id, {
+                        'analysis': analysis_result,
+                        'cost_info': cost_info,
+                        'timeline': timeline,
+                        'client_info': parse_result['client_info'],
+                        'report_version': new_report_version(),
+                        'analyzed_at': time.time()
+                    })
+                    
+                    # Отправляем результаты
+                    with track_stage('zip', 'report'):
+                        yield from self._analysis_results_flow(message.chat.id)
+                    
+                    # Миниатюры для документа клиенту - после ответа, пока файлы экспорта на месте
+                    with track_stage('zip', 'thumbnails'):
+                        yield from self._store_quote_images_flow(message.chat.id, [f['path'] for f in image_files])
+                finally:
+                    # Индексируем переписку для /search уже после ответа пользователю
+                    if parse_result['success']:
+                        with track_stage('zip', 'index'):
+                            yield self._blocking(self.chat_index.add_export, message.chat.id, parse_result)
+                    
+                    # Удаляем извлеченные медиафайлы
+                    yield self._blocking(self.whatsapp_parser.cleanup_export, parse_result)
                 
-                self.bot.send_message(
+            except Exception as e:
+                logger.error(f"Error processing ZIP file: {e}")
+                yield self.bot.send_message(
                     message.chat.id,
-                    f"✅ **Анализ завершен!**\n\n{quick_summary}",
-                    reply_markup=keyboard,
-                    parse_mode='Markdown'
+                    f"❌ Произошла ошибка при обработке файла: {str(e)}"
+                )
+    
+    def _single_photo_flow(self, message):
+        with track_stage('photo', 'total'):
+            try:
+                yield self.bot.send_chat_action(message.chat.id, 'typing')
+                status_msg = yield self.bot.send_message(
+                    message.chat.id,
+                    "🔍 Анализирую изображение..."
                 )
                 
-            finally:
-                # Удаляем временный файл
-                os.unlink(temp_file_path)
+                # Скачиваем фото
+                with track_stage('photo', 'download'):
+                    file_info = yield self.bot.get_file(message.photo[-1].file_id)
+                    # Сразу во временный файл, без копии в памяти
+                    temp_file_path = yield self.downloader.download_to_path(file_info.file_path, suffix='.jpg')
                 
+                try:
+                    # Анализируем изображение
+                    context = message.caption if message.caption else ""
+                    with track_stage('photo', 'analysis'):
+                        analysis = yield self.floor_analyzer.analyze_floor_image(temp_file_path, context)
+                    
+                    if not analysis['success']:
+                        yield self.bot.edit_message_text(
+                            f"❌ Ошибка при анализе: {analysis.get('error', 'Неизвестная ошибка')}",
+                            message.chat.id,
+                            status_msg.message_id
+                        )
+                        return
+                    
+                    # Создаем упрощенный результат для одного изображения
+                    single_analysis = build_single_analysis(analysis, context)
+                    
+                    # Рассчитываем стоимость
+                    with track_stage('photo', 'pricing'):
+                        cost_info = self.pricing_calculator.calculate_project_cost(single_analysis)
+                        timeline = self.pricing_calculator.get_work_timeline(single_analysis, cost_info)
+                    
+                    # Удаляем статусное сообщение
+                    yield self.bot.delete_message(message.chat.id, status_msg.message_id)
+                    
+                    # Создаем краткий отчет
+                    with track_stage('photo', 'report'):
+                        quick_summary = self.report_generator.create_quick_summary(single_analysis, cost_info)
+                    
+                    # Сохраняем данные
+                    yield self._blocking(self.sessions.set, message.chat.id, {
+                        'analysis': single_analysis,
+                        'cost_info': cost_info,
+                        'timeline': timeline,
+                        'client_info': {'name': 'Клиент'},
+                        'is_single_photo': True,
+                        'report_version': new_report_version(),
+                        'analyzed_at': time.time()
+                    })
+                    
+                    yield self.bot.send_message(
+                        message.chat.id,
+                        f"✅ **Анализ завершен!**\n\n{quick_summary}",
+                        reply_markup=single_photo_keyboard(),
+                        parse_mode='Markdown'
+                    )
+                    
+                    with track_stage('photo', 'thumbnails'):
+                        yield from self._store_quote_images_flow(message.chat.id, [temp_file_path])
+                    
+                finally:
+                    # Удаляем временный файл
+                    os.unlink(temp_file_path)
+                    
+            except Exception as e:
+                logger.error(f"Error processing single photo: {e}")
+                yield self.bot.send_message(
+                    message.chat.id,
+                    f"❌ Произошла ошибка при анализе фотографии: {str(e)}"
+                )
+    
+    def _store_quote_images_flow(self, chat_id: int, image_paths: List[str]):
+        try:
+            quote_images = yield self._blocking(self.report_generator.add_quote_images, image_paths)
+            user_data = yield self._blocking(self.sessions.get, chat_id)
+            if quote_images and user_data:
+                user_data['quote_images'] = quote_images
+                yield self._blocking(self.sessions.set, chat_id, user_data)
         except Exception as e:
-            logger.error(f"Error processing single photo: {e}")
-            self.bot.send_message(
-                message.chat.id,
-                f"❌ Произошла ошибка при анализе фотографии: {str(e)}"
-            )
+            logger.warning(f"Failed to prepare quote thumbnails: {e}")
     
-    def send_analysis_results(self, chat_id: int):
-        """Отправляет результаты анализа"""
-        user_data = self.user_data.get(chat_id)
+    def _analysis_results_flow(self, chat_id: int):
+        user_data = yield self._blocking(self.sessions.get, chat_id)
         if not user_data:
             return
         
@@ -324,85 +536,135 @@ class BotHandlers:
             user_data['cost_info']
         )
         
-        # Создаем клавиатуру с действиями
-        keyboard = types.InlineKeyboardMarkup(row_width=2)
-        keyboard.add(
-            types.InlineKeyboardButton("📋 Полный отчет", callback_data="full_report"),
-            types.InlineKeyboardButton("📱 Ответ клиенту", callback_data="client_template"),
-            types.InlineKeyboardButton("💰 Изменить цену", callback_data="adjust_price"),
-            types.InlineKeyboardButton("📊 Детали анализа", callback_data="analysis_details"),
-            types.InlineKeyboardButton("🔄 Новый анализ", callback_data="new_analysis")
+        yield self.bot.send_message(
+            chat_id,
+            f"✅ **Анализ WhatsApp чата завершен!**\n\n{quick_summary}",
+            reply_markup=results_keyboard(),
+            parse_mode='Markdown'
+        )
+    
+    def _text_flow(self, message):
+        user_data = yield self._blocking(self.sessions.get, message.chat.id)
+        if not user_data or not user_data.get('awaiting_adjustment'):
+            return
+        
+        try:
+            changes = parse_adjustments(message.text)
+        except AdjustmentError as e:
+            yield self.bot.send_message(message.chat.id, f"❌ {e}\n\n{ADJUSTMENT_EXAMPLE}")
+            return
+        
+        yield from self._repriced_results_flow(message.chat.id, user_data, changes)
+    
+    def _repriced_results_flow(self, chat_id: int, user_data: Dict, changes: Optional[Dict]):
+        with track_stage('adjust', 'pricing'):
+            user_data = reprice(user_data, changes, self.pricing_calculator)
+        yield self._blocking(self.sessions.set, chat_id, user_data)
+        
+        quick_summary = self.report_generator.create_quick_summary(
+            user_data['analysis'],
+            user_data['cost_info']
         )
         
-        self.bot.send_message(
+        yield self.bot.send_message(
             chat_id,
-            f"✅ **Анализ WhatsApp чата завершен!**\n\n{quick_summary}",
-            reply_markup=keyboard,
+            f"✅ **Цена пересчитана**\n\n{quick_summary}",
+            reply_markup=session_keyboard(user_data),
             parse_mode='Markdown'
         )
     
-    def handle_callback_query(self, call):
-        """Обрабатывает нажатия на кнопки"""
+    def _callback_query_flow(self, call):
         try:
-            user_data = self.user_data.get(call.message.chat.id)
+            user_data = yield self._blocking(self.sessions.get, call.message.chat.id)
             
             if call.data == "help":
-                self.handle_help(call.message)
+                yield from self._help_flow(call.message)
             
             elif call.data == "contacts":
-                contact_text = """📞 **КОНТАКТЫ ИВАНА**
-
-👤 Имя: Иван
-📱 Телефон: +972 52-477-2115
-🏠 Специализация: Ремонт полов и паркета
-
-🕒 Время работы: Воскресенье - Четверг, 8:00 - 18:00
-📍 Обслуживаемые районы: Весь Израиль
-
-💬 Для заказа работ звоните или пишите в WhatsApp!"""
-                
-                self.bot.send_message(call.message.chat.id, contact_text, parse_mode='Markdown')
+                yield self.bot.send_message(call.message.chat.id, CONTACTS_TEXT, parse_mode='Markdown')
             
             elif call.data in ["full_report", "detailed_single"] and user_data:
                 # Создаем полный отчет
-                full_report = self.report_generator.create_analysis_report(
-                    user_data['analysis'],
-                    user_data['cost_info'],
-                    user_data['timeline'],
-                    user_data['client_info']
-                )
+                full_report = self.report_generator.render_report(ANALYSIS_REPORT, user_data)
                 
-                self.bot.send_message(call.message.chat.id, full_report, parse_mode='Markdown')
+                yield self.bot.send_message(call.message.chat.id, full_report, parse_mode='Markdown')
             
             elif call.data in ["client_template", "client_template_single"] and user_data:
                 # Создаем шаблон ответа клиенту
-                client_template = self.report_generator.create_client_response_template(
-                    user_data['analysis'],
-                    user_data['cost_info'],
-                    user_data['timeline'],
-                    user_data['client_info']
-                )
+                client_template = self.report_generator.render_report(CLIENT_TEMPLATE, user_data)
                 
-                self.bot.send_message(
+                yield self.bot.send_message(
                     call.message.chat.id, 
                     f"📱 **ШАБЛОН ОТВЕТА КЛИЕНТУ:**\n\n{client_template}",
                     parse_mode='Markdown'
                 )
             
+            elif call.data == "adjust_price" and user_data:
+                # Следующее текстовое сообщение - правки цены
+                user_data['awaiting_adjustment'] = True
+                yield self._blocking(self.sessions.set, call.message.chat.id, user_data)
+                
+                yield self.bot.send_message(
+                    call.message.chat.id,
+                    self.report_generator.create_adjustment_prompt(user_data['analysis'], user_data['cost_info']),
+                    reply_markup=adjustment_keyboard(),
+                    parse_mode='Markdown'
+                )
+            
+            elif call.data.startswith("discount_") and user_data:
+                yield from self._repriced_results_flow(
+                    call.message.chat.id, user_data, {'discount': discount_from_callback(call.data)}
+                )
+            
+            elif call.data == "reset_adjustments" and user_data:
+                yield from self._repriced_results_flow(call.message.chat.id, user_data, None)
+            
+            elif call.data == "analysis_details" and user_data:
+                yield self.bot.send_message(
+                    call.message.chat.id,
+                    self.report_generator.create_analysis_details(user_data['analysis']),
+                    parse_mode='Markdown'
+                )
+            
+            elif call.data == "quote_document" and user_data:
+                # Документ собирается в пуле процессов, здесь только ждем
+                yield self.bot.send_chat_action(call.message.chat.id, 'upload_document')
+                with track_stage('quote', 'render'):
+                    file_name, document = yield self._blocking(self.report_generator.export_quote, user_data)
+                
+                yield self.bot.send_document(
+                    call.message.chat.id, document,
+                    visible_file_name=file_name,
+                    caption="📄 Предложение для клиента"
+                )
+            
             elif call.data == "new_analysis":
                 # Очищаем данные пользователя
-                if call.message.chat.id in self.user_data:
-                    del self.user_data[call.message.chat.id]
+                yield self._blocking(self.sessions.delete, call.message.chat.id)
                 
-                self.bot.send_message(
+                yield self.bot.send_message(
                     call.message.chat.id,
                     "🔄 Готов к новому анализу! Отправьте ZIP архив или фотографии."
                 )
             
             # Подтверждаем обработку callback
-            self.bot.answer_callback_query(call.id)
+            yield self.bot.answer_callback_query(call.id)
             
         except Exception as e:
             logger.error(f"Error handling callback query: {e}")
-            self.bot.answer_callback_query(call.id, "❌ Произошла ошибка")
+            yield self.bot.answer_callback_query(call.id, "❌ Произошла ошибка")
 
+class BotHandlers(BaseBotHandlers):
+    """Обработчики синхронного бота: шаги сценариев выполняются в потоке обновления"""
+    
+    def _run(self, flow: Generator):
+        # Каждый шаг уже выполнен при вызове - возвращаем результат в сценарий
+        result = None
+        try:
+            while True:
+                result = flow.send(result)
+        except StopIteration as stop:
+            return stop.value
+    
+    def _blocking(self, fn: Callable, *args):
+        return fn(*args)
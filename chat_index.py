@@ -0,0 +1,283 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import logging
+from typing import Dict, List, Optional
+
+from config import CHAT_INDEX_DB_PATH, SEARCH_RESULTS_LIMIT
+
+logger = logging.getLogger(__name__)
+
+# Слова: буквы любого алфавита или числа
+TOKEN_PATTERN = re.compile(r'[^\W\d_]+|\d+')
+
+# Огласовки и кантилляция иврита
+HEBREW_MARKS_PATTERN = re.compile('[\u0591-\u05c7]')
+HEBREW_FINAL_LETTERS = str.maketrans('ךםןףץ', 'כמנפצ')
+
+STOP_WORDS = {
+    # русский
+    'и', 'в', 'во', 'на', 'с', 'со', 'по', 'к', 'ко', 'у', 'о', 'об', 'от', 'до', 'за', 'из', 'не', 'но',
+    'а', 'же', 'ли', 'что', 'это', 'как', 'так', 'то', 'я', 'ты', 'он', 'она', 'мы', 'вы', 'они',
+    # English
+    'the', 'a', 'an', 'and', 'or', 'of', 'to', 'in', 'on', 'at', 'is', 'it', 'for', 'with',
+    # иврит
+    'של', 'את', 'על', 'זה', 'עם', 'גם', 'אני', 'הוא', 'היא'
+}
+
+# Окончания, которые отбрасываются (самые длинные проверяются первыми)
+RUSSIAN_ENDINGS = sorted([
+    'ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ость', 'ться', 'тся',
+    'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ый', 'ий', 'ой', 'ом', 'ем', 'ам', 'ям', 'ах', 'ях',
+    'ов', 'ев', 'ей', 'ую', 'юю', 'ть',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й'
+], key=len, reverse=True)
+ENGLISH_ENDINGS = ('ing', 'ed', 's')
+# -es отбрасывается только после шипящих (boxes, glasses); tiles и houses теряют только -s
+ENGLISH_SIBILANTS = ('ss', 'x', 'ch', 'sh', 'zz')
+HEBREW_ENDINGS = ('ים', 'ות')
+
+# Минимальная длина основы после отбрасывания окончания
+MIN_STEM_LENGTH = 3
+
+def _strip_ending(word: str, endings) -> str:
+    for ending in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+def _stem_english(word: str) -> str:
+    if word.endswith('ss'):
+        # glass, class - не множественное число
+        return word
+    if word.endswith(tuple(sibilant + 'es' for sibilant in ENGLISH_SIBILANTS)):
+        return _strip_ending(word, ('es',))
+    return _strip_ending(word, ENGLISH_ENDINGS)
+
+def stem(word: str) -> str:
+    """Простой стемминг: отбрасывает типичное окончание по алфавиту слова"""
+    first = word[0]
+    if '\u0590' <= first <= '\u05ff':
+        return _strip_ending(word.translate(HEBREW_FINAL_LETTERS), HEBREW_ENDINGS)
+    if 'а' <= first <= 'я':
+        return _strip_ending(word, RUSSIAN_ENDINGS)
+    if 'a' <= first <= 'z':
+        return _stem_english(word)
+    return word
+
+def tokenize(text: str) -> List[str]:
+    """Разбивает текст на основы слов (русский, иврит, английский)"""
+    text = HEBREW_MARKS_PATTERN.sub('', text.lower().replace('ё', 'е'))
+    return [stem(token) for token in TOKEN_PATTERN.findall(text) if token not in STOP_WORDS]
+
+def _message_digest(msg: Dict) -> int:
+    """Отпечаток сообщения - повторный экспорт того же чата не дублирует сообщения"""
+    raw = f"{msg['timestamp']}\x00{msg['sender']}\x00{msg['message']}".encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(raw, digest_size=8).digest(), 'big', signed=True)
+
+def _client_key(client_info: Dict, messages) -> str:
+    """
+    Ключ переписки внутри чата Telegram: имя клиента, а у экспортов без
+    имени - телефон или отпечаток первого сообщения, чтобы разные
+    безымянные переписки не сливались в одну
+    """
+    if client_info.get('name'):
+        return f"name:{client_info['name']}"
+    if client_info.get('phone'):
+        return f"phone:{client_info['phone']}"
+    for msg in messages:
+        if not msg['is_system']:
+            return f"chat:{_message_digest(msg)}"
+    return 'chat:empty'
+
+class ChatIndex:
+    """
+    Поисковый индекс по сообщениям всех обработанных экспортов WhatsApp.
+
+    Хранится в SQLite: сообщения с привязкой к переписке (чат Telegram +
+    клиент) и обратный индекс FTS5 по основам слов. Токенизация и стемминг
+    выполняются здесь же, FTS5 хранит готовые основы и ранжирует по BM25.
+    Новый экспорт добавляет только сообщения, которых еще нет в индексе.
+    """
+
+    # Сколько самых свежих совпадений ранжируется при поиске
+    SEARCH_CANDIDATES = 500
+
+    def __init__(self, db_path: Optional[str] = CHAT_INDEX_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+
+        if self.db_path:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            with self._connection() as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS conversations (
+                        id INTEGER PRIMARY KEY,
+                        owner_chat_id INTEGER NOT NULL,
+                        client_key TEXT NOT NULL,
+                        client_name TEXT NOT NULL,
+                        phone TEXT,
+                        address TEXT,
+                        updated_at REAL NOT NULL,
+                        UNIQUE (owner_chat_id, client_key)
+                    )
+                """)
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS messages (
+                        id INTEGER PRIMARY KEY,
+                        conversation_id INTEGER NOT NULL,
+                        digest INTEGER NOT NULL,
+                        timestamp TEXT NOT NULL,
+                        sender TEXT NOT NULL,
+                        message TEXT NOT NULL,
+                        UNIQUE (conversation_id, digest)
+                    )
+                """)
+                # Индекс без копии текста: сам текст лежит в messages
+                conn.execute("""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS message_terms USING fts5(
+                        terms, content='', tokenize='unicode61 remove_diacritics 0'
+                    )
+                """)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Отдельное соединение на каждый поток"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add_export(self, owner_chat_id: int, parse_result: Dict) -> int:
+        """
+        Добавляет сообщения разобранного экспорта в индекс
+
+        Args:
+            owner_chat_id: Чат Telegram, из которого прислан экспорт
+            parse_result: Результат WhatsAppParser.process_whatsapp_export
+
+        Returns:
+            Количество новых проиндексированных сообщений
+        """
+        if not self.db_path:
+            return 0
+
+        client_info = parse_result.get('client_info', {})
+        client_name = client_info.get('name') or ''
+        client_key = _client_key(client_info, parse_result.get('chat_messages', []))
+
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute("""
+                    INSERT INTO conversations (owner_chat_id, client_key, client_name, phone, address, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (owner_chat_id, client_key) DO UPDATE SET
+                        phone = COALESCE(excluded.phone, phone),
+                        address = COALESCE(excluded.address, address),
+                        updated_at = excluded.updated_at
+                """, (owner_chat_id, client_key, client_name, client_info.get('phone'),
+                      client_info.get('address'), time.time()))
+                conversation_id = conn.execute(
+                    "SELECT id FROM conversations WHERE owner_chat_id = ? AND client_key = ?",
+                    (owner_chat_id, client_key)
+                ).fetchone()[0]
+
+                added = 0
+                for msg in parse_result.get('chat_messages', []):
+                    if msg['is_system'] or msg['is_media']:
+                        continue
+                    terms = tokenize(msg['message'])
+                    if not terms:
+                        continue
+
+                    cursor = conn.execute("""
+                        INSERT OR IGNORE INTO messages (conversation_id, digest, timestamp, sender, message)
+                        VALUES (?, ?, ?, ?, ?)
+                    """, (conversation_id, _message_digest(msg), msg['timestamp'], msg['sender'], msg['message']))
+                    if cursor.rowcount:
+                        conn.execute(
+                            "INSERT INTO message_terms (rowid, terms) VALUES (?, ?)",
+                            (cursor.lastrowid, ' '.join(terms))
+                        )
+                        added += 1
+            return added
+
+        except sqlite3.Error as e:
+            # Поиск - вспомогательная функция, анализ продолжается без него
+            logger.warning(f"Failed to index chat export: {e}")
+            return 0
+
+    def search(self, owner_chat_id: int, query: str, limit: int = SEARCH_RESULTS_LIMIT) -> List[Dict]:
+        """
+        Ищет сообщения по запросу в переписках чата
+
+        Сначала ищутся сообщения со всеми словами запроса, затем - с любым.
+        Из самых свежих совпадений (SEARCH_CANDIDATES) выбирается лучшее
+        сообщение каждой переписки. Совпадения со всеми словами идут раньше
+        совпадений с частью слов, внутри каждой группы - по BM25.
+        Свежие совпадения читаются из индекса по порядку, поэтому частые
+        слова не замедляют поиск.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not self.db_path or not terms:
+            return []
+
+        # Основы состоят только из букв и цифр, кавычки нужны против ключевых слов FTS5
+        quoted = [f'"{term}"' for term in terms]
+        hits = {}
+        for matched_all, match in ((True, ' AND '.join(quoted)), (False, ' OR '.join(quoted))):
+            for hit in self._candidates(owner_chat_id, match):
+                hit['matched_all'] = matched_all
+                best = hits.get(hit['conversation_id'])
+                if best is None or self._rank(hit) > self._rank(best):
+                    hits[hit['conversation_id']] = hit
+            # Для одного слова запросы AND и OR совпадают
+            if len(hits) >= limit or len(quoted) == 1:
+                break
+
+        ranked = sorted(hits.values(), key=self._rank, reverse=True)[:limit]
+        for hit in ranked:
+            del hit['conversation_id']
+            del hit['matched_all']
+        return ranked
+
+    @staticmethod
+    def _rank(hit: Dict):
+        return hit['matched_all'], hit['score']
+
+    def _candidates(self, owner_chat_id: int, match: str) -> List[Dict]:
+        """Самые свежие совпадения с запросом FTS5"""
+        rows = self._connection().execute("""
+            SELECT m.conversation_id, c.client_name, c.phone, m.timestamp, m.sender, m.message, bm25(message_terms)
+            FROM message_terms
+            JOIN messages m ON m.id = message_terms.rowid
+            JOIN conversations c ON c.id = m.conversation_id
+            WHERE message_terms MATCH ? AND c.owner_chat_id = ?
+            ORDER BY message_terms.rowid DESC
+            LIMIT ?
+        """, (match, owner_chat_id, self.SEARCH_CANDIDATES)).fetchall()
+
+        return [{
+            'conversation_id': conversation_id,
+            'client_name': client_name or None,
+            'phone': phone,
+            'timestamp': timestamp,
+            'sender': sender,
+            'message': message,
+            'score': -score  # bm25() в SQLite отрицательный: меньше - лучше
+        } for conversation_id, client_name, phone, timestamp, sender, message, score in rows]
+
+    def stats(self) -> Dict:
+        if not self.db_path:
+            return {'conversations': 0, 'messages': 0}
+        conn = self._connection()
+        return {
+            'conversations': conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0],
+            'messages': conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        }
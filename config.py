@@ -9,10 +9,94 @@ BOT_TOKEN = "8346136918:AAHwREKIctQJSuWWBySju7naWT_FiDdJBwo"
 # Anthropic Configuration
 ANTHROPIC_API_KEY = os.getenv('ANTHROPIC_API_KEY', '')
 
+# AI Analysis Configuration
+ANALYSIS_CONCURRENCY = int(os.getenv('ANALYSIS_CONCURRENCY', 4))  # одновременных запросов к Claude
+ANALYSIS_MAX_RETRIES = int(os.getenv('ANALYSIS_MAX_RETRIES', 3))  # повторов при 429/529
+PROMPT_CACHING_ENABLED = os.getenv('PROMPT_CACHING_ENABLED', '1') == '1'
+ANALYSIS_BATCH_SIZE = int(os.getenv('ANALYSIS_BATCH_SIZE', 1))  # изображений в одном запросе (1 - по одному)
+IMAGE_PAYLOAD_BUDGET = int(os.getenv('IMAGE_PAYLOAD_BUDGET_MB', 128)) * 1024 * 1024  # фото в обработке и в запросах
+
+# Analysis Cache Configuration
+ANALYSIS_CACHE_ENABLED = os.getenv('ANALYSIS_CACHE_ENABLED', '1') == '1'
+ANALYSIS_CACHE_DIR = os.getenv('ANALYSIS_CACHE_DIR', '/tmp/vanya_cache/analysis')
+ANALYSIS_CACHE_MEMORY_ENTRIES = int(os.getenv('ANALYSIS_CACHE_MEMORY_ENTRIES', 256))
+ANALYSIS_CACHE_DISK_MB = int(os.getenv('ANALYSIS_CACHE_DISK_MB', 100))
+ANALYSIS_CACHE_TTL = int(os.getenv('ANALYSIS_CACHE_TTL', 30 * 24 * 3600))  # 30 дней
+
+# Image Pre-processing Configuration
+IMAGE_MAX_EDGE = int(os.getenv('IMAGE_MAX_EDGE', 1568))  # px, длинная сторона
+IMAGE_OUTPUT_FORMAT = os.getenv('IMAGE_OUTPUT_FORMAT', 'JPEG')  # JPEG или WEBP
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', 85))
+IMAGE_PREPROCESS_WORKERS = int(os.getenv('IMAGE_PREPROCESS_WORKERS', 2))
+
+# Near-duplicate Media Detection
+MEDIA_DEDUP_ENABLED = os.getenv('MEDIA_DEDUP_ENABLED', '1') == '1'
+MEDIA_DEDUP_METHOD = os.getenv('MEDIA_DEDUP_METHOD', 'phash')  # ahash/dhash/phash
+MEDIA_DEDUP_THRESHOLD = int(os.getenv('MEDIA_DEDUP_THRESHOLD', 6))  # бит из 64
+
+# Progress Updates Configuration
+PROGRESS_EDIT_INTERVAL = float(os.getenv('PROGRESS_EDIT_INTERVAL', 3.0))  # секунд между правками статуса
+
+# Image Selection Configuration
+IMAGE_SELECTION_MAX_IMAGES = int(os.getenv('IMAGE_SELECTION_MAX_IMAGES', 12))  # 0 - отправлять все
+IMAGE_SELECTION_CONTEXT_WINDOW = int(os.getenv('IMAGE_SELECTION_CONTEXT_WINDOW', 10))  # сообщений
+
+# Message Classification Configuration
+# Медиа и системные признаки ищутся с учетом регистра, остальные ключевые слова - без
+MEDIA_INDICATORS = [
+    '<Media omitted>',
+    'audio omitted',
+    'video omitted',
+    'image omitted',
+    'document omitted',
+    'Медиафайл пропущен',
+    'Аудио пропущено'
+]
+SYSTEM_INDICATORS = [
+    'Messages and calls are end-to-end encrypted',
+    'создал группу',
+    'покинул группу',
+    'изменил тему группы',
+    'added',
+    'left',
+    'changed the group'
+]
+FLOOR_KEYWORDS = ['пол', 'паркет', 'ламинат', 'плитка', 'линолеум', 'покрытие']
+ADDRESS_KEYWORDS = ['адрес', 'улица', 'дом', 'квартира']
+PHONE_PATTERN = r'[\+]?[0-9\-\s\(\)]{10,}'
+
 # File Upload Configuration
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
 UPLOAD_FOLDER = '/tmp/vanya_uploads'
 ALLOWED_EXTENSIONS = {'.zip'}
+MAX_EXTRACT_SIZE = int(os.getenv('MAX_EXTRACT_SIZE_MB', 200)) * 1024 * 1024  # распакованные медиафайлы
+
+# Telegram Download Configuration
+DOWNLOAD_MEMORY_BUDGET = int(os.getenv('DOWNLOAD_MEMORY_BUDGET_MB', 8)) * 1024 * 1024  # больше - на диск
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+DOWNLOAD_POOL_SIZE = int(os.getenv('DOWNLOAD_POOL_SIZE', 8))  # keep-alive соединений
+DOWNLOAD_TIMEOUT = int(os.getenv('DOWNLOAD_TIMEOUT', 60))
+
+# Session Storage Configuration
+SESSION_DB_PATH = os.getenv('SESSION_DB_PATH', '/tmp/vanya_data/sessions.sqlite3')  # пусто - только память
+SESSION_MEMORY_ENTRIES = int(os.getenv('SESSION_MEMORY_ENTRIES', 200))
+SESSION_TTL = int(os.getenv('SESSION_TTL', 7 * 24 * 3600))  # 7 дней
+
+# Chat Search Configuration
+CHAT_INDEX_DB_PATH = os.getenv('CHAT_INDEX_DB_PATH', '/tmp/vanya_data/chat_index.sqlite3')  # пусто - без индекса
+SEARCH_RESULTS_LIMIT = int(os.getenv('SEARCH_RESULTS_LIMIT', 10))
+
+# Report Configuration
+REPORT_LOCALE = os.getenv('REPORT_LOCALE', 'ru')
+REPORT_CACHE_ENTRIES = int(os.getenv('REPORT_CACHE_ENTRIES', 512))  # готовых отчетов в памяти
+
+# Quote Export Configuration
+QUOTE_EXPORT_FORMAT = os.getenv('QUOTE_EXPORT_FORMAT', 'pdf')  # pdf или html
+QUOTE_EXPORT_CONCURRENCY = int(os.getenv('QUOTE_EXPORT_CONCURRENCY', 4))  # задач экспорта в пуле изображений одновременно
+QUOTE_PDF_FONT = os.getenv('QUOTE_PDF_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')  # с кириллицей
+QUOTE_THUMBNAIL_DIR = os.getenv('QUOTE_THUMBNAIL_DIR', '/tmp/vanya_cache/thumbnails')
+QUOTE_THUMBNAIL_EDGE = int(os.getenv('QUOTE_THUMBNAIL_EDGE', 480))  # px, длинная сторона
+QUOTE_THUMBNAIL_TTL = int(os.getenv('QUOTE_THUMBNAIL_TTL', 7 * 24 * 3600))  # как у сессий
 
 # Analysis Configuration
 SUPPORTED_IMAGE_FORMATS = {'.jpg', '.jpeg', '.png', '.webp'}
@@ -0,0 +1,158 @@
+import os
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from config import MEDIA_DEDUP_METHOD, MEDIA_DEDUP_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8
+
+def _load_grayscale(image_path: str, size: Tuple[int, int]) -> np.ndarray:
+    """Загружает изображение в оттенках серого заданного размера (ширина, высота)"""
+    with Image.open(image_path) as image:
+        # JPEG декодируется сразу в уменьшенном масштабе (1/2-1/8), без полного разрешения
+        image.draft('L', size)
+        image = image.convert('L').resize(size, Image.LANCZOS)
+        return np.asarray(image, dtype=np.float64)
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.flatten().astype(np.uint8)).tobytes(), 'big')
+
+def average_hash(image_path: str) -> int:
+    """aHash: пиксели 8x8 сравниваются со средней яркостью"""
+    pixels = _load_grayscale(image_path, (HASH_SIZE, HASH_SIZE))
+    return _bits_to_int(pixels > pixels.mean())
+
+def difference_hash(image_path: str) -> int:
+    """dHash: знак горизонтального градиента на сетке 9x8"""
+    pixels = _load_grayscale(image_path, (HASH_SIZE + 1, HASH_SIZE))
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n).reshape(-1, 1)
+    i = np.arange(n).reshape(1, -1)
+    return np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+
+_DCT_32 = _dct_matrix(HASH_SIZE * 4)
+
+def perceptual_hash(image_path: str) -> int:
+    """pHash: низкочастотные коэффициенты DCT 32x32 сравниваются с медианой"""
+    pixels = _load_grayscale(image_path, (HASH_SIZE * 4, HASH_SIZE * 4))
+    dct = _DCT_32 @ pixels @ _DCT_32.T
+    low = dct[:HASH_SIZE, :HASH_SIZE]
+    # Постоянная составляющая не участвует в медиане
+    median = np.median(low.flatten()[1:])
+    return _bits_to_int(low > median)
+
+HASH_FUNCTIONS = {
+    'ahash': average_hash,
+    'dhash': difference_hash,
+    'phash': perceptual_hash
+}
+
+def hamming_distances(value: int, others: np.ndarray) -> np.ndarray:
+    """Расстояния Хэмминга от value до массива 64-битных хэшей"""
+    xor = np.bitwise_xor(others, np.uint64(value))
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+class ImageDeduplicator:
+    """
+    Находит почти одинаковые фото (серии, пересылки, сжатые копии)
+    по перцептивному хэшу и оставляет одно изображение на группу.
+    """
+
+    def __init__(self, method: str = MEDIA_DEDUP_METHOD, threshold: int = MEDIA_DEDUP_THRESHOLD):
+        if method not in HASH_FUNCTIONS:
+            raise ValueError(f"Unknown hash method: {method}")
+        self.method = method
+        self.hash_function = HASH_FUNCTIONS[method]
+        self.threshold = threshold
+
+    def deduplicate(self, media_files: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Группирует изображения с расстоянием Хэмминга не больше threshold
+
+        Returns:
+            (медиафайлы без дубликатов, список отброшенных дубликатов)
+        """
+        clusters = []  # [{'hash': int, 'members': [(file, distance)]}]
+        leader_hashes = np.empty(0, dtype=np.uint64)
+        unhashed = []
+
+        for media_file in media_files:
+            if media_file['type'] != 'image':
+                continue
+
+            try:
+                image_hash = self.hash_function(media_file['path'])
+            except Exception as e:
+                logger.warning(f"Failed to hash {media_file['name']}: {e}")
+                unhashed.append(media_file)
+                continue
+            # Хэш нужен и при отборе фото (ImageSelector) - второй раз файл не декодируется
+            media_file.setdefault('image_hashes', {})[self.method] = image_hash
+
+            cluster_index = None
+            distance = 0
+            if len(leader_hashes):
+                distances = hamming_distances(image_hash, leader_hashes)
+                nearest = int(np.argmin(distances))
+                if distances[nearest] <= self.threshold:
+                    cluster_index = nearest
+                    distance = int(distances[nearest])
+
+            if cluster_index is None:
+                clusters.append({'hash': image_hash, 'members': [(media_file, 0)]})
+                leader_hashes = np.append(leader_hashes, np.uint64(image_hash))
+            else:
+                clusters[cluster_index]['members'].append((media_file, distance))
+
+        representatives = {}
+        duplicates = []
+        for cluster in clusters:
+            members = cluster['members']
+            if len(members) == 1:
+                representative = members[0][0]
+            else:
+                representative = max(members, key=lambda member: self._quality_key(member[0]))[0]
+            representatives[id(representative)] = len(members) - 1
+            for media_file, distance in members:
+                if media_file is not representative:
+                    duplicates.append({
+                        'name': media_file['name'],
+                        'duplicate_of': representative['name'],
+                        'distance': distance,
+                        'hash_method': self.method
+                    })
+
+        # Сохраняем исходный порядок файлов
+        unique_files = []
+        unhashed_ids = {id(f) for f in unhashed}
+        for media_file in media_files:
+            if media_file['type'] != 'image' or id(media_file) in unhashed_ids:
+                unique_files.append(media_file)
+            elif id(media_file) in representatives:
+                media_file['duplicates_dropped'] = representatives[id(media_file)]
+                unique_files.append(media_file)
+
+        if duplicates:
+            logger.info(f"Dropped {len(duplicates)} near-duplicate images")
+
+        return unique_files, duplicates
+
+    def _quality_key(self, media_file: Dict) -> Tuple[int, int]:
+        """Лучшая копия - с наибольшим разрешением, затем с наибольшим размером файла"""
+        try:
+            with Image.open(media_file['path']) as image:
+                resolution = image.size[0] * image.size[1]
+        except Exception:
+            resolution = 0
+        try:
+            file_size = os.path.getsize(media_file['path'])
+        except OSError:
+            file_size = 0
+        return resolution, file_size
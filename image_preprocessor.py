@@ -0,0 +1,154 @@
+import io
+import os
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+
+from PIL import Image, ImageOps
+
+from config import (
+    IMAGE_MAX_EDGE, IMAGE_OUTPUT_FORMAT, IMAGE_QUALITY, IMAGE_PREPROCESS_WORKERS
+)
+
+logger = logging.getLogger(__name__)
+
+MEDIA_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp'
+}
+
+def guess_media_type(image_path: str) -> str:
+    """Определяет MIME тип изображения по расширению"""
+    path = image_path.lower()
+    if path.endswith('.png'):
+        return "image/png"
+    elif path.endswith('.webp'):
+        return "image/webp"
+    return "image/jpeg"
+
+def prepare_image(image_path: str, max_edge: int, output_format: str, quality: int) -> Dict:
+    """
+    Поворачивает изображение по EXIF, уменьшает длинную сторону до max_edge
+    и перекодирует в output_format. Выполняется в отдельном процессе.
+    """
+    with Image.open(image_path) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        if output_format == 'JPEG' and image.mode != 'RGB':
+            # JPEG не поддерживает прозрачность - кладем на белый фон
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+                image = image.convert('RGBA')
+                background.paste(image, mask=image.split()[-1])
+            else:
+                background.paste(image.convert('RGB'))
+            image = background
+
+        buffer = io.BytesIO()
+        image.save(buffer, format=output_format, quality=quality, optimize=True)
+        width, height = image.size
+
+    return {
+        'data': buffer.getvalue(),
+        'media_type': MEDIA_TYPES[output_format],
+        'width': width,
+        'height': height
+    }
+
+class ProcessPool:
+    """
+    Пул процессов для работы с изображениями. Процессы запускаются
+    при первой задаче; если пул сломался (например, процесс убит
+    по памяти), следующая задача создает новый.
+    """
+
+    def __init__(self, workers: int = IMAGE_PREPROCESS_WORKERS):
+        self.workers = max(1, workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args) -> Future:
+        with self._lock:
+            for attempt in range(2):
+                if self._executor is None:
+                    # spawn: процесс бота многопоточный, fork после запуска потоков небезопасен.
+                    # Рабочие процессы заново импортируют главный модуль, поэтому бот
+                    # запускается через python -c (см. Procfile) и не поднимается в них
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn')
+                    )
+                try:
+                    return self._executor.submit(fn, *args)
+                except BrokenProcessPool as e:
+                    if attempt:
+                        raise
+                    logger.warning(f"Image process pool broken, recreating: {e}")
+                    self._executor.shutdown(wait=False)
+                    self._executor = None
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+# Один пул на процесс бота: его используют ImagePreprocessor и QuoteExporter
+SHARED_POOL = ProcessPool()
+
+class ImagePreprocessor:
+    """Готовит изображения к отправке в модель в пуле процессов"""
+
+    def __init__(self, max_edge: int = IMAGE_MAX_EDGE, output_format: str = IMAGE_OUTPUT_FORMAT,
+                 quality: int = IMAGE_QUALITY, pool: Optional[ProcessPool] = None):
+        self.max_edge = max_edge
+        self.output_format = output_format.upper()
+        self.quality = quality
+        self.pool = pool or SHARED_POOL
+
+        if self.output_format not in MEDIA_TYPES:
+            raise ValueError(f"Unsupported image output format: {output_format}")
+
+    def prepare(self, image_path: str, original_data: bytes) -> Dict:
+        """
+        Возвращает данные для отправки в модель
+
+        Args:
+            image_path: Путь к изображению
+            original_data: Исходные байты (используются, если обработка не удалась
+                или не уменьшила размер)
+
+        Returns:
+            Dict с data, media_type и статистикой original_bytes/processed_bytes/bytes_saved
+        """
+        original_size = len(original_data)
+        try:
+            future = self.pool.submit(
+                prepare_image, image_path, self.max_edge, self.output_format, self.quality
+            )
+            prepared = future.result()
+        except Exception as e:
+            logger.warning(f"Image preprocessing failed for {os.path.basename(image_path)}: {e}")
+            prepared = None
+
+        if prepared is None or len(prepared['data']) >= original_size:
+            prepared = {
+                'data': original_data,
+                'media_type': guess_media_type(image_path)
+            }
+
+        processed_size = len(prepared['data'])
+        prepared.update({
+            'original_bytes': original_size,
+            'processed_bytes': processed_size,
+            'bytes_saved': original_size - processed_size
+        })
+        return prepared
+
+    def shutdown(self):
+        self.pool.shutdown()
@@ -0,0 +1,194 @@
+import re
+import bisect
+import logging
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from config import IMAGE_SELECTION_MAX_IMAGES, IMAGE_SELECTION_CONTEXT_WINDOW
+from image_dedup import HASH_SIZE, perceptual_hash, hamming_distances
+from message_classifier import MessageClassifier, FLOOR
+from message_store import MessageStore
+
+logger = logging.getLogger(__name__)
+
+# Имена вложений в тексте чата: "IMG-20240115-WA0003.jpg (file attached)", "<attached: 00000034-PHOTO-....jpg>"
+ATTACHMENT_PATTERN = re.compile(r'[\w\-]+\.(?:jpe?g|png|webp)', re.IGNORECASE)
+
+# Длинная сторона, до которой уменьшается фото для оценки резкости
+SHARPNESS_EDGE = 512
+
+# Дисперсия лапласиана, при которой оценка резкости равна 0.5 (ниже - обычно смаз)
+SHARPNESS_REFERENCE = 100.0
+
+# Разрешение, начиная с которого оценка разрешения максимальна
+RESOLUTION_REFERENCE = 1024 * 768
+
+def laplacian_variance(pixels: np.ndarray) -> float:
+    """Дисперсия дискретного лапласиана - чем больше, тем резче изображение"""
+    if pixels.shape[0] < 3 or pixels.shape[1] < 3:
+        return 0.0
+    laplacian = (
+        pixels[:-2, 1:-1] + pixels[2:, 1:-1] + pixels[1:-1, :-2] + pixels[1:-1, 2:]
+        - 4 * pixels[1:-1, 1:-1]
+    )
+    return float(laplacian.var())
+
+def measure_image(image_path: str) -> Dict:
+    """Резкость и разрешение изображения"""
+    with Image.open(image_path) as image:
+        width, height = image.size
+        # JPEG декодируется сразу в уменьшенном масштабе, до поворота и перевода в серый
+        image.draft('L', (SHARPNESS_EDGE, SHARPNESS_EDGE))
+        image = ImageOps.exif_transpose(image).convert('L')
+        image.thumbnail((SHARPNESS_EDGE, SHARPNESS_EDGE))
+        pixels = np.asarray(image, dtype=np.float64)
+
+    return {
+        'width': width,
+        'height': height,
+        'sharpness': laplacian_variance(pixels)
+    }
+
+class ImageSelector:
+    """
+    Выбирает не больше max_images изображений для отправки в модель.
+
+    Каждое фото получает локальную оценку: резкость (дисперсия лапласиана),
+    разрешение и близость в переписке к сообщениям о полах. Затем фото
+    выбираются жадно, со штрафом за сходство (pHash) с уже выбранными,
+    чтобы одна и та же комната с разных ракурсов не заняла все места.
+    """
+
+    def __init__(self, max_images: int = IMAGE_SELECTION_MAX_IMAGES,
+                 context_window: int = IMAGE_SELECTION_CONTEXT_WINDOW,
+                 classifier: Optional[MessageClassifier] = None,
+                 sharpness_weight: float = 0.4, resolution_weight: float = 0.2,
+                 context_weight: float = 0.4, diversity_weight: float = 0.5):
+        self.max_images = max_images
+        self.context_window = max(1, context_window)
+        # Признаки сообщений для списков без готовой классификации
+        self.classifier = classifier or MessageClassifier()
+        self.sharpness_weight = sharpness_weight
+        self.resolution_weight = resolution_weight
+        self.context_weight = context_weight
+        self.diversity_weight = diversity_weight
+
+    def select(self, media_files: List[Dict], chat_messages: Optional[Sequence[Dict]] = None) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Оставляет лучшие изображения, остальные медиафайлы не трогает
+
+        Returns:
+            (медиафайлы с выбранными изображениями в исходном порядке,
+             список не выбранных изображений с оценками)
+        """
+        images = [f for f in media_files if f['type'] == 'image']
+        if self.max_images <= 0 or len(images) <= self.max_images:
+            return media_files, []
+
+        context_scores = self._context_scores(images, chat_messages or [])
+
+        scores = []
+        hashes = []
+        for image_file, context_score in zip(images, context_scores):
+            try:
+                measurements = measure_image(image_file['path'])
+                # pHash обычно уже посчитан при поиске дубликатов
+                image_hash = image_file.get('image_hashes', {}).get('phash')
+                if image_hash is None:
+                    image_hash = perceptual_hash(image_file['path'])
+            except Exception as e:
+                logger.warning(f"Failed to score {image_file['name']}: {e}")
+                scores.append(0.0)
+                hashes.append(None)
+                continue
+
+            sharpness_score = measurements['sharpness'] / (measurements['sharpness'] + SHARPNESS_REFERENCE)
+            resolution_score = min(1.0, measurements['width'] * measurements['height'] / RESOLUTION_REFERENCE)
+            scores.append(
+                self.sharpness_weight * sharpness_score
+                + self.resolution_weight * resolution_score
+                + self.context_weight * context_score
+            )
+            hashes.append(image_hash)
+
+        chosen = self._pick_diverse(scores, hashes)
+
+        selected_ids = set()
+        skipped = []
+        for index, image_file in enumerate(images):
+            if index in chosen:
+                image_file['selection_score'] = round(scores[index], 3)
+                selected_ids.add(id(image_file))
+            else:
+                skipped.append({'name': image_file['name'], 'score': round(scores[index], 3)})
+
+        # Сохраняем исходный порядок файлов
+        selected_files = [f for f in media_files if f['type'] != 'image' or id(f) in selected_ids]
+
+        logger.info(f"Selected {len(chosen)} of {len(images)} images for analysis")
+        return selected_files, skipped
+
+    def _pick_diverse(self, scores: List[float], hashes: List[Optional[int]]) -> set:
+        """Жадный выбор: оценка минус штраф за сходство с уже выбранными"""
+        chosen = set()
+        chosen_hashes = np.empty(0, dtype=np.uint64)
+        hash_bits = HASH_SIZE * HASH_SIZE
+
+        while len(chosen) < self.max_images:
+            best_index, best_value = None, -math.inf
+            for index, score in enumerate(scores):
+                if index in chosen:
+                    continue
+                value = score
+                if hashes[index] is not None and len(chosen_hashes):
+                    nearest = int(hamming_distances(hashes[index], chosen_hashes).min())
+                    # Расстояние больше половины бит - изображения не похожи
+                    similarity = max(0.0, 1.0 - nearest / (hash_bits / 2))
+                    value -= self.diversity_weight * similarity
+                if value > best_value:
+                    best_index, best_value = index, value
+
+            chosen.add(best_index)
+            if hashes[best_index] is not None:
+                chosen_hashes = np.append(chosen_hashes, np.uint64(hashes[best_index]))
+
+        return chosen
+
+    def _context_scores(self, images: List[Dict], chat_messages: Sequence[Dict]) -> List[float]:
+        """
+        Близость фото к сообщениям о полах: 1 - рядом с таким сообщением,
+        затухает с расстоянием в сообщениях. 0.5, если фото не найдено в чате.
+        """
+        # Хранилище парсера отдает тексты и признаки столбцами: сообщения о полах
+        # уже отмечены FLOOR при разборе, повторный поиск ключевых слов не нужен
+        if isinstance(chat_messages, MessageStore):
+            texts, flags = chat_messages.texts, chat_messages.flags
+        else:
+            texts = [message['message'] for message in chat_messages]
+            flags = self.classifier.classify_many(texts)
+
+        attachment_positions = {}
+        floor_positions = []
+        for position, (text, message_flags) in enumerate(zip(texts, flags)):
+            for name in ATTACHMENT_PATTERN.findall(text):
+                attachment_positions.setdefault(name.lower(), position)
+            if message_flags & FLOOR:
+                floor_positions.append(position)
+
+        scores = []
+        for image_file in images:
+            position = attachment_positions.get(image_file['name'].lower())
+            if position is None or not floor_positions:
+                scores.append(0.5)
+                continue
+
+            index = bisect.bisect_left(floor_positions, position)
+            distance = min(
+                abs(floor_positions[i] - position)
+                for i in (index - 1, index) if 0 <= i < len(floor_positions)
+            )
+            scores.append(math.exp(-distance / self.context_window))
+        return scores
@@ -0,0 +1,121 @@
+import queue
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class UpdateDispatcher:
+    """
+    Фоновая очередь обновлений Telegram.
+
+    Webhook только кладет обновление в очередь и сразу отвечает Telegram,
+    а пул рабочих потоков обрабатывает обновления через переданный handler.
+    """
+
+    def __init__(self, handler: Callable[[Any], None], workers: int = 4, max_queue_size: int = 0):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._started = False
+
+        # Статистика очереди
+        self._in_flight = 0
+        self._processed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._dequeued = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._last_wait = 0.0
+
+    def start(self):
+        """Запускает рабочие потоки"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker_loop,
+                name=f"update-worker-{i + 1}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+        logger.info(f"Update dispatcher started with {self.workers} workers")
+
+    def submit(self, update: Any) -> bool:
+        """
+        Ставит обновление в очередь без ожидания
+
+        Returns:
+            False если очередь переполнена
+        """
+        try:
+            self._queue.put_nowait((time.monotonic(), update))
+            return True
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            logger.warning("Update queue is full, rejecting update")
+            return False
+
+    def stop(self, timeout: Optional[float] = None):
+        """Останавливает рабочие потоки после обработки уже принятых обновлений"""
+        for _ in self._threads:
+            self._queue.put((None, None))
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        with self._lock:
+            self._started = False
+
+    def _worker_loop(self):
+        """Основной цикл рабочего потока"""
+        while True:
+            enqueued_at, update = self._queue.get()
+            if enqueued_at is None:
+                self._queue.task_done()
+                break
+
+            wait_time = time.monotonic() - enqueued_at
+            with self._lock:
+                self._in_flight += 1
+                self._dequeued += 1
+                self._total_wait += wait_time
+                self._max_wait = max(self._max_wait, wait_time)
+                self._last_wait = wait_time
+
+            try:
+                self.handler(update)
+                with self._lock:
+                    self._processed += 1
+            except Exception as e:
+                logger.error(f"Error processing queued update: {e}")
+                with self._lock:
+                    self._failed += 1
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+                self._queue.task_done()
+
+    def stats(self) -> Dict:
+        """Возвращает состояние очереди"""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_depth': self._queue.qsize(),
+                'in_flight': self._in_flight,
+                'processed': self._processed,
+                'failed': self._failed,
+                'rejected': self._rejected,
+                'avg_wait_seconds': round(self._total_wait / self._dequeued, 4) if self._dequeued else 0.0,
+                'max_wait_seconds': round(self._max_wait, 4),
+                'last_wait_seconds': round(self._last_wait, 4)
+            }
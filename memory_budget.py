@@ -0,0 +1,205 @@
+import asyncio
+import threading
+import weakref
+import logging
+from collections import deque
+from typing import Deque, List
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Все созданные бюджеты - для метрик
+_BUDGETS = weakref.WeakSet()
+
+def _total(attribute: str) -> float:
+    return sum(getattr(budget, attribute) for budget in list(_BUDGETS))
+
+REGISTRY.gauge('vanya_memory_budget_limit_bytes', 'Memory budget for image payloads').set_function(
+    lambda: _total('limit_bytes')
+)
+REGISTRY.gauge('vanya_memory_budget_reserved_bytes', 'Bytes reserved by image payloads in flight').set_function(
+    lambda: _total('reserved')
+)
+REGISTRY.gauge('vanya_memory_budget_waiting', 'Image payloads waiting for the memory budget').set_function(
+    lambda: _total('waiting')
+)
+BUDGET_WAITS = REGISTRY.counter('vanya_memory_budget_waits_total', 'Image payloads that had to wait for the budget')
+
+def base64_size(nbytes: int) -> int:
+    """Длина base64 строки для nbytes байт"""
+    return 4 * ((nbytes + 2) // 3)
+
+def payload_estimate(file_size: int) -> int:
+    """
+    Верхняя оценка памяти на изображение до отправки: исходные байты,
+    уменьшенная копия (не больше исходной), base64 строка и ее копия
+    в теле JSON запроса
+    """
+    return 2 * file_size + 2 * base64_size(file_size)
+
+def request_payload_size(base64_chars: int) -> int:
+    """Память на готовое изображение в запросе: base64 строка и тело JSON"""
+    return 2 * base64_chars
+
+class Reservation:
+    """Байты, занятые в MemoryBudget; освобождаются при выходе из with"""
+
+    def __init__(self, budget: 'MemoryBudget', nbytes: int):
+        self.budget = budget
+        self.requested = nbytes
+        self.nbytes = 0
+
+    def __enter__(self):
+        self.nbytes = self.budget.acquire(self.requested)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
+
+    def shrink(self, nbytes: int):
+        """Возвращает в бюджет то, что больше nbytes (например, после уменьшения фото)"""
+        nbytes = max(0, nbytes)
+        if nbytes < self.nbytes:
+            self.budget.release(self.nbytes - nbytes)
+            self.nbytes = nbytes
+
+    def release(self):
+        if self.nbytes:
+            self.budget.release(self.nbytes)
+            self.nbytes = 0
+
+class MemoryBudget:
+    """
+    Общий бюджет памяти на изображения, которые готовятся к отправке
+    или отправляются в API.
+
+    Перед чтением и кодированием изображения запрос занимает оценку его
+    размера и освобождает ее после ответа. Если бюджет исчерпан, запрос
+    ждет в очереди (FIFO), а не увеличивает пиковое потребление памяти.
+    Запрос больше всего бюджета занимает весь бюджет и выполняется один.
+    """
+
+    def __init__(self, limit_bytes: int):
+        self.limit_bytes = max(1, int(limit_bytes))
+        self.reserved = 0
+        self.peak_reserved = 0
+        self.waits = 0
+        self._lock = threading.Lock()
+        # [байты, событие ожидания] в порядке поступления
+        self._waiters: Deque[List] = deque()
+        _BUDGETS.add(self)
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def reserve(self, nbytes: int) -> Reservation:
+        """Контекстный менеджер, занимающий nbytes на время блока with"""
+        return Reservation(self, nbytes)
+
+    def acquire(self, nbytes: int) -> int:
+        """
+        Ждет, пока в бюджете освободится nbytes, и занимает их
+
+        Returns:
+            Занятые байты (не больше limit_bytes) - их нужно вернуть через release()
+        """
+        nbytes = self._clamp(nbytes)
+        with self._lock:
+            if self._try_take(nbytes):
+                return nbytes
+            waiter = [nbytes, threading.Event()]
+            self._waiters.append(waiter)
+            self._count_wait(nbytes)
+        waiter[1].wait()
+        return nbytes
+
+    def release(self, nbytes: int):
+        with self._lock:
+            self.reserved = max(0, self.reserved - nbytes)
+            self._wake_waiters()
+
+    def _clamp(self, nbytes: int) -> int:
+        return min(max(0, int(nbytes)), self.limit_bytes)
+
+    def _try_take(self, nbytes: int) -> bool:
+        """Занимает байты сразу, если никто не ждет раньше и они помещаются"""
+        if self._waiters or self.reserved + nbytes > self.limit_bytes:
+            return False
+        self._take(nbytes)
+        return True
+
+    def _take(self, nbytes: int):
+        self.reserved += nbytes
+        self.peak_reserved = max(self.peak_reserved, self.reserved)
+
+    def _count_wait(self, nbytes: int):
+        self.waits += 1
+        BUDGET_WAITS.inc()
+        logger.info(f"Memory budget exhausted ({self.reserved}/{self.limit_bytes} bytes), "
+                    f"queued a {nbytes} byte image payload")
+
+    def _wake_waiters(self):
+        """Отдает освободившиеся байты ожидающим по порядку очереди"""
+        while self._waiters and self.reserved + self._waiters[0][0] <= self.limit_bytes:
+            nbytes, waiter = self._waiters.popleft()
+            self._take(nbytes)
+            self._notify(waiter)
+
+    def _notify(self, event: threading.Event):
+        event.set()
+
+class AsyncReservation(Reservation):
+    async def __aenter__(self):
+        self.nbytes = await self.budget.acquire(self.requested)
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
+
+    def __enter__(self):
+        raise TypeError("Use 'async with' for AsyncMemoryBudget reservations")
+
+class AsyncMemoryBudget(MemoryBudget):
+    """
+    Вариант MemoryBudget для asyncio: ожидание бюджета не блокирует цикл
+    событий. Освобождать байты можно из любого потока.
+    """
+
+    def reserve(self, nbytes: int) -> AsyncReservation:
+        return AsyncReservation(self, nbytes)
+
+    async def acquire(self, nbytes: int) -> int:
+        nbytes = self._clamp(nbytes)
+        with self._lock:
+            if self._try_take(nbytes):
+                return nbytes
+            waiter = [nbytes, asyncio.get_running_loop().create_future()]
+            self._waiters.append(waiter)
+            self._count_wait(nbytes)
+
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    granted = False
+                else:
+                    granted = True
+                self._wake_waiters()
+            if granted:
+                # Байты уже выданы этой задаче - возвращаем их
+                self.release(nbytes)
+            raise
+        return nbytes
+
+    def _notify(self, future: asyncio.Future):
+        future.get_loop().call_soon_threadsafe(_set_future_done, future)
+
+def _set_future_done(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
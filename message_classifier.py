@@ -0,0 +1,96 @@
+import re
+import bisect
+import itertools
+from typing import List, Optional, Sequence
+
+from config import MEDIA_INDICATORS, SYSTEM_INDICATORS, FLOOR_KEYWORDS, ADDRESS_KEYWORDS, PHONE_PATTERN
+
+# Битовые признаки сообщения
+MEDIA = 1
+SYSTEM = 2
+FLOOR = 4
+ADDRESS = 8
+PHONE = 16
+
+# Разделитель сообщений в общем тексте: не входит в ключевые слова и не совпадает с \s
+SEPARATOR = '\x00'
+
+def _offsets(texts: Sequence[str]) -> List[int]:
+    """Начало каждого сообщения в общем тексте и конец последнего"""
+    return list(itertools.accumulate((len(text) + 1 for text in texts), initial=0))
+
+class MessageClassifier:
+    """
+    Определяет признаки сообщений (медиа, системное, пол, адрес, телефон).
+
+    Сообщения классифицируются пачкой: тексты склеиваются в одну строку,
+    каждое ключевое слово ищется по ней str.find, а телефон - одним проходом
+    регулярного выражения. После совпадения поиск продолжается со следующего
+    сообщения, поэтому Python-код выполняется только на совпадениях, а не для
+    каждой пары сообщение x ключевое слово. Результат совпадает с отдельными
+    проверками `keyword in message` (пол и адрес - в message.lower()).
+    """
+
+    def __init__(self, media_indicators: Sequence[str] = MEDIA_INDICATORS,
+                 system_indicators: Sequence[str] = SYSTEM_INDICATORS,
+                 floor_keywords: Sequence[str] = FLOOR_KEYWORDS,
+                 address_keywords: Sequence[str] = ADDRESS_KEYWORDS,
+                 phone_pattern: Optional[str] = PHONE_PATTERN):
+        # (признак, ключевые слова, искать в тексте в нижнем регистре)
+        self.keyword_lists = [
+            (MEDIA, tuple(media_indicators), False),
+            (SYSTEM, tuple(system_indicators), False),
+            (FLOOR, tuple(floor_keywords), True),
+            (ADDRESS, tuple(address_keywords), True)
+        ]
+        self.phone_pattern = re.compile(phone_pattern) if phone_pattern else None
+
+    def classify(self, text: str) -> int:
+        """Возвращает битовую маску признаков (MEDIA, SYSTEM, FLOOR, ADDRESS, PHONE)"""
+        return self.classify_many([text])[0]
+
+    def classify_many(self, texts: Sequence[str]) -> List[int]:
+        """Возвращает маски признаков для пачки сообщений"""
+        flags = [0] * len(texts)
+        if not texts:
+            return flags
+
+        joined = SEPARATOR.join(texts)
+        starts = _offsets(texts)
+
+        lowered = joined.lower()
+        lowered_starts = starts
+        if len(lowered) != len(joined):
+            # Некоторые символы в нижнем регистре занимают два (например, 'İ')
+            lowered_texts = [text.lower() for text in texts]
+            lowered = SEPARATOR.join(lowered_texts)
+            lowered_starts = _offsets(lowered_texts)
+
+        for flag, keywords, ignore_case in self.keyword_lists:
+            text, text_starts = (lowered, lowered_starts) if ignore_case else (joined, starts)
+            for keyword in keywords:
+                if not keyword:
+                    # Пустая строка входит в любой текст
+                    flags = [value | flag for value in flags]
+                    continue
+                position = text.find(keyword)
+                while position != -1:
+                    index = bisect.bisect_right(text_starts, position) - 1
+                    flags[index] |= flag
+                    position = text.find(keyword, text_starts[index + 1])
+
+        if self.phone_pattern is not None:
+            match = self.phone_pattern.search(joined)
+            while match is not None:
+                index = bisect.bisect_right(starts, match.start()) - 1
+                flags[index] |= PHONE
+                match = self.phone_pattern.search(joined, starts[index + 1])
+
+        return flags
+
+    def find_phone(self, text: str) -> Optional[str]:
+        """Первый номер телефона в тексте"""
+        if self.phone_pattern is None:
+            return None
+        match = self.phone_pattern.search(text)
+        return match.group() if match else None
@@ -0,0 +1,274 @@
+import re
+from functools import lru_cache
+from operator import itemgetter
+from array import array
+from collections.abc import Mapping, Sequence
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, Optional, Pattern, Tuple, Union
+
+from message_classifier import MEDIA, SYSTEM
+
+# Форматы даты заголовков WhatsApp (в том же порядке, что CHAT_LINE_PATTERNS).
+# %-m, %-d, %-I - без ведущего нуля
+TIMESTAMP_FORMATS = (
+    '%d.%m.%Y, %H:%M:%S',   # [DD.MM.YYYY, HH:MM:SS]
+    '%d.%m.%Y, %H:%M',      # DD.MM.YYYY, HH:MM
+    '%-m/%-d/%y, %-I:%M %p'  # M/D/YY, H:MM AM/PM
+)
+
+# Ключи словаря сообщения, которые отдает MessageView
+MESSAGE_KEYS = ('timestamp', 'sender', 'message', 'is_media', 'is_system', 'flags')
+
+# Дата без формата, который удалось бы разобрать
+UNKNOWN_TIMESTAMP = -1
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+SECONDS_PER_DAY = 86400
+
+# Поля формата даты: регулярное выражение для разбора и шаблон str.format.
+# Поля без ведущего нуля не начинаются с 0, поэтому разобранная дата
+# всегда записывается обратно той же строкой
+_DATE_FIELDS = {
+    '%d': (r'(?P<day>\d{2})', '{day:02d}'),
+    '%-d': (r'(?P<day>[1-9]\d?)', '{day}'),
+    '%m': (r'(?P<month>\d{2})', '{month:02d}'),
+    '%-m': (r'(?P<month>[1-9]\d?)', '{month}'),
+    '%Y': (r'(?P<year>\d{4})', '{year:04d}'),
+    '%y': (r'(?P<year>\d{2})', '{short_year:02d}')
+}
+_TIME_FIELDS = {
+    '%H': (r'(?P<hour>\d{2})', '{hour:02d}'),
+    '%I': (r'(?P<hour>\d{2})', '{hour12:02d}'),
+    '%-I': (r'(?P<hour>[1-9]\d?)', '{hour12}'),
+    '%M': (r'(?P<minute>\d{2})', '{minute:02d}'),
+    '%S': (r'(?P<second>\d{2})', '{second:02d}'),
+    '%p': (r'(?P<ampm>[AP]M)', '{ampm}')
+}
+_FIELD_TOKEN = re.compile('|'.join(sorted(map(re.escape, {**_DATE_FIELDS, **_TIME_FIELDS}), key=len, reverse=True)))
+
+@lru_cache(maxsize=None)
+def _compile_format(timestamp_format: str) -> Tuple[Pattern, str]:
+    """
+    Регулярное выражение и шаблон даты для формата. Шаблон форматируется
+    дважды: сначала полями даты (один раз на день), затем полями времени
+    """
+    pattern, template = '', ''
+    for part in re.split(f'({_FIELD_TOKEN.pattern})', timestamp_format):
+        if part in _DATE_FIELDS:
+            pattern += _DATE_FIELDS[part][0]
+            template += _DATE_FIELDS[part][1]
+        elif part in _TIME_FIELDS:
+            pattern += _TIME_FIELDS[part][0]
+            template += '{' + _TIME_FIELDS[part][1] + '}'
+        else:
+            pattern += re.escape(part)
+            template += part.replace('{', '{{{{').replace('}', '}}}}')
+    return re.compile(pattern), template
+
+class TimestampCodec:
+    """
+    Перевод даты заголовка WhatsApp в целое число секунд с 1970-01-01
+    (время чата, без часового пояса) и обратно в ту же строку
+    """
+
+    def __init__(self, timestamp_format: str):
+        self.timestamp_format = timestamp_format
+        self.pattern, self.template = _compile_format(timestamp_format)
+
+        # Номера групп заголовка: parse работает с match.groups()
+        group_index = {name: index - 1 for name, index in self.pattern.groupindex.items()}
+        self._date_key = itemgetter(group_index['year'], group_index['month'], group_index['day'])
+        self._minute_key = itemgetter(*(group_index[name] for name in ('hour', 'minute', 'ampm') if name in group_index))
+        self._second_index = group_index.get('second')
+
+        # Разобранные дни и минуты суток (их немного) и шаблон времени по дню
+        self._days = {}
+        self._minutes = {}
+        self._day_templates = {}
+
+    def parse(self, timestamp: str) -> int:
+        """
+        Секунды с начала эпохи или UNKNOWN_TIMESTAMP, если строка не в этом
+        формате или не записывается обратно в точности (например, 00:30 PM)
+        """
+        match = self.pattern.fullmatch(timestamp)
+        if match is None:
+            return UNKNOWN_TIMESTAMP
+        groups = match.groups()
+
+        date_key = self._date_key(groups)
+        days = self._days.get(date_key)
+        if days is None:
+            days = self._days[date_key] = self._parse_days(*date_key)
+
+        minute_key = self._minute_key(groups)
+        minutes = self._minutes.get(minute_key)
+        if minutes is None:
+            minutes = self._minutes[minute_key] = self._parse_minutes(*minute_key)
+
+        second = int(groups[self._second_index]) if self._second_index is not None else 0
+        if days == UNKNOWN_TIMESTAMP or minutes == UNKNOWN_TIMESTAMP or second > 59:
+            return UNKNOWN_TIMESTAMP
+        return days * SECONDS_PER_DAY + minutes * 60 + second
+
+    def _parse_days(self, year: str, month: str, day: str) -> int:
+        try:
+            parsed = date(int(year) + (2000 if len(year) == 2 else 0), int(month), int(day))
+        except ValueError:
+            return UNKNOWN_TIMESTAMP
+        return parsed.toordinal() - EPOCH_ORDINAL
+
+    def _parse_minutes(self, hour: str, minute: str, ampm: Optional[str] = None) -> int:
+        hour, minute = int(hour), int(minute)
+        if ampm is not None:
+            if not 1 <= hour <= 12:
+                return UNKNOWN_TIMESTAMP
+            hour = hour % 12 + (12 if ampm == 'PM' else 0)
+        if hour > 23 or minute > 59:
+            return UNKNOWN_TIMESTAMP
+        return hour * 60 + minute
+
+    def format(self, value: int) -> str:
+        """Строка даты в формате чата"""
+        days, seconds = divmod(value, SECONDS_PER_DAY)
+        template = self._day_templates.get(days)
+        if template is None:
+            day = date.fromordinal(days + EPOCH_ORDINAL)
+            template = self._day_templates[days] = self.template.format(
+                day=day.day, month=day.month, year=day.year, short_year=day.year % 100
+            )
+
+        hour, rest = divmod(seconds, 3600)
+        minute, second = divmod(rest, 60)
+        return template.format(
+            hour=hour, hour12=hour % 12 or 12, minute=minute, second=second,
+            ampm='PM' if hour >= 12 else 'AM'
+        )
+
+    @classmethod
+    def detect(cls, timestamp: str) -> Optional['TimestampCodec']:
+        """Формат из TIMESTAMP_FORMATS, в котором записана дата"""
+        for timestamp_format in TIMESTAMP_FORMATS:
+            codec = cls(timestamp_format)
+            if codec.parse(timestamp) != UNKNOWN_TIMESTAMP:
+                return codec
+        return None
+
+class MessageView(Mapping):
+    """
+    Сообщение из MessageStore в виде словаря только для чтения
+    с ключами MESSAGE_KEYS. Значения читаются из столбцов хранилища.
+    """
+
+    __slots__ = ('_store', '_index')
+
+    def __init__(self, store: 'MessageStore', index: int):
+        self._store = store
+        self._index = index
+
+    def __getitem__(self, key: str):
+        store, index = self._store, self._index
+        if key == 'message':
+            return store.texts[index]
+        if key == 'sender':
+            return store.senders[store.sender_ids[index]]
+        if key == 'flags':
+            return store.flags[index]
+        if key == 'is_media':
+            return bool(store.flags[index] & MEDIA)
+        if key == 'is_system':
+            return bool(store.flags[index] & SYSTEM)
+        if key == 'timestamp':
+            return store.timestamp_string(index)
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(MESSAGE_KEYS)
+
+    def __len__(self) -> int:
+        return len(MESSAGE_KEYS)
+
+    def __repr__(self) -> str:
+        return f"MessageView({dict(self)!r})"
+
+class MessageStore(Sequence):
+    """
+    Компактное хранилище сообщений чата по столбцам.
+
+    Вместо словаря на каждое сообщение хранятся параллельные массивы:
+    текст, номер отправителя в списке уникальных имен, дата в секундах
+    (array('q')) и битовые признаки MessageClassifier (array('B')).
+    Строка даты восстанавливается по формату чата; даты, которые не
+    восстанавливаются в точности, хранятся строкой отдельно.
+
+    Индексирование и перебор отдают MessageView, совместимые со словарями
+    прежнего формата (msg['sender'], msg.get('message'), dict(msg)).
+    """
+
+    def __init__(self):
+        self.texts: List[str] = []
+        self.senders: List[str] = []
+        self.sender_ids = array('I')
+        self.timestamps = array('q')
+        self.flags = array('B')
+        self.codec: Optional[TimestampCodec] = None
+        self._sender_index: Dict[str, int] = {}
+        self._raw_timestamps: Dict[int, str] = {}
+
+    def append(self, timestamp: str, sender: str, text: str, flags: int):
+        self.extend([(timestamp, sender, text, flags)])
+
+    def extend(self, messages: Iterable[Tuple[str, str, str, int]]):
+        """Добавляет сообщения (дата, отправитель, текст, признаки)"""
+        messages = list(messages)
+        if not messages:
+            return
+        start = len(self.texts)
+        timestamps, senders, texts, flags = zip(*messages)
+
+        if self.codec is None:
+            self.codec = next(filter(None, map(TimestampCodec.detect, timestamps)), None)
+        values = list(map(self.codec.parse, timestamps)) if self.codec else [UNKNOWN_TIMESTAMP] * len(timestamps)
+        for offset, value in enumerate(values):
+            if value == UNKNOWN_TIMESTAMP:
+                self._raw_timestamps[start + offset] = timestamps[offset]
+
+        sender_index = self._sender_index
+        for sender in senders:
+            if sender not in sender_index:
+                sender_index[sender] = len(self.senders)
+                self.senders.append(sender)
+
+        self.texts.extend(texts)
+        self.sender_ids.extend(map(sender_index.__getitem__, senders))
+        self.timestamps.extend(values)
+        self.flags.extend(flags)
+
+    def timestamp_string(self, index: int) -> str:
+        """Дата сообщения в исходном виде"""
+        raw = self._raw_timestamps.get(index)
+        if raw is not None:
+            return raw
+        return self.codec.format(self.timestamps[index])
+
+    def sender(self, index: int) -> str:
+        return self.senders[self.sender_ids[index]]
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[MessageView, List[MessageView]]:
+        if isinstance(index, slice):
+            return [MessageView(self, i) for i in range(*index.indices(len(self.texts)))]
+        if index < 0:
+            index += len(self.texts)
+        if not 0 <= index < len(self.texts):
+            raise IndexError('message index out of range')
+        return MessageView(self, index)
+
+    def __iter__(self) -> Iterator[MessageView]:
+        return (MessageView(self, i) for i in range(len(self.texts)))
+
+    def to_dicts(self) -> List[Dict]:
+        """Сообщения в виде обычных словарей (например, для JSON)"""
+        return [dict(message) for message in self]
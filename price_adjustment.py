@@ -0,0 +1,180 @@
+import re
+import copy
+from typing import Dict, Optional
+
+from config import BASE_PRICES
+from pricing_calculator import PricingCalculator
+from report_generator import new_report_version
+
+# Начала слов, по которым узнаем поле и значение (регистр не важен)
+FIELD_STEMS = {
+    'площад': 'area',
+    'area': 'area',
+    'м2': 'area',
+    'тип': 'floor_type',
+    'покрыт': 'floor_type',
+    'floor': 'floor_type',
+    'состоян': 'condition',
+    'condition': 'condition',
+    'скидк': 'discount',
+    'discount': 'discount'
+}
+
+FLOOR_TYPE_STEMS = {
+    'паркет': 'parquet',
+    'ламинат': 'laminate',
+    'плит': 'tiles',
+    'линол': 'linoleum',
+    'ковр': 'carpet',
+    'ковер': 'carpet',
+    'бетон': 'concrete',
+    'parquet': 'parquet',
+    'laminate': 'laminate',
+    'tile': 'tiles',
+    'linoleum': 'linoleum',
+    'carpet': 'carpet',
+    'concrete': 'concrete'
+}
+
+CONDITION_STEMS = {
+    'отлич': 'excellent',
+    'хорош': 'good',
+    'удовл': 'fair',
+    'средн': 'fair',
+    'плох': 'poor',
+    'excellent': 'excellent',
+    'good': 'good',
+    'fair': 'fair',
+    'poor': 'poor'
+}
+
+MAX_AREA = 10000
+MAX_DISCOUNT = 90
+
+# Разделители правок: перевод строки, ";" или запятая не внутри числа ("35,5" - число)
+SEPARATOR_PATTERN = re.compile(r'[;\n]|,(?!\d)')
+PAIR_PATTERN = re.compile(r'\s*([^\s:=]+)\s*[:=]?\s*(.*?)\s*$')
+NUMBER_PATTERN = re.compile(r'\d+(?:[.,]\d+)?')
+
+class AdjustmentError(ValueError):
+    """Правка не распознана; текст ошибки показывается пользователю"""
+
+def _match_stem(word: str, stems: Dict[str, str]) -> Optional[str]:
+    word = word.lower()
+    for stem, value in stems.items():
+        if word.startswith(stem):
+            return value
+    return None
+
+def _parse_number(value: str, field: str) -> float:
+    match = NUMBER_PATTERN.search(value)
+    if not match:
+        raise AdjustmentError(f"Не удалось прочитать число для поля «{field}»: {value or 'пусто'}")
+    return float(match.group().replace(',', '.'))
+
+def parse_adjustments(text: str) -> Dict:
+    """
+    Разбирает ручные правки из сообщения
+
+    Пример: "площадь 35, тип ламинат, состояние хорошее, скидка 10%"
+
+    Returns:
+        Dict с ключами area, floor_type, condition, discount (только указанные)
+
+    Raises:
+        AdjustmentError: если правку не удалось разобрать
+    """
+    adjustments = {}
+
+    for part in SEPARATOR_PATTERN.split(text):
+        if not part.strip():
+            continue
+
+        key, value = PAIR_PATTERN.match(part).groups()
+        field = _match_stem(key, FIELD_STEMS)
+        if field is None:
+            raise AdjustmentError(f"Неизвестный параметр: {key}")
+
+        if field == 'area':
+            area = _parse_number(value, 'площадь')
+            if not 0 < area <= MAX_AREA:
+                raise AdjustmentError(f"Площадь должна быть от 0 до {MAX_AREA} кв.м")
+            adjustments['area'] = int(area) if area.is_integer() else area
+
+        elif field == 'discount':
+            discount = _parse_number(value, 'скидка')
+            if not 0 <= discount <= MAX_DISCOUNT:
+                raise AdjustmentError(f"Скидка должна быть от 0 до {MAX_DISCOUNT}%")
+            adjustments['discount'] = int(discount) if discount.is_integer() else discount
+
+        else:
+            stems = FLOOR_TYPE_STEMS if field == 'floor_type' else CONDITION_STEMS
+            parsed = _match_stem(value, stems)
+            if parsed is None:
+                raise AdjustmentError(f"Неизвестное значение: {value or 'пусто'}")
+            # Покрытие узнаем, но без расценки цена считалась бы по умолчанию
+            if field == 'floor_type' and parsed not in BASE_PRICES:
+                raise AdjustmentError(f"Для покрытия «{value}» нет расценок. "
+                                      f"Типы: паркет, ламинат, плитка, линолеум")
+            adjustments[field] = parsed
+
+    if not adjustments:
+        raise AdjustmentError("Не найдено ни одной правки")
+
+    return adjustments
+
+def apply_adjustments(analysis: Dict, adjustments: Dict) -> Dict:
+    """Возвращает копию анализа с ручными правками (скидка учитывается в цене, а не здесь)"""
+    adjusted = copy.deepcopy(analysis)
+    if 'area' in adjustments:
+        adjusted['total_area_estimate'] = adjustments['area']
+    if 'floor_type' in adjustments:
+        adjusted['floor_type'] = adjustments['floor_type']
+    if 'condition' in adjustments:
+        adjusted['condition'] = adjustments['condition']
+
+    if adjustments:
+        adjusted['manual_adjustments'] = dict(adjustments)
+    else:
+        adjusted.pop('manual_adjustments', None)
+    return adjusted
+
+def reprice(user_data: Dict, changes: Optional[Dict], pricing_calculator: PricingCalculator) -> Dict:
+    """
+    Пересчитывает стоимость и сроки по сохраненному анализу - без запросов к Claude
+
+    Args:
+        user_data: Данные чата из SessionStore
+        changes: Новые правки поверх уже сделанных; None - сбросить все правки
+        pricing_calculator: Калькулятор стоимости
+
+    Returns:
+        Обновленные данные чата для SessionStore
+    """
+    # Правки всегда применяются к исходному анализу, чтобы их можно было отменить
+    original = user_data.get('original_analysis') or user_data['analysis']
+    if changes is None:
+        adjustments = {}
+    else:
+        adjustments = {**user_data['analysis'].get('manual_adjustments', {}), **changes}
+
+    analysis = apply_adjustments(original, adjustments)
+    cost_info = pricing_calculator.calculate_project_cost(analysis)
+    if adjustments.get('discount'):
+        cost_info = pricing_calculator.apply_discount(cost_info, adjustments['discount'])
+    timeline = pricing_calculator.get_work_timeline(analysis, cost_info)
+
+    updated = dict(user_data)
+    updated.update({
+        'analysis': analysis,
+        'cost_info': cost_info,
+        'timeline': timeline,
+        'awaiting_adjustment': False,
+        # Готовые отчеты по прежней цене больше не подходят
+        'report_version': new_report_version()
+    })
+    if adjustments:
+        updated['original_analysis'] = original
+    else:
+        updated.pop('original_analysis', None)
+    return updated
@@ -1,6 +1,78 @@
-from typing import Dict
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
 from config import BASE_PRICES, CONDITION_MULTIPLIERS
 
+# Коэффициенты сложности работ
+COMPLEXITY_MULTIPLIERS = {
+    'low': 1.0,
+    'medium': 1.3,
+    'high': 1.8
+}
+
+# Надбавка к коэффициенту повреждений за одно повреждение
+DAMAGE_SEVERITIES = ('minor', 'moderate', 'severe')
+DAMAGE_INCREMENTS = {
+    'minor': 0.1,
+    'moderate': 0.2,
+    'severe': 0.4
+}
+
+# Базовое время работы (дни на 10 кв.м)
+BASE_DAYS_PER_10SQM = {
+    'parquet': 2,
+    'laminate': 1,
+    'tiles': 3,
+    'linoleum': 1,
+    'unknown': 2
+}
+
+# Коэффициенты сложности для сроков
+COMPLEXITY_TIME_MULTIPLIERS = {
+    'low': 1.0,
+    'medium': 1.5,
+    'high': 2.0
+}
+
+WORK_DESCRIPTIONS = {
+    'parquet': {
+        'low': 'Легкий ремонт паркета',
+        'medium': 'Реставрация паркета',
+        'high': 'Полная замена паркета'
+    },
+    'laminate': {
+        'low': 'Замена отдельных планок ламината',
+        'medium': 'Частичная замена ламината',
+        'high': 'Полная замена ламината'
+    },
+    'tiles': {
+        'low': 'Замена отдельных плиток',
+        'medium': 'Частичная замена плитки',
+        'high': 'Полная замена плитки'
+    },
+    'linoleum': {
+        'low': 'Ремонт линолеума',
+        'medium': 'Частичная замена линолеума',
+        'high': 'Полная замена линолеума'
+    }
+}
+
+DEFAULT_WORK_DESCRIPTION = 'Ремонт напольного покрытия'
+
+def damage_multiplier_from_counts(minor, moderate, severe):
+    """
+    Коэффициент повреждений по числу повреждений каждой тяжести.
+    Работает и с числами, и с массивами NumPy. Надбавки кратны 0.1, поэтому
+    сумма округляется до 0.1: коэффициент не зависит от погрешности float
+    и одинаков в обоих путях расчета. Максимум - 2.0.
+    """
+    multiplier = 1.0 + DAMAGE_INCREMENTS['minor'] * minor \
+        + DAMAGE_INCREMENTS['moderate'] * moderate + DAMAGE_INCREMENTS['severe'] * severe
+    if isinstance(multiplier, np.ndarray):
+        return np.minimum(np.round(multiplier, 1), 2.0)
+    return min(round(multiplier, 1), 2.0)
+
 class PricingCalculator:
     def __init__(self):
         self.base_prices = BASE_PRICES
@@ -29,12 +101,7 @@ class PricingCalculator:
         condition_multiplier = self.condition_multipliers.get(condition, 1.3)
         
         # Коэффициент сложности работ
-        complexity_multipliers = {
-            'low': 1.0,
-            'medium': 1.3,
-            'high': 1.8
-        }
-        complexity_multiplier = complexity_multipliers.get(work_complexity, 1.3)
+        complexity_multiplier = COMPLEXITY_MULTIPLIERS.get(work_complexity, 1.3)
         
         # Коэффициент повреждений
         damage_multiplier = self._calculate_damage_multiplier(damages)
@@ -68,24 +135,35 @@ class PricingCalculator:
             )
         }
     
+    def apply_discount(self, cost_info: Dict, discount_percent: float) -> Dict:
+        """Применяет скидку в процентах к диапазону и рекомендуемой цене"""
+        factor = 1 - discount_percent / 100
+        discounted = dict(cost_info)
+        discounted.update({
+            'min_cost': int(cost_info['min_cost'] * factor),
+            'max_cost': int(cost_info['max_cost'] * factor),
+            'recommended_cost': int(cost_info['recommended_cost'] * factor),
+            'discount_percent': discount_percent,
+            'cost_before_discount': cost_info['recommended_cost']
+        })
+        return discounted
+    
     def _calculate_damage_multiplier(self, damages: list) -> float:
         """Рассчитывает коэффициент на основе повреждений"""
         if not damages:
             return 1.0
         
-        multiplier = 1.0
-        
+        # Считаем по количеству, а не по порядку - так же, как calculate_bulk
+        return damage_multiplier_from_counts(*self._count_damages(damages))
+    
+    def _count_damages(self, damages: list) -> Tuple[int, int, int]:
+        """Число повреждений (minor, moderate, severe); неизвестная тяжесть не учитывается"""
+        counts = dict.fromkeys(DAMAGE_SEVERITIES, 0)
         for damage in damages:
             severity = damage.get('severity', 'minor')
-            if severity == 'minor':
-                multiplier += 0.1
-            elif severity == 'moderate':
-                multiplier += 0.2
-            elif severity == 'severe':
-                multiplier += 0.4
-        
-        # Максимальный коэффициент повреждений - 2.0
-        return min(multiplier, 2.0)
+            if severity in counts:
+                counts[severity] += 1
+        return counts['minor'], counts['moderate'], counts['severe']
     
     def _create_cost_breakdown(self, base_cost: float, condition_mult: float, 
                               complexity_mult: float, damage_mult: float) -> Dict:
@@ -103,28 +181,13 @@ class PricingCalculator:
         work_complexity = analysis.get('work_complexity', 'medium')
         floor_type = analysis.get('floor_type', 'unknown')
         
-        # Базовое время работы (дни на 10 кв.м)
-        base_days_per_10sqm = {
-            'parquet': 2,
-            'laminate': 1,
-            'tiles': 3,
-            'linoleum': 1,
-            'unknown': 2
-        }
-        
-        base_days = base_days_per_10sqm.get(floor_type, 2)
+        base_days = BASE_DAYS_PER_10SQM.get(floor_type, 2)
         
         # Рассчитываем время для данной площади
         estimated_days = (area / 10) * base_days
         
         # Коэффициенты сложности
-        complexity_time_multipliers = {
-            'low': 1.0,
-            'medium': 1.5,
-            'high': 2.0
-        }
-        
-        time_multiplier = complexity_time_multipliers.get(work_complexity, 1.5)
+        time_multiplier = COMPLEXITY_TIME_MULTIPLIERS.get(work_complexity, 1.5)
         final_days = estimated_days * time_multiplier
         
         # Минимум 1 день, максимум 14 дней
@@ -139,28 +202,179 @@ class PricingCalculator:
     
     def _get_work_description(self, floor_type: str, complexity: str) -> str:
         """Возвращает описание типа работ"""
-        work_descriptions = {
-            'parquet': {
-                'low': 'Легкий ремонт паркета',
-                'medium': 'Реставрация паркета',
-                'high': 'Полная замена паркета'
-            },
-            'laminate': {
-                'low': 'Замена отдельных планок ламината',
-                'medium': 'Частичная замена ламината',
-                'high': 'Полная замена ламината'
-            },
-            'tiles': {
-                'low': 'Замена отдельных плиток',
-                'medium': 'Частичная замена плитки',
-                'high': 'Полная замена плитки'
-            },
-            'linoleum': {
-                'low': 'Ремонт линолеума',
-                'medium': 'Частичная замена линолеума',
-                'high': 'Полная замена линолеума'
-            }
+        return WORK_DESCRIPTIONS.get(floor_type, {}).get(complexity, DEFAULT_WORK_DESCRIPTION)
+    
+    # --- Пакетный пересчет ---
+    
+    def code_tables(self) -> Dict[str, Tuple[Optional[str], ...]]:
+        """
+        Таблицы кодов для calculate_bulk.
+        
+        Код - индекс значения в таблице. Последний элемент (None) означает
+        "любое другое значение" и получает те же значения по умолчанию,
+        что и calculate_project_cost.
+        """
+        floor_types = sorted(set(self.base_prices) | set(BASE_DAYS_PER_10SQM) | set(WORK_DESCRIPTIONS))
+        return {
+            'floor_type': tuple(floor_types) + (None,),
+            'condition': tuple(self.condition_multipliers) + (None,),
+            'work_complexity': tuple(sorted(set(COMPLEXITY_MULTIPLIERS) | set(COMPLEXITY_TIME_MULTIPLIERS))) + (None,)
+        }
+    
+    def encode_analyses(self, analyses: Iterable[Dict]) -> Dict[str, np.ndarray]:
+        """
+        Переводит сохраненные анализы в колонки для calculate_bulk
+        
+        Args:
+            analyses: Анализы в том же формате, что и для calculate_project_cost
+            
+        Returns:
+            Dict с массивами floor_type, condition, work_complexity (коды),
+            area и damage_counts (n x 3: minor, moderate, severe)
+        """
+        tables = self.code_tables()
+        indexes = {
+            column: {value: code for code, value in enumerate(table[:-1])}
+            for column, table in tables.items()
         }
+        defaults = {'floor_type': 'unknown', 'condition': 'unknown', 'work_complexity': 'medium'}
+        
+        columns = {column: [] for column in tables}
+        areas = []
+        damage_counts = []
+        for analysis in analyses:
+            for column, index in indexes.items():
+                # Неизвестные значения получают последний код
+                columns[column].append(index.get(analysis.get(column, defaults[column]), len(index)))
+            areas.append(analysis.get('total_area_estimate', 20))
+            damage_counts.append(self._count_damages(analysis.get('damages', [])))
         
-        return work_descriptions.get(floor_type, {}).get(complexity, 'Ремонт напольного покрытия')
+        encoded = {column: np.array(codes, dtype=np.intp) for column, codes in columns.items()}
+        encoded['area'] = np.array(areas, dtype=np.float64)
+        encoded['damage_counts'] = np.array(damage_counts, dtype=np.int64).reshape(-1, 3)
+        return encoded
+    
+    def calculate_bulk(self, floor_type: np.ndarray, condition: np.ndarray, work_complexity: np.ndarray,
+                       area: np.ndarray, damage_counts: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Рассчитывает стоимость и сроки для многих анализов за один проход
+        
+        Результаты совпадают с calculate_project_cost и get_work_timeline:
+        операции выполняются в том же порядке над теми же float64.
+        
+        Args:
+            floor_type, condition, work_complexity: Коды из code_tables()
+            area: Площадь в кв.м
+            damage_counts: Массив n x 3 - число повреждений minor, moderate, severe
+            
+        Returns:
+            Dict с массивами по полям cost_info (breakdown - с префиксом
+            breakdown_) и timeline
+        """
+        tables = self.code_tables()
+        floor_type = np.asarray(floor_type, dtype=np.intp)
+        condition = np.asarray(condition, dtype=np.intp)
+        work_complexity = np.asarray(work_complexity, dtype=np.intp)
+        area = np.asarray(area, dtype=np.float64)
+        damage_counts = np.asarray(damage_counts).reshape(-1, 3)
+        
+        # Справочники по кодам - те же .get с теми же значениями по умолчанию
+        base_prices = np.array([
+            self.base_prices.get(name, self.base_prices['unknown']) for name in tables['floor_type']
+        ], dtype=np.float64)
+        condition_multipliers = np.array([
+            self.condition_multipliers.get(name, 1.3) for name in tables['condition']
+        ], dtype=np.float64)
+        complexity_multipliers = np.array([
+            COMPLEXITY_MULTIPLIERS.get(name, 1.3) for name in tables['work_complexity']
+        ], dtype=np.float64)
+        
+        base_price = base_prices[floor_type]
+        condition_multiplier = condition_multipliers[condition]
+        complexity_multiplier = complexity_multipliers[work_complexity]
+        damage_multiplier = damage_multiplier_from_counts(
+            damage_counts[:, 0], damage_counts[:, 1], damage_counts[:, 2]
+        )
+        
+        base_cost = base_price * area
+        total_multiplier = condition_multiplier * complexity_multiplier * damage_multiplier
+        final_cost = base_cost * total_multiplier
+        
+        result = {
+            'base_price_per_sqm': base_price,
+            'area': area,
+            'base_cost': _truncate(base_cost),
+            'condition_multiplier': condition_multiplier,
+            'complexity_multiplier': complexity_multiplier,
+            'damage_multiplier': damage_multiplier,
+            'total_multiplier': _round_like_python(total_multiplier, 2),
+            'min_cost': _truncate(final_cost * 0.85),
+            'max_cost': _truncate(final_cost * 1.15),
+            'recommended_cost': _truncate(final_cost),
+            'breakdown_base_work': _truncate(base_cost),
+            'breakdown_condition_adjustment': _truncate(base_cost * (condition_multiplier - 1)),
+            'breakdown_complexity_adjustment': _truncate(
+                base_cost * condition_multiplier * (complexity_multiplier - 1)
+            ),
+            'breakdown_damage_adjustment': _truncate(
+                base_cost * condition_multiplier * complexity_multiplier * (damage_multiplier - 1)
+            )
+        }
+        result.update(self._bulk_timeline(tables, floor_type, work_complexity, area))
+        return result
+    
+    def _bulk_timeline(self, tables: Dict, floor_type: np.ndarray, work_complexity: np.ndarray,
+                       area: np.ndarray) -> Dict[str, np.ndarray]:
+        """Векторный аналог get_work_timeline"""
+        base_days = np.array([
+            BASE_DAYS_PER_10SQM.get(name, 2) for name in tables['floor_type']
+        ], dtype=np.float64)
+        time_multipliers = np.array([
+            COMPLEXITY_TIME_MULTIPLIERS.get(name, 1.5) for name in tables['work_complexity']
+        ], dtype=np.float64)
+        work_types = np.array([
+            [self._get_work_description(floor, complexity) for complexity in tables['work_complexity']]
+            for floor in tables['floor_type']
+        ], dtype=object)
+        
+        estimated_days = (area / 10) * base_days[floor_type]
+        final_days = np.clip(estimated_days * time_multipliers[work_complexity], 1, 14)
+        
+        return {
+            'estimated_days': _truncate(final_days),
+            'min_days': np.maximum(1, _truncate(final_days * 0.8)),
+            'max_days': _truncate(final_days * 1.3),
+            'work_type': work_types[floor_type, work_complexity]
+        }
+    
+    def bulk_row(self, result: Dict[str, np.ndarray], i: int) -> Tuple[Dict, Dict]:
+        """Возвращает (cost_info, timeline) для строки i в формате скалярного расчета"""
+        def value(key):
+            item = result[key][i]
+            return item.item() if isinstance(item, np.generic) else item
+        
+        cost_info = {key: value(key) for key in (
+            'base_price_per_sqm', 'area', 'base_cost', 'condition_multiplier', 'complexity_multiplier',
+            'damage_multiplier', 'total_multiplier', 'min_cost', 'max_cost', 'recommended_cost'
+        )}
+        cost_info['currency'] = 'ILS'
+        cost_info['breakdown'] = {
+            key: value('breakdown_' + key)
+            for key in ('base_work', 'condition_adjustment', 'complexity_adjustment', 'damage_adjustment')
+        }
+        timeline = {key: value(key) for key in ('estimated_days', 'min_days', 'max_days', 'work_type')}
+        return cost_info, timeline
+
+def _truncate(values: np.ndarray) -> np.ndarray:
+    """Отбрасывает дробную часть, как int()"""
+    return np.trunc(values).astype(np.int64)
 
+def _round_like_python(values: np.ndarray, ndigits: int) -> np.ndarray:
+    """
+    Округление, совпадающее со встроенным round().
+    np.round округляет иначе на границах, поэтому round() вызывается
+    только для уникальных значений - их немного.
+    """
+    unique, inverse = np.unique(values, return_inverse=True)
+    rounded = np.array([round(float(value), ndigits) for value in unique], dtype=np.float64)
+    return rounded[inverse.reshape(values.shape)]
@@ -0,0 +1,93 @@
+import time
+import logging
+from typing import Callable, Dict
+
+from telebot import apihelper, asyncio_helper
+
+from config import PROGRESS_EDIT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Строит текст статуса: (готово, всего, предварительный анализ) -> текст
+ProgressRenderer = Callable[[int, int, Dict], str]
+
+class _EditThrottle:
+    """
+    Решает, можно ли сейчас править статусное сообщение.
+
+    Telegram ограничивает частоту правок одного чата, а правка тем же текстом
+    возвращает ошибку, поэтому одинаковые тексты пропускаются, а между
+    правками выдерживается min_interval. После ответа 429 правки
+    приостанавливаются на retry_after секунд.
+    """
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self._last_text = None
+        self._last_sent_at = 0.0
+        self._blocked_until = 0.0
+        self.edits_sent = 0
+        self.edits_skipped = 0
+
+    def should_send(self, text: str, force: bool) -> bool:
+        now = time.monotonic()
+        if text == self._last_text or now < self._blocked_until or \
+                (not force and now - self._last_sent_at < self.min_interval):
+            self.edits_skipped += 1
+            return False
+        return True
+
+    def sent(self, text: str):
+        self._last_text = text
+        self._last_sent_at = time.monotonic()
+        self.edits_sent += 1
+
+    def failed(self, error: Exception):
+        result_json = getattr(error, 'result_json', None) or {}
+        if getattr(error, 'error_code', None) == 429:
+            retry_after = result_json.get('parameters', {}).get('retry_after', self.min_interval)
+            self._blocked_until = time.monotonic() + retry_after
+            logger.warning(f"Status edits rate limited, pausing for {retry_after}s")
+        elif 'message is not modified' not in str(getattr(error, 'description', '')):
+            logger.warning(f"Failed to update status message: {error}")
+
+class ProgressReporter:
+    """Показывает ход анализа в статусном сообщении через редкие edit_message_text"""
+
+    def __init__(self, bot, chat_id: int, message_id: int, render: ProgressRenderer,
+                 min_interval: float = PROGRESS_EDIT_INTERVAL):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.render = render
+        self.throttle = _EditThrottle(min_interval)
+
+    def update(self, text: str, force: bool = False):
+        """Правит статус, если позволяют ограничения частоты (force - без ожидания интервала)"""
+        if not self.throttle.should_send(text, force):
+            return
+        try:
+            self.bot.edit_message_text(text, self.chat_id, self.message_id)
+            self.throttle.sent(text)
+        except apihelper.ApiTelegramException as e:
+            self.throttle.failed(e)
+
+    def __call__(self, done: int, total: int, provisional: Dict):
+        """Колбэк прогресса для FloorAnalyzer.analyze_multiple_images"""
+        # Последнее изображение - сразу, остальные не чаще min_interval
+        self.update(self.render(done, total, provisional), force=done == total)
+
+class AsyncProgressReporter(ProgressReporter):
+    """Вариант ProgressReporter для AsyncTeleBot"""
+
+    async def update(self, text: str, force: bool = False):
+        if not self.throttle.should_send(text, force):
+            return
+        try:
+            await self.bot.edit_message_text(text, self.chat_id, self.message_id)
+            self.throttle.sent(text)
+        except asyncio_helper.ApiTelegramException as e:
+            self.throttle.failed(e)
+
+    async def __call__(self, done: int, total: int, provisional: Dict):
+        await self.update(self.render(done, total, provisional), force=done == total)
@@ -0,0 +1,327 @@
+import os
+import html
+import base64
+import hashlib
+import io
+import time
+import threading
+import logging
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+from config import (
+    IMAGE_QUALITY, QUOTE_EXPORT_FORMAT, QUOTE_EXPORT_CONCURRENCY,
+    QUOTE_PDF_FONT, QUOTE_THUMBNAIL_DIR, QUOTE_THUMBNAIL_EDGE, QUOTE_THUMBNAIL_TTL
+)
+from image_preprocessor import SHARED_POOL, ProcessPool, prepare_image
+
+logger = logging.getLogger(__name__)
+
+QUOTE_FORMATS = ('pdf', 'html')
+
+# Страница PDF: A4 при 150 dpi
+PAGE_SIZE = (1240, 1754)
+PAGE_DPI = 150
+PAGE_MARGIN = 100
+PHOTO_GAP = 30
+BULLET_INDENT = 36
+
+# Размеры шрифта PDF и межстрочный интервал
+TITLE_SIZE = 46
+HEADING_SIZE = 32
+TEXT_SIZE = 26
+LINE_SPACING = 1.4
+
+def file_sha256(path: str) -> str:
+    """SHA-256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def make_thumbnail(image_path: str, thumbnail_path: str, max_edge: int, quality: int):
+    """Сохраняет JPEG миниатюру фотографии. Выполняется в отдельном процессе."""
+    prepared = prepare_image(image_path, max_edge, 'JPEG', quality)
+    temp_path = f"{thumbnail_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(prepared['data'])
+    os.replace(temp_path, thumbnail_path)
+
+def render_quote_html(document: Dict, thumbnails: List[str]) -> bytes:
+    """Документ предложения одной HTML страницей с фото внутри. Выполняется в отдельном процессе."""
+    escape = html.escape
+    parts = [
+        '<!DOCTYPE html>',
+        '<html lang="ru"><head><meta charset="utf-8">',
+        f'<title>{escape(document["title"])}</title>',
+        '<style>'
+        'body{font-family:"DejaVu Sans",Arial,sans-serif;max-width:800px;margin:40px auto;padding:0 20px;color:#222}'
+        'h1{font-size:28px;margin-bottom:4px}h2{font-size:20px;margin-top:28px}'
+        '.subtitle{color:#666}.total{font-size:22px;font-weight:bold;margin-top:24px}'
+        '.photos{display:flex;flex-wrap:wrap;gap:12px}.photos img{max-width:48%;height:auto;border-radius:4px}'
+        'footer{margin-top:32px;border-top:1px solid #ddd;padding-top:12px;color:#444}'
+        '</style></head><body>',
+        f'<h1>{escape(document["title"])}</h1>',
+        f'<div class="subtitle">{escape(document["subtitle"])}</div>'
+    ]
+    for section in document['sections']:
+        parts.append(f'<h2>{escape(section["heading"])}</h2><ul>')
+        parts.extend(f'<li>{escape(line)}</li>' for line in section['lines'])
+        parts.append('</ul>')
+    parts.append(f'<div class="total">{escape(document["total"])}</div>')
+    parts.append(f'<p>{escape(document["note"])}</p>')
+
+    if thumbnails:
+        parts.append(f'<h2>{escape(document["photos_heading"])}</h2><div class="photos">')
+        for path in thumbnails:
+            with open(path, 'rb') as f:
+                data = base64.b64encode(f.read()).decode('ascii')
+            parts.append(f'<img src="data:image/jpeg;base64,{data}" alt="">')
+        parts.append('</div>')
+
+    parts.append(f'<footer>{"<br>".join(map(escape, document["footer"]))}</footer>')
+    parts.append('</body></html>')
+    return '\n'.join(parts).encode('utf-8')
+
+class _PdfPages:
+    """Раскладка текста и фото по страницам PDF сверху вниз"""
+
+    def __init__(self, font_path: str):
+        self.fonts = {
+            size: ImageFont.truetype(font_path, size) for size in (TITLE_SIZE, HEADING_SIZE, TEXT_SIZE)
+        }
+        self.width = PAGE_SIZE[0] - 2 * PAGE_MARGIN
+        self.pages: List[Image.Image] = []
+        self._new_page()
+
+    def _new_page(self):
+        self.page = Image.new('RGB', PAGE_SIZE, (255, 255, 255))
+        self.draw = ImageDraw.Draw(self.page)
+        self.pages.append(self.page)
+        self.y = PAGE_MARGIN
+
+    def _ensure_space(self, height: int):
+        if self.y + height > PAGE_SIZE[1] - PAGE_MARGIN and self.y > PAGE_MARGIN:
+            self._new_page()
+
+    def _wrap(self, text: str, font: ImageFont.FreeTypeFont, width: int) -> List[str]:
+        lines, line = [], ''
+        for word in text.split():
+            candidate = f"{line} {word}" if line else word
+            if font.getlength(candidate) <= width:
+                line = candidate
+                continue
+            if line:
+                lines.append(line)
+            # Слово длиннее строки режем по символам
+            while font.getlength(word) > width:
+                cut = next(i for i in range(len(word), 0, -1) if font.getlength(word[:i]) <= width or i == 1)
+                lines.append(word[:cut])
+                word = word[cut:]
+            line = word
+        lines.append(line)
+        return lines
+
+    def text(self, text: str, size: int = TEXT_SIZE, color=(34, 34, 34), space_before: int = 0,
+             bullet: bool = False):
+        """Абзац с переносом по словам; у пункта списка перенесенные строки идут с отступом"""
+        font = self.fonts[size]
+        line_height = int(size * LINE_SPACING)
+        indent = BULLET_INDENT if bullet else 0
+        self.y += space_before
+        for i, line in enumerate(self._wrap(text, font, self.width - indent)):
+            self._ensure_space(line_height)
+            if bullet and i == 0:
+                self.draw.text((PAGE_MARGIN + BULLET_INDENT // 3, self.y), '•', font=font, fill=color)
+            self.draw.text((PAGE_MARGIN + indent, self.y), line, font=font, fill=color)
+            self.y += line_height
+
+    def photos(self, paths: List[str]):
+        """Фото в две колонки"""
+        column = (self.width - PHOTO_GAP) // 2
+        for start in range(0, len(paths), 2):
+            row = []
+            for path in paths[start:start + 2]:
+                with Image.open(path) as image:
+                    image = image.convert('RGB')
+                    image.thumbnail((column, column), Image.LANCZOS)
+                    row.append(image)
+            height = max(image.height for image in row)
+            self._ensure_space(height)
+            for i, image in enumerate(row):
+                self.page.paste(image, (PAGE_MARGIN + i * (column + PHOTO_GAP), self.y))
+            self.y += height + PHOTO_GAP
+
+    def save(self) -> bytes:
+        buffer = io.BytesIO()
+        self.pages[0].save(buffer, format='PDF', save_all=True, append_images=self.pages[1:], resolution=PAGE_DPI)
+        return buffer.getvalue()
+
+def render_quote_pdf(document: Dict, thumbnails: List[str], font_path: str) -> bytes:
+    """Документ предложения в PDF (страницы рисуются через Pillow). Выполняется в отдельном процессе."""
+    pages = _PdfPages(font_path)
+    pages.text(document['title'], TITLE_SIZE)
+    pages.text(document['subtitle'], color=(102, 102, 102))
+
+    for section in document['sections']:
+        pages.text(section['heading'], HEADING_SIZE, space_before=24)
+        for line in section['lines']:
+            pages.text(line, bullet=True)
+
+    pages.text(document['total'], HEADING_SIZE, space_before=24)
+    pages.text(document['note'], color=(102, 102, 102))
+
+    if thumbnails:
+        pages.text(document['photos_heading'], HEADING_SIZE, space_before=24)
+        pages.y += 10
+        pages.photos(thumbnails)
+
+    pages.y += 24
+    for line in document['footer']:
+        pages.text(line, color=(68, 68, 68))
+    return pages.save()
+
+class QuoteExporter:
+    """
+    Документ с предложением для клиента (PDF или HTML) с фотографиями.
+
+    Миниатюры и документы готовятся в пуле процессов (по умолчанию общем
+    с ImagePreprocessor), чтобы не занимать потоки бота. Задач экспорта
+    в пуле одновременно не больше max_concurrent, остальные ждут места
+    перед отправкой в пул.
+
+    Миниатюры хранятся на диске по SHA-256 исходного фото: экспорт чата
+    удаляется сразу после анализа, а одно и то же фото уменьшается один раз.
+    Если шрифта с кириллицей для PDF нет, документ выгружается в HTML.
+    """
+
+    # Удаляем старые миниатюры не чаще, чем раз в N вызовов add_images
+    PRUNE_EVERY = 50
+
+    def __init__(self, output_format: str = QUOTE_EXPORT_FORMAT, font_path: str = QUOTE_PDF_FONT,
+                 thumbnail_dir: Optional[str] = QUOTE_THUMBNAIL_DIR, thumbnail_edge: int = QUOTE_THUMBNAIL_EDGE,
+                 thumbnail_ttl: float = QUOTE_THUMBNAIL_TTL, pool: Optional[ProcessPool] = None,
+                 max_concurrent: int = QUOTE_EXPORT_CONCURRENCY):
+        self.output_format = output_format.lower()
+        self.font_path = font_path
+        self.thumbnail_dir = thumbnail_dir
+        self.thumbnail_edge = thumbnail_edge
+        self.thumbnail_ttl = thumbnail_ttl
+        self.pool = pool or SHARED_POOL
+        self._slots = threading.BoundedSemaphore(max(1, max_concurrent))
+        self._adds_since_prune = 0
+
+        if self.output_format not in QUOTE_FORMATS:
+            raise ValueError(f"Unsupported quote export format: {output_format}")
+        if self.output_format == 'pdf' and not os.path.isfile(font_path):
+            logger.warning(f"PDF font not found ({font_path}), quotes will be exported as HTML")
+            self.output_format = 'html'
+
+        if self.thumbnail_dir:
+            try:
+                os.makedirs(self.thumbnail_dir, exist_ok=True)
+            except OSError as e:
+                logger.warning(f"Quote thumbnails disabled: {e}")
+                self.thumbnail_dir = None
+
+    def _submit(self, fn, *args) -> Future:
+        """Отправляет задачу в пул, когда в нем освободится место"""
+        self._slots.acquire()
+        try:
+            future = self.pool.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def thumbnail_path(self, image_hash: str) -> str:
+        return os.path.join(self.thumbnail_dir, image_hash[:2], f"{image_hash}.jpg")
+
+    def add_images(self, image_paths: List[str]) -> List[str]:
+        """
+        Готовит миниатюры фотографий, пока файлы еще на месте
+
+        Returns:
+            SHA-256 фото, для которых есть миниатюры, в исходном порядке без повторов
+        """
+        if not self.thumbnail_dir:
+            return []
+
+        images = {}
+        for path in image_paths:
+            try:
+                images.setdefault(file_sha256(path), path)
+            except OSError as e:
+                logger.warning(f"Cannot read {os.path.basename(path)} for quote thumbnail: {e}")
+
+        pending = {}
+        for image_hash, path in images.items():
+            thumbnail_path = self.thumbnail_path(image_hash)
+            try:
+                # Миниатюра уже есть - продлеваем ей жизнь
+                os.utime(thumbnail_path)
+                continue
+            except OSError:
+                pass
+            os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+            pending[image_hash] = self._submit(
+                make_thumbnail, path, thumbnail_path, self.thumbnail_edge, IMAGE_QUALITY
+            )
+
+        ready = []
+        for image_hash, path in images.items():
+            future = pending.get(image_hash)
+            if future is not None:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.warning(f"Thumbnail failed for {os.path.basename(path)}: {e}")
+                    continue
+            ready.append(image_hash)
+
+        self._adds_since_prune += 1
+        if self._adds_since_prune >= self.PRUNE_EVERY:
+            self._adds_since_prune = 0
+            self._prune_thumbnails()
+        return ready
+
+    def export(self, document: Dict, image_hashes: List[str]) -> Tuple[str, bytes]:
+        """
+        Собирает документ в пуле процессов и ждет результата
+
+        Args:
+            document: Текст документа от ReportGenerator.create_quote_document
+            image_hashes: Фото из add_images; удаленные миниатюры пропускаются
+
+        Returns:
+            (имя файла, содержимое)
+        """
+        thumbnails = []
+        if self.thumbnail_dir:
+            thumbnails = [path for path in map(self.thumbnail_path, image_hashes) if os.path.exists(path)]
+
+        if self.output_format == 'pdf':
+            future = self._submit(render_quote_pdf, document, thumbnails, self.font_path)
+        else:
+            future = self._submit(render_quote_html, document, thumbnails)
+
+        return f"{document['file_name']}.{self.output_format}", future.result()
+
+    def _prune_thumbnails(self):
+        """Удаляет миниатюры, которые не использовались дольше thumbnail_ttl"""
+        now = time.time()
+        for root, dirs, files in os.walk(self.thumbnail_dir):
+            for file in files:
+                path = os.path.join(root, file)
+                try:
+                    if now - os.stat(path).st_mtime > self.thumbnail_ttl:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    def shutdown(self):
+        self.pool.shutdown()
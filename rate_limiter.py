@@ -0,0 +1,114 @@
+import asyncio
+import threading
+import time
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+class RateLimitSemaphore:
+    """
+    Семафор, ограничивающий число одновременных запросов к API.
+
+    При ответе 429/529 все потоки приостанавливаются на время паузы
+    (Retry-After или экспоненциальная задержка), после успешного запроса
+    задержка сбрасывается.
+    """
+
+    def __init__(self, max_concurrent: int = 4, base_cooldown: float = 2.0, max_cooldown: float = 60.0):
+        self.max_concurrent = max(1, max_concurrent)
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrent)
+        self._lock = threading.Lock()
+        self._resume_at = 0.0
+        self._consecutive_limits = 0
+        self.rate_limit_hits = 0
+
+    def acquire(self):
+        """Ждет окончания паузы и свободного слота"""
+        self._wait_cooldown()
+        self._semaphore.acquire()
+        # Пауза могла начаться, пока поток ждал слот
+        self._wait_cooldown()
+
+    def release(self):
+        self._semaphore.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
+
+    def _wait_cooldown(self):
+        while True:
+            with self._lock:
+                delay = self._resume_at - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def report_rate_limit(self, retry_after: Optional[float] = None) -> float:
+        """
+        Регистрирует ответ 429/529 и включает паузу для всех потоков
+
+        Returns:
+            Длительность паузы в секундах
+        """
+        with self._lock:
+            self._consecutive_limits += 1
+            self.rate_limit_hits += 1
+            if retry_after is None:
+                retry_after = self.base_cooldown * (2 ** (self._consecutive_limits - 1))
+            cooldown = min(retry_after, self.max_cooldown)
+            self._resume_at = max(self._resume_at, time.monotonic() + cooldown)
+
+        logger.warning(f"API rate limit hit, pausing requests for {cooldown:.1f}s")
+        return cooldown
+
+    def report_success(self):
+        """Сбрасывает экспоненциальную задержку"""
+        with self._lock:
+            self._consecutive_limits = 0
+
+class AsyncRateLimitSemaphore(RateLimitSemaphore):
+    """
+    Вариант RateLimitSemaphore для asyncio: ожидание паузы и слота
+    не блокирует цикл событий. Использовать из одного цикла событий.
+    """
+
+    def __init__(self, max_concurrent: int = 4, base_cooldown: float = 2.0, max_cooldown: float = 60.0):
+        super().__init__(max_concurrent, base_cooldown, max_cooldown)
+        self._async_semaphore = asyncio.BoundedSemaphore(self.max_concurrent)
+
+    async def acquire(self):
+        """Ждет окончания паузы и свободного слота"""
+        await self._wait_cooldown_async()
+        await self._async_semaphore.acquire()
+        # Пауза могла начаться, пока задача ждала слот
+        await self._wait_cooldown_async()
+
+    def release(self):
+        self._async_semaphore.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
+
+    def __enter__(self):
+        raise TypeError("Use 'async with' for AsyncRateLimitSemaphore")
+
+    async def _wait_cooldown_async(self):
+        while True:
+            with self._lock:
+                delay = self._resume_at - time.monotonic()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
@@ -1,91 +1,342 @@
-from typing import Dict
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from string import Formatter
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
-from config import IVAN_CONTACT
+from config import IVAN_CONTACT, REPORT_CACHE_ENTRIES, REPORT_LOCALE
+from quote_export import QuoteExporter
 
-class ReportGenerator:
-    def __init__(self):
-        self.ivan_contact = IVAN_CONTACT
-    
-    def create_analysis_report(self, analysis: Dict, cost_info: Dict, 
-                              timeline: Dict, client_info: Dict) -> str:
-        """Создает детальный отчет анализа для Ивана"""
-        
-        report = f"""🏠 **АНАЛИЗ ЗАЯВКИ КЛИЕНТА**
-📅 Дата: {datetime.now().strftime('%d.%m.%Y %H:%M')}
+ANALYSIS_REPORT = 'analysis_report'
+CLIENT_TEMPLATE = 'client_template'
+
+# Шаблоны отчетов по языкам. Поля contact_* подставляются один раз
+# при создании ReportGenerator, остальные - при каждом отчете
+REPORT_TEMPLATES = {
+    'ru': {
+        ANALYSIS_REPORT: """🏠 **АНАЛИЗ ЗАЯВКИ КЛИЕНТА**
+📅 Дата: {date}
 
 👤 **ИНФОРМАЦИЯ О КЛИЕНТЕ:**
-• Имя: {client_info.get('name', 'Не указано')}
-• Телефон: {client_info.get('phone', 'Не указан')}
-• Адрес: {client_info.get('address', 'Не указан')}
-• Количество сообщений: {client_info.get('message_count', 0)}
+• Имя: {client_name}
+• Телефон: {client_phone}
+• Адрес: {client_address}
+• Количество сообщений: {message_count}
 
 📊 **АНАЛИЗ ПОЛА:**
-• Тип покрытия: {self._get_floor_type_description(analysis.get('floor_type', 'unknown'))}
-• Состояние: {self._get_condition_description(analysis.get('condition', 'unknown'))}
-• Площадь: ~{analysis.get('total_area_estimate', 0)} кв.м
-• Сложность работ: {self._get_complexity_description(analysis.get('work_complexity', 'medium'))}
-• Проанализировано изображений: {analysis.get('images_analyzed', 0)}
+• Тип покрытия: {floor_type}
+• Состояние: {condition}
+• Площадь: ~{area} кв.м
+• Сложность работ: {complexity}
+• Проанализировано изображений: {images_analyzed}
 
 ⚠️ **ПОВРЕЖДЕНИЯ:**
-{self._format_damages(analysis.get('damages', []))}
+{damages}
 
 🔧 **РЕКОМЕНДУЕМЫЕ РАБОТЫ:**
-{self._format_recommendations(analysis.get('recommendations', []))}
+{recommendations}
 
 💰 **СТОИМОСТЬ:**
-• Базовая цена: {cost_info['base_price_per_sqm']}₪/кв.м
-• Базовая стоимость: {cost_info['base_cost']}₪
+• Базовая цена: {base_price_per_sqm}₪/кв.м
+• Базовая стоимость: {base_cost}₪
 • Коэффициенты:
-  - Состояние: x{cost_info['condition_multiplier']}
-  - Сложность: x{cost_info['complexity_multiplier']}
-  - Повреждения: x{cost_info['damage_multiplier']}
-• **ИТОГО: {cost_info['min_cost']}-{cost_info['max_cost']}₪**
-• **РЕКОМЕНДУЕМАЯ ЦЕНА: {cost_info['recommended_cost']}₪**
-
+  - Состояние: x{condition_multiplier}
+  - Сложность: x{complexity_multiplier}
+  - Повреждения: x{damage_multiplier}
+{discount}• **ИТОГО: {min_cost}-{max_cost}₪**
+• **РЕКОМЕНДУЕМАЯ ЦЕНА: {recommended_cost}₪**
+{manual_adjustments}
 ⏱️ **СРОКИ ВЫПОЛНЕНИЯ:**
-• Тип работ: {timeline['work_type']}
-• Время: {timeline['min_days']}-{timeline['max_days']} дней
-• Рекомендуемый срок: {timeline['estimated_days']} дней
+• Тип работ: {work_type}
+• Время: {min_days}-{max_days} дней
+• Рекомендуемый срок: {estimated_days} дней
 
 📝 **ДОПОЛНИТЕЛЬНАЯ ИНФОРМАЦИЯ:**
-{self._format_additional_info(analysis, client_info)}
+{additional_info}
 
 ---
-🤖 *Анализ выполнен ИИ-ботом {self.ivan_contact['name']}а*
-📞 *Контакт: {self.ivan_contact['phone']}*
-"""
-        return report
-    
-    def create_client_response_template(self, analysis: Dict, cost_info: Dict, 
-                                      timeline: Dict, client_info: Dict) -> str:
-        """Создает шаблон ответа для клиента"""
-        
-        client_name = client_info.get('name', 'Клиент')
-        
-        template = f"""Привет {client_name}! 👋
+🤖 *Анализ выполнен ИИ-ботом {contact_name}а*
+📞 *Контакт: {contact_phone}*
+""",
+        CLIENT_TEMPLATE: """Привет {client_name}! 👋
 
 Проанализировал твои фотографии. Вот что вижу:
 
-🏠 **Тип покрытия:** {self._get_floor_type_description(analysis.get('floor_type', 'unknown'))}
-📐 **Площадь:** примерно {analysis.get('total_area_estimate', 0)} кв.м
-⚠️ **Состояние:** {self._get_condition_description(analysis.get('condition', 'unknown'))}
+🏠 **Тип покрытия:** {floor_type}
+📐 **Площадь:** примерно {area} кв.м
+⚠️ **Состояние:** {condition}
 
-{self._format_damages_for_client(analysis.get('damages', []))}
+{damages}
 
 🔧 **Что нужно сделать:**
-{self._format_recommendations_for_client(analysis.get('recommendations', []))}
+{recommendations}
 
-💰 **Стоимость работ:** {cost_info['recommended_cost']}₪
-⏱️ **Время выполнения:** {timeline['estimated_days']} дней
+💰 **Стоимость работ:** {recommended_cost}₪
+⏱️ **Время выполнения:** {estimated_days} дней
 
 Когда удобно приехать для точного замера?
 
 С уважением,
-{self.ivan_contact['name']} 🔨
-📞 {self.ivan_contact['phone']}
+{contact_name} 🔨
+📞 {contact_phone}
 """
-        return template
+    }
+}
+
+# Тексты документа с предложением для клиента (QuoteExporter)
+QUOTE_TEXTS = {
+    'ru': {
+        'title': 'Предложение по ремонту пола',
+        'subtitle': 'Клиент: {client_name} · {date}',
+        'object': 'Объект',
+        'floor_type': 'Тип покрытия: {}',
+        'area': 'Площадь: примерно {} кв.м',
+        'condition': 'Состояние: {}',
+        'damages': 'Обнаруженные повреждения',
+        'no_damages': 'Серьезных повреждений не обнаружено',
+        'work': 'Что нужно сделать',
+        'no_recommendations': 'Требуется осмотр на месте для точной оценки',
+        'terms': 'Сроки и стоимость',
+        'days': 'Время выполнения: {} дней',
+        'discount': 'Скидка {}% (без скидки {}₪)',
+        'total': 'Стоимость работ: {}₪',
+        'note': 'Точная стоимость подтверждается после замера на месте.',
+        'photos': 'Фотографии',
+        'file_name': 'predlozhenie_{}'
+    }
+}
+
+FLOOR_TYPE_DESCRIPTIONS = {
+    'parquet': 'Паркет',
+    'laminate': 'Ламинат',
+    'tiles': 'Плитка',
+    'linoleum': 'Линолеум',
+    'carpet': 'Ковролин',
+    'concrete': 'Бетон',
+    'unknown': 'Неопределенный тип'
+}
+
+CONDITION_DESCRIPTIONS = {
+    'excellent': 'Отличное',
+    'good': 'Хорошее',
+    'fair': 'Удовлетворительное',
+    'poor': 'Плохое',
+    'unknown': 'Требует осмотра'
+}
+
+COMPLEXITY_DESCRIPTIONS = {
+    'low': 'Низкая (простой ремонт)',
+    'medium': 'Средняя (стандартные работы)',
+    'high': 'Высокая (сложный ремонт)'
+}
+
+SEVERITY_EMOJI = {
+    'minor': '🟡',
+    'moderate': '🟠',
+    'severe': '🔴'
+}
+
+def new_report_version() -> str:
+    """
+    Версия отчетов по данным чата. Выдается при каждом новом анализе
+    и пересчете цены; готовые отчеты старой версии больше не отдаются
+    """
+    return uuid.uuid4().hex
+
+def _escape_braces(text: str) -> str:
+    return text.replace('{', '{{').replace('}', '}}')
+
+def compile_template(template: str, static_fields: Dict) -> str:
+    """
+    Подставляет в шаблон постоянные поля. Остальные поля остаются
+    для format_map при отрисовке отчета
+    """
+    parts = []
+    for literal, field, spec, conversion in Formatter().parse(template):
+        parts.append(_escape_braces(literal))
+        if field is None:
+            continue
+        if field in static_fields:
+            parts.append(_escape_braces(format(static_fields[field], spec)))
+        else:
+            parts.append('{' + field + (f'!{conversion}' if conversion else '') + (f':{spec}' if spec else '') + '}')
+    return ''.join(parts)
+
+class ReportGenerator:
+    """
+    Тексты отчетов для Ивана и клиента.
+
+    Полный отчет и шаблон ответа клиенту собираются из шаблонов,
+    подготовленных при создании. render_report запоминает готовый текст
+    по (версия отчета, шаблон, язык), поэтому повторное нажатие кнопки
+    не собирает отчет заново. Версию меняют новый анализ и пересчет цены.
+    """
+
+    def __init__(self, locale: str = REPORT_LOCALE, cache_entries: int = REPORT_CACHE_ENTRIES,
+                 quote_exporter: Optional[QuoteExporter] = None):
+        self.ivan_contact = IVAN_CONTACT
+        self.quote_exporter = quote_exporter or QuoteExporter()
+        self.locale = locale if locale in REPORT_TEMPLATES else 'ru'
+        self.cache_entries = cache_entries
+
+        static_fields = {'contact_name': self.ivan_contact['name'], 'contact_phone': self.ivan_contact['phone']}
+        self.templates = {
+            locale: {name: compile_template(template, static_fields) for name, template in templates.items()}
+            for locale, templates in REPORT_TEMPLATES.items()
+        }
+
+        self.hits = 0
+        self.misses = 0
+        self._cache: 'OrderedDict[Tuple[str, str, str], str]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def render_report(self, template: str, user_data: Dict, locale: Optional[str] = None) -> str:
+        """
+        Отчет ANALYSIS_REPORT или CLIENT_TEMPLATE по данным чата из SessionStore
+
+        Отчеты с report_version берутся из кэша, если уже собирались.
+        Данные без версии (сохраненные до ее появления) собираются каждый раз.
+        """
+        locale = locale if locale in self.templates else self.locale
+        version = user_data.get('report_version')
+        if version is None:
+            return self._render(template, user_data, locale)
+
+        key = (version, template, locale)
+        with self._lock:
+            report = self._cache.get(key)
+            if report is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return report
+            self.misses += 1
+
+        report = self._render(template, user_data, locale)
+        with self._lock:
+            self._cache[key] = report
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return report
+
+    def _render(self, template: str, user_data: Dict, locale: str) -> str:
+        if template == ANALYSIS_REPORT:
+            render = self.create_analysis_report
+        elif template == CLIENT_TEMPLATE:
+            render = self.create_client_response_template
+        else:
+            raise ValueError(f"Unknown report template: {template}")
+        return render(
+            user_data['analysis'], user_data['cost_info'], user_data['timeline'], user_data['client_info'],
+            created_at=user_data.get('analyzed_at'), locale=locale
+        )
+
+    def create_analysis_report(self, analysis: Dict, cost_info: Dict,
+                               timeline: Dict, client_info: Dict,
+                               created_at: Optional[float] = None, locale: Optional[str] = None) -> str:
+        """
+        Создает детальный отчет анализа для Ивана
+
+        Args:
+            created_at: Время анализа (time.time()) для даты отчета; None - текущее
+        """
+        date = datetime.fromtimestamp(created_at if created_at is not None else time.time())
+        return self.templates.get(locale, self.templates[self.locale])[ANALYSIS_REPORT].format_map({
+            'date': date.strftime('%d.%m.%Y %H:%M'),
+            'client_name': client_info.get('name', 'Не указано'),
+            'client_phone': client_info.get('phone', 'Не указан'),
+            'client_address': client_info.get('address', 'Не указан'),
+            'message_count': client_info.get('message_count', 0),
+            'floor_type': self._get_floor_type_description(analysis.get('floor_type', 'unknown')),
+            'condition': self._get_condition_description(analysis.get('condition', 'unknown')),
+            'area': analysis.get('total_area_estimate', 0),
+            'complexity': self._get_complexity_description(analysis.get('work_complexity', 'medium')),
+            'images_analyzed': analysis.get('images_analyzed', 0),
+            'damages': self._format_damages(analysis.get('damages', [])),
+            'recommendations': self._format_recommendations(analysis.get('recommendations', [])),
+            'base_price_per_sqm': cost_info['base_price_per_sqm'],
+            'base_cost': cost_info['base_cost'],
+            'condition_multiplier': cost_info['condition_multiplier'],
+            'complexity_multiplier': cost_info['complexity_multiplier'],
+            'damage_multiplier': cost_info['damage_multiplier'],
+            'discount': self._format_discount(cost_info),
+            'min_cost': cost_info['min_cost'],
+            'max_cost': cost_info['max_cost'],
+            'recommended_cost': cost_info['recommended_cost'],
+            'manual_adjustments': self._format_manual_adjustments(analysis.get('manual_adjustments')),
+            'work_type': timeline['work_type'],
+            'min_days': timeline['min_days'],
+            'max_days': timeline['max_days'],
+            'estimated_days': timeline['estimated_days'],
+            'additional_info': self._format_additional_info(analysis, client_info)
+        })
     
+    def create_client_response_template(self, analysis: Dict, cost_info: Dict,
+                                        timeline: Dict, client_info: Dict,
+                                        created_at: Optional[float] = None, locale: Optional[str] = None) -> str:
+        """Создает шаблон ответа для клиента"""
+        return self.templates.get(locale, self.templates[self.locale])[CLIENT_TEMPLATE].format_map({
+            'client_name': client_info.get('name', 'Клиент'),
+            'floor_type': self._get_floor_type_description(analysis.get('floor_type', 'unknown')),
+            'area': analysis.get('total_area_estimate', 0),
+            'condition': self._get_condition_description(analysis.get('condition', 'unknown')),
+            'damages': self._format_damages_for_client(analysis.get('damages', [])),
+            'recommendations': self._format_recommendations_for_client(analysis.get('recommendations', [])),
+            'recommended_cost': cost_info['recommended_cost'],
+            'estimated_days': timeline['estimated_days']
+        })
+    
+    def create_quote_document(self, user_data: Dict, locale: Optional[str] = None) -> Dict:
+        """Текст документа с предложением для клиента по данным чата из SessionStore"""
+        texts = QUOTE_TEXTS.get(locale) or QUOTE_TEXTS.get(self.locale) or QUOTE_TEXTS['ru']
+        analysis, cost_info, timeline = user_data['analysis'], user_data['cost_info'], user_data['timeline']
+        created_at = datetime.fromtimestamp(user_data.get('analyzed_at') or time.time())
+
+        terms = [texts['days'].format(timeline['estimated_days'])]
+        if cost_info.get('discount_percent'):
+            terms.append(texts['discount'].format(cost_info['discount_percent'], cost_info['cost_before_discount']))
+
+        return {
+            'title': texts['title'],
+            'subtitle': texts['subtitle'].format(
+                client_name=user_data['client_info'].get('name', 'Клиент'), date=created_at.strftime('%d.%m.%Y')
+            ),
+            'sections': [
+                {'heading': texts['object'], 'lines': [
+                    texts['floor_type'].format(self._get_floor_type_description(analysis.get('floor_type', 'unknown'))),
+                    texts['area'].format(analysis.get('total_area_estimate', 0)),
+                    texts['condition'].format(self._get_condition_description(analysis.get('condition', 'unknown')))
+                ]},
+                {'heading': texts['damages'], 'lines': [
+                    damage.get('description', 'Повреждение') for damage in analysis.get('damages', [])
+                ] or [texts['no_damages']]},
+                {'heading': texts['work'], 'lines': list(analysis.get('recommendations', [])) or [
+                    texts['no_recommendations']
+                ]},
+                {'heading': texts['terms'], 'lines': terms}
+            ],
+            'total': texts['total'].format(cost_info['recommended_cost']),
+            'note': texts['note'],
+            'photos_heading': texts['photos'],
+            'footer': [self.ivan_contact['name'], self.ivan_contact['business'], self.ivan_contact['phone']],
+            'file_name': texts['file_name'].format(created_at.strftime('%Y%m%d'))
+        }
+
+    def add_quote_images(self, image_paths: List[str]) -> List[str]:
+        """Миниатюры проанализированных фото для документа; вызывать до удаления файлов"""
+        return self.quote_exporter.add_images(image_paths)
+
+    def export_quote(self, user_data: Dict, locale: Optional[str] = None) -> Tuple[str, bytes]:
+        """
+        Документ с предложением (PDF или HTML) с фотографиями из quote_images
+
+        Returns:
+            (имя файла, содержимое) для send_document
+        """
+        return self.quote_exporter.export(
+            self.create_quote_document(user_data, locale), user_data.get('quote_images', [])
+        )
+
     def create_quick_summary(self, analysis: Dict, cost_info: Dict) -> str:
         """Создает краткую сводку для быстрого просмотра"""
         
@@ -99,41 +350,129 @@ class ReportGenerator:
 🏠 {floor_type} | 📐 {area} кв.м | ⚠️ {condition}
 💰 {price}₪ | 🔧 {len(analysis.get('recommendations', []))} рекомендаций
 📸 Проанализировано: {analysis.get('images_analyzed', 0)} изображений
-"""
+{self._format_discount(cost_info)}{self._format_manual_adjustments(analysis.get('manual_adjustments'))}"""
         return summary
     
+    def create_adjustment_prompt(self, analysis: Dict, cost_info: Dict) -> str:
+        """Инструкция для ручной правки цены с текущими значениями"""
+        adjustments = analysis.get('manual_adjustments', {})
+        return f"""💰 **ИЗМЕНЕНИЕ ЦЕНЫ**
+
+Сейчас:
+🏠 {self._get_floor_type_description(analysis.get('floor_type', 'unknown'))} | 📐 {analysis.get('total_area_estimate', 0)} кв.м | ⚠️ {self._get_condition_description(analysis.get('condition', 'unknown'))}
+💰 {cost_info['recommended_cost']}₪ | 🏷️ скидка {adjustments.get('discount', 0)}%
+
+Отправьте правки одним сообщением, например:
+`площадь 35, тип ламинат, состояние хорошее, скидка 10`
+
+Типы: паркет, ламинат, плитка, линолеум
+Состояние: отличное, хорошее, удовлетворительное, плохое"""
+    
+    def create_analysis_details(self, analysis: Dict) -> str:
+        """Детали анализа по каждому изображению"""
+        lines = ["📊 **ДЕТАЛИ АНАЛИЗА**", ""]
+        
+        individual = analysis.get('individual_analyses', [])
+        if not individual:
+            lines.append("Анализ выполнен по одному изображению.")
+        
+        for i, item in enumerate(individual, 1):
+            name = self._escape_markdown(item.get('image_name', f'Изображение {i}'))
+            if not item.get('success'):
+                lines.append(f"{i}. {name}: ❌ {self._escape_markdown(item.get('error', 'ошибка анализа'))}")
+                continue
+            lines.append(
+                f"{i}. {name}: {self._get_floor_type_description(item.get('floor_type', 'unknown'))}, "
+                f"{self._get_condition_description(item.get('condition', 'unknown')).lower()}, "
+                f"~{item.get('area_estimate', '?')} кв.м, повреждений: {len(item.get('damages', []))}"
+            )
+        
+        usage = analysis.get('token_usage')
+        if usage:
+            lines.append("")
+            lines.append(
+                f"🔢 Токены: {usage.get('input_tokens', 0)} вход / {usage.get('output_tokens', 0)} выход"
+            )
+        if analysis.get('bytes_saved'):
+            lines.append(f"📉 Сэкономлено при загрузке: {analysis['bytes_saved'] // 1024} КБ")
+        
+        return '\n'.join(lines)
+    
+    def create_progress_update(self, done: int, total: int, analysis: Dict,
+                               cost_info: Optional[Dict] = None) -> str:
+        """Текст статусного сообщения во время анализа: прогресс и предварительная оценка"""
+        filled = round(10 * done / total) if total else 10
+        progress = f"""🔍 Анализ изображений: {done}/{total}
+{'▓' * filled}{'░' * (10 - filled)} {round(100 * done / total) if total else 100}%"""
+        
+        if not cost_info:
+            return progress
+        
+        floor_type = self._get_floor_type_description(analysis.get('floor_type', 'unknown'))
+        condition = self._get_condition_description(analysis.get('condition', 'unknown'))
+        area = analysis.get('total_area_estimate', 0)
+        
+        return f"""{progress}
+
+Предварительно:
+🏠 {floor_type} | 📐 ~{area} кв.м | ⚠️ {condition}
+💰 {cost_info['min_cost']}-{cost_info['max_cost']}₪ (уточняется)"""
+    
+    def create_search_results(self, query: str, hits: List[Dict]) -> str:
+        """Результаты поиска по перепискам"""
+        if not hits:
+            return f"🔎 По запросу «{self._escape_markdown(query)}» ничего не найдено"
+        
+        lines = [f"🔎 **Найдено по запросу «{self._escape_markdown(query)}»:**", ""]
+        for i, hit in enumerate(hits, 1):
+            client = self._escape_markdown(hit['client_name'] or 'Клиент')
+            if hit.get('phone'):
+                client += f" ({self._escape_markdown(hit['phone'])})"
+            text = hit['message'] if len(hit['message']) <= 200 else hit['message'][:200] + '…'
+            lines.append(f"{i}. 👤 {client} - {hit['timestamp']}")
+            lines.append(f"{self._escape_markdown(hit['sender'])}: {self._escape_markdown(text)}")
+            lines.append("")
+        return '\n'.join(lines).rstrip()
+    
+    def _format_discount(self, cost_info: Dict) -> str:
+        """Строка со скидкой (пустая, если скидки нет)"""
+        if not cost_info.get('discount_percent'):
+            return ""
+        return f"• Скидка: {cost_info['discount_percent']}% (без скидки {cost_info['cost_before_discount']}₪)\n"
+    
+    def _format_manual_adjustments(self, adjustments: Optional[Dict]) -> str:
+        """Строка с ручными правками (пустая, если правок нет)"""
+        if not adjustments:
+            return ""
+        
+        parts = []
+        if 'floor_type' in adjustments:
+            parts.append(f"тип: {self._get_floor_type_description(adjustments['floor_type']).lower()}")
+        if 'condition' in adjustments:
+            parts.append(f"состояние: {self._get_condition_description(adjustments['condition']).lower()}")
+        if 'area' in adjustments:
+            parts.append(f"площадь: {adjustments['area']} кв.м")
+        if 'discount' in adjustments:
+            parts.append(f"скидка: {adjustments['discount']}%")
+        return f"✏️ Изменено вручную: {', '.join(parts)}\n"
+    
+    def _escape_markdown(self, text: str) -> str:
+        """Экранирует служебные символы Markdown в именах файлов и ошибках"""
+        for char in ('_', '*', '`', '['):
+            text = text.replace(char, '\\' + char)
+        return text
+    
     def _get_floor_type_description(self, floor_type: str) -> str:
         """Возвращает описание типа пола"""
-        descriptions = {
-            'parquet': 'Паркет',
-            'laminate': 'Ламинат',
-            'tiles': 'Плитка',
-            'linoleum': 'Линолеум',
-            'carpet': 'Ковролин',
-            'concrete': 'Бетон',
-            'unknown': 'Неопределенный тип'
-        }
-        return descriptions.get(floor_type, 'Неопределенный тип')
+        return FLOOR_TYPE_DESCRIPTIONS.get(floor_type, 'Неопределенный тип')
     
     def _get_condition_description(self, condition: str) -> str:
         """Возвращает описание состояния"""
-        descriptions = {
-            'excellent': 'Отличное',
-            'good': 'Хорошее',
-            'fair': 'Удовлетворительное',
-            'poor': 'Плохое',
-            'unknown': 'Требует осмотра'
-        }
-        return descriptions.get(condition, 'Требует осмотра')
+        return CONDITION_DESCRIPTIONS.get(condition, 'Требует осмотра')
     
     def _get_complexity_description(self, complexity: str) -> str:
         """Возвращает описание сложности работ"""
-        descriptions = {
-            'low': 'Низкая (простой ремонт)',
-            'medium': 'Средняя (стандартные работы)',
-            'high': 'Высокая (сложный ремонт)'
-        }
-        return descriptions.get(complexity, 'Средняя')
+        return COMPLEXITY_DESCRIPTIONS.get(complexity, 'Средняя')
     
     def _format_damages(self, damages: list) -> str:
         """Форматирует список повреждений"""
@@ -142,12 +481,7 @@ class ReportGenerator:
         
         formatted = []
         for damage in damages:
-            severity_emoji = {
-                'minor': '🟡',
-                'moderate': '🟠', 
-                'severe': '🔴'
-            }
-            emoji = severity_emoji.get(damage.get('severity', 'minor'), '🟡')
+            emoji = SEVERITY_EMOJI.get(damage.get('severity', 'minor'), '🟡')
             formatted.append(f"• {emoji} {damage.get('description', 'Повреждение')}")
         
         return '\n'.join(formatted)
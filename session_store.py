@@ -0,0 +1,179 @@
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from config import SESSION_DB_PATH, SESSION_MEMORY_ENTRIES, SESSION_TTL
+
+logger = logging.getLogger(__name__)
+
+# Поля, которые нужны обработчикам кнопок после анализа
+SESSION_FIELDS = (
+    'analysis', 'cost_info', 'timeline', 'client_info', 'is_single_photo',
+    'original_analysis', 'awaiting_adjustment', 'report_version', 'analyzed_at',
+    'quote_images'
+)
+
+class SessionStore:
+    """
+    Хранилище данных анализа по чатам.
+
+    Перед SQLite стоит ограниченный LRU в памяти. Записи живут ttl секунд.
+    База в режиме WAL, поэтому ее могут использовать несколько процессов:
+    перед отдачей записи из памяти сверяется ее версия в базе.
+    Если db_path не задан, данные хранятся только в памяти.
+    """
+
+    # Удаляем просроченные записи из базы не чаще, чем раз в N записей
+    PURGE_EVERY = 100
+
+    def __init__(self, db_path: Optional[str] = SESSION_DB_PATH, ttl: float = SESSION_TTL,
+                 max_memory_entries: int = SESSION_MEMORY_ENTRIES):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+
+        self._memory = OrderedDict()  # chat_id -> (updated_at, expires_at, data)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes_since_purge = 0
+
+        if self.db_path:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            with self._connection() as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS sessions (
+                        chat_id INTEGER PRIMARY KEY,
+                        data TEXT NOT NULL,
+                        updated_at REAL NOT NULL,
+                        expires_at REAL NOT NULL
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        """Отдельное соединение на каждый поток"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, chat_id: int) -> Optional[Dict]:
+        """Возвращает копию данных чата или None"""
+        now = time.time()
+
+        with self._lock:
+            cached = self._memory.get(chat_id)
+
+        if not self.db_path:
+            if cached is None or cached[1] < now:
+                self.delete(chat_id)
+                return None
+            with self._lock:
+                self._memory.move_to_end(chat_id)
+            return copy.deepcopy(cached[2])
+
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT updated_at, expires_at FROM sessions WHERE chat_id = ?", (chat_id,)
+        ).fetchone()
+        if row is None:
+            with self._lock:
+                self._memory.pop(chat_id, None)
+            return None
+        if row[1] < now:
+            self.delete(chat_id)
+            return None
+
+        # Запись в памяти актуальна, если другой процесс ее не перезаписал
+        if cached is not None and cached[0] == row[0]:
+            with self._lock:
+                if chat_id in self._memory:
+                    self._memory.move_to_end(chat_id)
+            return copy.deepcopy(cached[2])
+
+        row = conn.execute(
+            "SELECT data, updated_at, expires_at FROM sessions WHERE chat_id = ?", (chat_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        data = json.loads(row[0])
+        self._remember(chat_id, row[1], row[2], data)
+        return copy.deepcopy(data)
+
+    def set(self, chat_id: int, data: Dict, ttl: Optional[float] = None):
+        """Сохраняет данные чата (только поля из SESSION_FIELDS)"""
+        data = {key: copy.deepcopy(value) for key, value in data.items() if key in SESSION_FIELDS}
+        updated_at = time.time()
+        expires_at = updated_at + (ttl if ttl is not None else self.ttl)
+
+        if self.db_path:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO sessions (chat_id, data, updated_at, expires_at) VALUES (?, ?, ?, ?)",
+                    (chat_id, json.dumps(data, ensure_ascii=False), updated_at, expires_at)
+                )
+
+        self._remember(chat_id, updated_at, expires_at, data)
+
+        with self._lock:
+            self._writes_since_purge += 1
+            should_purge = self._writes_since_purge >= self.PURGE_EVERY
+            if should_purge:
+                self._writes_since_purge = 0
+        if should_purge:
+            self.purge_expired()
+
+    def delete(self, chat_id: int):
+        """Удаляет данные чата"""
+        with self._lock:
+            self._memory.pop(chat_id, None)
+        if self.db_path:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM sessions WHERE chat_id = ?", (chat_id,))
+
+    def __contains__(self, chat_id: int) -> bool:
+        return self.get(chat_id) is not None
+
+    def _remember(self, chat_id: int, updated_at: float, expires_at: float, data: Dict):
+        with self._lock:
+            self._memory[chat_id] = (updated_at, expires_at, data)
+            self._memory.move_to_end(chat_id)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def purge_expired(self) -> int:
+        """Удаляет просроченные записи, возвращает их количество"""
+        now = time.time()
+        with self._lock:
+            expired = [chat_id for chat_id, entry in self._memory.items() if entry[1] < now]
+            for chat_id in expired:
+                del self._memory[chat_id]
+
+        removed = len(expired)
+        if self.db_path:
+            conn = self._connection()
+            with conn:
+                removed = conn.execute("DELETE FROM sessions WHERE expires_at < ?", (now,)).rowcount
+        return removed
+
+    def stats(self) -> Dict:
+        with self._lock:
+            memory_entries = len(self._memory)
+        stored_entries = memory_entries
+        if self.db_path:
+            stored_entries = self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {
+            'memory_entries': memory_entries,
+            'stored_entries': stored_entries
+        }
@@ -0,0 +1,197 @@
+import os
+import tempfile
+import logging
+from typing import BinaryIO, Optional
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from telebot import apihelper, asyncio_helper
+
+from config import (
+    MAX_FILE_SIZE, UPLOAD_FOLDER, DOWNLOAD_CHUNK_SIZE, DOWNLOAD_MEMORY_BUDGET,
+    DOWNLOAD_POOL_SIZE, DOWNLOAD_TIMEOUT
+)
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DOWNLOADED_BYTES = REGISTRY.counter('vanya_download_bytes_total', 'Bytes downloaded from Telegram')
+
+class FileTooLargeError(Exception):
+    pass
+
+class _BaseDownloader:
+    """Общие настройки, URL файла и проверка размера для синхронной и asyncio версий"""
+
+    # Модуль telebot, из которого берется FILE_URL (локальный Bot API сервер)
+    api_helper = apihelper
+
+    def __init__(self, token: str, memory_budget: int = DOWNLOAD_MEMORY_BUDGET,
+                 chunk_size: int = DOWNLOAD_CHUNK_SIZE, pool_size: int = DOWNLOAD_POOL_SIZE,
+                 max_file_size: int = MAX_FILE_SIZE, timeout: float = DOWNLOAD_TIMEOUT):
+        self.token = token
+        self.memory_budget = memory_budget
+        self.chunk_size = chunk_size
+        self.pool_size = pool_size
+        self.max_file_size = max_file_size
+        self.timeout = timeout
+
+    def _file_url(self, file_path: str) -> str:
+        # Учитываем локальный Bot API сервер, если он настроен в telebot
+        if self.api_helper.FILE_URL is None:
+            return "https://api.telegram.org/file/bot{0}/{1}".format(self.token, file_path)
+        return self.api_helper.FILE_URL.format(self.token, file_path)
+
+    def _check_size(self, size: int):
+        if size > self.max_file_size:
+            raise FileTooLargeError(f"File exceeds {self.max_file_size} bytes")
+
+    def _temp_dir(self) -> str:
+        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+        return UPLOAD_FOLDER
+
+class TelegramDownloader(_BaseDownloader):
+    """
+    Скачивание файлов Telegram через общий пул keep-alive соединений.
+
+    Файл читается потоком по частям: небольшие файлы остаются в памяти,
+    большие сбрасываются во временный файл на диске.
+    """
+
+    def __init__(self, token: str, **kwargs):
+        super().__init__(token, **kwargs)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _stream_to(self, file_path: str, target: BinaryIO) -> int:
+        """Пишет файл в target по частям, возвращает размер"""
+        size = 0
+        with self.session.get(self._file_url(file_path), stream=True, timeout=self.timeout,
+                              proxies=apihelper.proxy) as response:
+            if response.status_code != 200:
+                raise apihelper.ApiHTTPException('Download file', response)
+
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                size += len(chunk)
+                self._check_size(size)
+                target.write(chunk)
+
+        DOWNLOADED_BYTES.inc(size)
+        return size
+
+    def download(self, file_path: str) -> BinaryIO:
+        """
+        Скачивает файл в буфер
+
+        Returns:
+            SpooledTemporaryFile, перемотанный в начало. Вызывающий код закрывает его сам.
+        """
+        buffer = tempfile.SpooledTemporaryFile(max_size=self.memory_budget, dir=self._temp_dir())
+        try:
+            size = self._stream_to(file_path, buffer)
+        except Exception:
+            buffer.close()
+            raise
+
+        buffer.seek(0)
+        logger.info(f"Downloaded {size} bytes from Telegram")
+        return buffer
+
+    def download_to_path(self, file_path: str, suffix: str = '') -> str:
+        """
+        Скачивает файл во временный файл на диске
+
+        Returns:
+            Путь к файлу. Вызывающий код удаляет его сам.
+        """
+        with tempfile.NamedTemporaryFile(suffix=suffix, dir=self._temp_dir(), delete=False) as temp_file:
+            try:
+                size = self._stream_to(file_path, temp_file)
+            except Exception:
+                temp_file.close()
+                os.unlink(temp_file.name)
+                raise
+
+        logger.info(f"Downloaded {size} bytes from Telegram")
+        return temp_file.name
+
+class AsyncTelegramDownloader(_BaseDownloader):
+    """
+    Скачивание файлов Telegram для asyncio: общий пул соединений aiohttp,
+    чтение ответа по частям без загрузки файла целиком в память
+    """
+
+    api_helper = asyncio_helper
+
+    def __init__(self, token: str, **kwargs):
+        super().__init__(token, **kwargs)
+        # Сессия создается при первом запросе - ей нужен запущенный цикл событий
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self.session
+
+    async def _stream_to(self, file_path: str, target: BinaryIO) -> int:
+        """Пишет файл в target по частям, возвращает размер"""
+        size = 0
+        async with self._get_session().get(self._file_url(file_path), proxy=asyncio_helper.proxy) as response:
+            if response.status != 200:
+                raise asyncio_helper.ApiHTTPException('Download file', response)
+
+            async for chunk in response.content.iter_chunked(self.chunk_size):
+                size += len(chunk)
+                self._check_size(size)
+                target.write(chunk)
+
+        DOWNLOADED_BYTES.inc(size)
+        return size
+
+    async def download(self, file_path: str) -> BinaryIO:
+        """
+        Скачивает файл в буфер
+
+        Returns:
+            SpooledTemporaryFile, перемотанный в начало. Вызывающий код закрывает его сам.
+        """
+        buffer = tempfile.SpooledTemporaryFile(max_size=self.memory_budget, dir=self._temp_dir())
+        try:
+            size = await self._stream_to(file_path, buffer)
+        except BaseException:
+            buffer.close()
+            raise
+
+        buffer.seek(0)
+        logger.info(f"Downloaded {size} bytes from Telegram")
+        return buffer
+
+    async def download_to_path(self, file_path: str, suffix: str = '') -> str:
+        """
+        Скачивает файл во временный файл на диске
+
+        Returns:
+            Путь к файлу. Вызывающий код удаляет его сам.
+        """
+        with tempfile.NamedTemporaryFile(suffix=suffix, dir=self._temp_dir(), delete=False) as temp_file:
+            try:
+                size = await self._stream_to(file_path, temp_file)
+            except BaseException:
+                temp_file.close()
+                os.unlink(temp_file.name)
+                raise
+
+        logger.info(f"Downloaded {size} bytes from Telegram")
+        return temp_file.name
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
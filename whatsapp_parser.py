@@ -1,146 +1,277 @@
 import zipfile
+import io
 import os
 import re
+import shutil
 import tempfile
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import BinaryIO, Iterable, Iterator, List, Dict, Optional, Pattern, TextIO, Tuple, Union
+import itertools
 import logging
+from collections import Counter
+from config import MEDIA_DEDUP_ENABLED, MAX_EXTRACT_SIZE, UPLOAD_FOLDER, IMAGE_SELECTION_MAX_IMAGES
+from image_dedup import ImageDeduplicator
+from image_selector import ImageSelector
+from message_classifier import MessageClassifier, MEDIA, SYSTEM, FLOOR, ADDRESS, PHONE
+from message_store import MessageStore
+from metrics import track_stage
 
 logger = logging.getLogger(__name__)
 
+# Строка заголовка сообщения WhatsApp для каждого поддерживаемого формата даты.
+# Группы: дата, отправитель (нет у системных уведомлений), первая строка текста
+CHAT_LINE_PATTERNS = [
+    re.compile(r'\[(\d{2}\.\d{2}\.\d{4}, \d{2}:\d{2}:\d{2})\] (?:([^:]+): )?(.*)'),  # [DD.MM.YYYY, HH:MM:SS] Name: Message
+    re.compile(r'(\d{2}\.\d{2}\.\d{4}, \d{2}:\d{2}) - (?:([^:]+): )?(.*)'),          # DD.MM.YYYY, HH:MM - Name: Message
+    re.compile(r'(\d{1,2}/\d{1,2}/\d{2,4}, \d{1,2}:\d{2} [AP]M) - (?:([^:]+): )?(.*)')  # M/D/YY, H:MM AM/PM - Name: Message
+]
+
+# Сколько первых строк используется для определения формата
+FORMAT_DETECTION_LINES = 50
+
+# Сколько сообщений классифицируется за раз (MessageClassifier.classify_many)
+CLASSIFY_CHUNK_SIZE = 2000
+
+# BOM и метки направления текста, которые WhatsApp добавляет в начало строк
+INVISIBLE_MARKS = '\ufeff\u200e\u200f'
+
 class WhatsAppParser:
-    def __init__(self):
+    def __init__(self, deduplicator: Optional[ImageDeduplicator] = None,
+                 max_extract_size: int = MAX_EXTRACT_SIZE, selector: Optional[ImageSelector] = None,
+                 classifier: Optional[MessageClassifier] = None):
         self.supported_image_formats = {'.jpg', '.jpeg', '.png', '.webp'}
         self.supported_audio_formats = {'.m4a', '.ogg', '.mp3'}
+        self.max_extract_size = max_extract_size
+        
+        # Признаки сообщений (медиа, системное, пол, адрес, телефон) за один проход
+        self.classifier = classifier or MessageClassifier()
+        
+        # Отбрасывание почти одинаковых фото
+        if deduplicator is None and MEDIA_DEDUP_ENABLED:
+            deduplicator = ImageDeduplicator()
+        self.deduplicator = deduplicator
+        
+        # Ограничение числа фото, отправляемых на анализ
+        if selector is None and IMAGE_SELECTION_MAX_IMAGES > 0:
+            selector = ImageSelector()
+        self.selector = selector
     
-    def process_whatsapp_export(self, zip_content: bytes) -> Dict:
+    def process_whatsapp_export(self, zip_content: Union[bytes, BinaryIO, str],
+                                extract_dir: Optional[str] = None) -> Dict:
         """
         Обрабатывает ZIP архив с экспортом WhatsApp
         
+        Архив читается напрямую из буфера, файла или пути без промежуточной
+        копии на диске. Текст чата парсится из потока, а на диск извлекаются
+        только медиафайлы поддерживаемых форматов в пределах max_extract_size.
+        
+        Args:
+            zip_content: Байты архива, открытый бинарный файл или путь к архиву
+            extract_dir: Папка для медиафайлов. Если не указана, создается
+                временная папка, которую нужно удалить через cleanup_export()
+        
         Returns:
             Dict с результатами парсинга
         """
         result = {
             'success': False,
-            'chat_messages': [],
+            'chat_messages': MessageStore(),
             'media_files': [],
             'client_info': {},
             'conversation_context': '',
+            'duplicate_media': [],
+            'skipped_media': [],
+            'unselected_media': [],
+            'extract_dir': None,
             'error': None
         }
         
+        created_dir = None
         try:
-            with tempfile.TemporaryDirectory() as temp_dir:
-                # Сохраняем ZIP файл
-                zip_path = os.path.join(temp_dir, 'whatsapp_export.zip')
-                with open(zip_path, 'wb') as f:
-                    f.write(zip_content)
-                
-                # Распаковываем архив
-                with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                    zip_ref.extractall(temp_dir)
-                
-                # Парсим содержимое
-                result = self._parse_extracted_content(temp_dir)
-                result['success'] = True
+            if extract_dir is None:
+                os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+                extract_dir = created_dir = tempfile.mkdtemp(prefix='whatsapp_', dir=UPLOAD_FOLDER)
+            
+            source = io.BytesIO(zip_content) if isinstance(zip_content, (bytes, bytearray)) else zip_content
+            with zipfile.ZipFile(source, 'r') as zip_ref:
+                result.update(self._parse_archive(zip_ref, extract_dir))
+            
+            result['extract_dir'] = extract_dir
+            result['success'] = True
                 
         except Exception as e:
             logger.error(f"Error processing WhatsApp export: {e}")
             result['error'] = str(e)
+            if created_dir:
+                shutil.rmtree(created_dir, ignore_errors=True)
         
         return result
     
-    def _parse_extracted_content(self, extract_dir: str) -> Dict:
-        """Парсит содержимое распакованного архива"""
+    def cleanup_export(self, result: Dict):
+        """Удаляет извлеченные медиафайлы экспорта"""
+        if result.get('extract_dir'):
+            shutil.rmtree(result['extract_dir'], ignore_errors=True)
+            result['extract_dir'] = None
+    
+    def _parse_archive(self, zip_ref: zipfile.ZipFile, extract_dir: str) -> Dict:
+        """Парсит содержимое архива"""
         result = {
-            'chat_messages': [],
+            'chat_messages': MessageStore(),
             'media_files': [],
             'client_info': {},
-            'conversation_context': ''
+            'conversation_context': '',
+            'duplicate_media': [],
+            'skipped_media': [],
+            'unselected_media': []
         }
         
-        # Ищем файл чата
-        chat_file = self._find_chat_file(extract_dir)
-        if chat_file:
-            result['chat_messages'] = self._parse_chat_file(chat_file)
-            result['client_info'] = self._extract_client_info(result['chat_messages'])
-            result['conversation_context'] = self._create_conversation_context(result['chat_messages'])
+        # Читаем чат прямо из архива
+        chat_member = self._find_chat_member(zip_ref)
+        if chat_member:
+            with track_stage('zip', 'chat_parse'):
+                with zip_ref.open(chat_member) as raw_stream:
+                    with io.TextIOWrapper(raw_stream, encoding='utf-8') as chat_stream:
+                        result['chat_messages'] = self._parse_chat_file(chat_stream)
+                result['client_info'] = self._extract_client_info(result['chat_messages'])
+                result['conversation_context'] = self._create_conversation_context(result['chat_messages'])
         
-        # Ищем медиафайлы
-        result['media_files'] = self._find_media_files(extract_dir)
+        # Извлекаем медиафайлы
+        with track_stage('zip', 'extract'):
+            result['media_files'], result['skipped_media'] = self._extract_media_members(zip_ref, extract_dir)
+        
+        # Оставляем по одному фото из каждой группы дубликатов
+        if self.deduplicator:
+            with track_stage('zip', 'dedup'):
+                result['media_files'], result['duplicate_media'] = self.deduplicator.deduplicate(result['media_files'])
+        
+        # Отправляем на анализ только лучшие фото
+        if self.selector:
+            with track_stage('zip', 'select'):
+                result['media_files'], result['unselected_media'] = self.selector.select(
+                    result['media_files'], result['chat_messages']
+                )
         
         return result
     
-    def _find_chat_file(self, extract_dir: str) -> Optional[str]:
-        """Находит файл с текстом чата"""
-        for file in os.listdir(extract_dir):
-            if file.endswith('_chat.txt') or file == '_chat.txt':
-                return os.path.join(extract_dir, file)
+    def _find_chat_member(self, zip_ref: zipfile.ZipFile) -> Optional[zipfile.ZipInfo]:
+        """Находит файл с текстом чата в архиве"""
+        for member in zip_ref.infolist():
+            if not member.is_dir() and os.path.basename(member.filename).endswith('_chat.txt'):
+                return member
         return None
     
-    def _parse_chat_file(self, chat_file_path: str) -> List[Dict]:
-        """Парсит файл чата WhatsApp"""
-        messages = []
-        
+    def _parse_chat_file(self, chat_file: Union[str, TextIO]) -> MessageStore:
+        """
+        Парсит файл чата WhatsApp (путь или текстовый поток) в компактное
+        хранилище сообщений. Элементы хранилища ведут себя как словари
+        iter_chat_messages.
+        """
         try:
-            with open(chat_file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Регулярное выражение для парсинга сообщений WhatsApp
-            # Поддерживает разные форматы дат
-            patterns = [
-                r'\[(\d{2}\.\d{2}\.\d{4}, \d{2}:\d{2}:\d{2})\] ([^:]+): (.+)',  # [DD.MM.YYYY, HH:MM:SS] Name: Message
-                r'(\d{2}\.\d{2}\.\d{4}, \d{2}:\d{2}) - ([^:]+): (.+)',          # DD.MM.YYYY, HH:MM - Name: Message
-                r'(\d{1,2}/\d{1,2}/\d{2,4}, \d{1,2}:\d{2} [AP]M) - ([^:]+): (.+)'  # M/D/YY, H:MM AM/PM - Name: Message
-            ]
-            
-            for pattern in patterns:
-                matches = re.findall(pattern, content, re.MULTILINE | re.DOTALL)
-                if matches:
-                    for match in matches:
-                        timestamp_str, sender, message = match
-                        
-                        messages.append({
-                            'timestamp': timestamp_str,
-                            'sender': sender.strip(),
-                            'message': message.strip(),
-                            'is_media': self._is_media_message(message),
-                            'is_system': self._is_system_message(message)
-                        })
-                    break
+            if isinstance(chat_file, str):
+                with open(chat_file, 'r', encoding='utf-8') as f:
+                    return self._store_messages(f)
+            return self._store_messages(chat_file)
             
         except Exception as e:
             logger.error(f"Error parsing chat file: {e}")
-        
+            return MessageStore()
+    
+    def _store_messages(self, lines: Iterable[str]) -> MessageStore:
+        messages = MessageStore()
+        for raw_messages in self._iter_raw_chunks(lines):
+            messages.extend(self._classify_raw(raw_messages))
         return messages
     
+    def iter_chat_messages(self, lines: Iterable[str]) -> Iterator[Dict]:
+        """
+        Построчно разбирает чат за один проход и лениво отдает сообщения
+        
+        Формат даты определяется по первым строкам, строки без заголовка
+        присоединяются к предыдущему сообщению. Строки с датой, но без
+        отправителя (системные уведомления) завершают предыдущее сообщение
+        и пропускаются. Признаки сообщений определяются пачками по
+        CLASSIFY_CHUNK_SIZE сообщений.
+        """
+        for raw_messages in self._iter_raw_chunks(lines):
+            yield from self._build_messages(raw_messages)
+    
+    def _iter_raw_chunks(self, lines: Iterable[str]) -> Iterator[List[Tuple[str, str, str]]]:
+        """Пачки сообщений (дата, отправитель, текст) по CLASSIFY_CHUNK_SIZE"""
+        lines = iter(lines)
+        head = list(itertools.islice(lines, FORMAT_DETECTION_LINES))
+        pattern = self._detect_chat_format(head)
+        if pattern is None:
+            return
+        
+        timestamp = sender = None
+        parts = []
+        pending = []
+        
+        for line in itertools.chain(head, lines):
+            line = line.rstrip('\r\n').lstrip(INVISIBLE_MARKS)
+            match = pattern.match(line)
+            
+            if match is None:
+                # Продолжение многострочного сообщения
+                if sender is not None:
+                    parts.append(line)
+                continue
+            
+            if sender is not None:
+                pending.append((timestamp, sender, '\n'.join(parts)))
+                if len(pending) >= CLASSIFY_CHUNK_SIZE:
+                    yield pending
+                    pending = []
+            
+            timestamp, sender, first_line = match.groups()
+            parts = [first_line]
+        
+        if sender is not None:
+            pending.append((timestamp, sender, '\n'.join(parts)))
+        if pending:
+            yield pending
+    
+    def _detect_chat_format(self, head: List[str]) -> Optional[Pattern]:
+        """Выбирает формат даты, которому соответствует больше всего первых строк"""
+        best_pattern, best_count = None, 0
+        for pattern in CHAT_LINE_PATTERNS:
+            count = sum(1 for line in head if pattern.match(line.lstrip(INVISIBLE_MARKS)))
+            if count > best_count:
+                best_pattern, best_count = pattern, count
+        return best_pattern
+    
+    def _classify_raw(self, raw_messages: List[Tuple[str, str, str]]) -> Iterator[Tuple[str, str, str, int]]:
+        """(дата, отправитель, текст, признаки) - признаки определяются одной пачкой"""
+        texts = [message.strip() for _, _, message in raw_messages]
+        flags = self.classifier.classify_many(texts)
+        return (
+            (timestamp, sender.strip(), message, message_flags)
+            for (timestamp, sender, _), message, message_flags in zip(raw_messages, texts, flags)
+        )
+    
+    def _build_messages(self, raw_messages: List[Tuple[str, str, str]]) -> List[Dict]:
+        """Собирает сообщения-словари из (дата, отправитель, текст)"""
+        return [
+            {
+                'timestamp': timestamp,
+                'sender': sender,
+                'message': message,
+                'is_media': bool(flags & MEDIA),
+                'is_system': bool(flags & SYSTEM),
+                'flags': flags
+            }
+            for timestamp, sender, message, flags in self._classify_raw(raw_messages)
+        ]
+    
     def _is_media_message(self, message: str) -> bool:
         """Проверяет, является ли сообщение медиафайлом"""
-        media_indicators = [
-            '<Media omitted>',
-            'audio omitted',
-            'video omitted',
-            'image omitted',
-            'document omitted',
-            'Медиафайл пропущен',
-            'Аудио пропущено'
-        ]
-        return any(indicator in message for indicator in media_indicators)
+        return bool(self.classifier.classify(message) & MEDIA)
     
     def _is_system_message(self, message: str) -> bool:
         """Проверяет, является ли сообщение системным"""
-        system_indicators = [
-            'Messages and calls are end-to-end encrypted',
-            'создал группу',
-            'покинул группу',
-            'изменил тему группы',
-            'added',
-            'left',
-            'changed the group'
-        ]
-        return any(indicator in message for indicator in system_indicators)
+        return bool(self.classifier.classify(message) & SYSTEM)
     
-    def _extract_client_info(self, messages: List[Dict]) -> Dict:
+    def _extract_client_info(self, messages: MessageStore) -> Dict:
         """Извлекает информацию о клиенте из сообщений"""
         client_info = {
             'name': None,
@@ -151,39 +282,34 @@ class WhatsAppParser:
         }
         
         # Определяем имя клиента (не Иван и не системные сообщения)
-        senders = {}
-        for msg in messages:
-            if not msg['is_system'] and msg['sender'] != 'Иван':
-                senders[msg['sender']] = senders.get(msg['sender'], 0) + 1
+        senders = Counter(
+            messages.senders[sender_id]
+            for sender_id, flags in zip(messages.sender_ids, messages.flags) if not flags & SYSTEM
+        )
+        senders.pop('Иван', None)
         
         if senders:
             # Берем отправителя с наибольшим количеством сообщений
             client_info['name'] = max(senders, key=senders.get)
             client_info['message_count'] = senders[client_info['name']]
         
-        # Ищем описания проблем и другую информацию
-        floor_keywords = ['пол', 'паркет', 'ламинат', 'плитка', 'линолеум', 'покрытие']
-        
-        for msg in messages:
-            message_lower = msg['message'].lower()
-            
-            # Ищем описания проблем с полом
-            if any(keyword in message_lower for keyword in floor_keywords):
-                client_info['problem_descriptions'].append(msg['message'])
+        # Ищем описания проблем и другую информацию по признакам сообщений
+        for text, flags in zip(messages.texts, messages.flags):
+            # Описания проблем с полом
+            if flags & FLOOR:
+                client_info['problem_descriptions'].append(text)
             
-            # Ищем адрес
-            if any(word in message_lower for word in ['адрес', 'улица', 'дом', 'квартира']):
-                client_info['address'] = msg['message']
+            # Адрес
+            if flags & ADDRESS:
+                client_info['address'] = text
             
-            # Ищем телефон
-            phone_pattern = r'[\+]?[0-9\-\s\(\)]{10,}'
-            phone_match = re.search(phone_pattern, msg['message'])
-            if phone_match:
-                client_info['phone'] = phone_match.group()
+            # Телефон
+            if flags & PHONE:
+                client_info['phone'] = self.classifier.find_phone(text)
         
         return client_info
     
-    def _create_conversation_context(self, messages: List[Dict]) -> str:
+    def _create_conversation_context(self, messages: MessageStore) -> str:
         """Создает контекст разговора для ИИ"""
         context_parts = []
         
@@ -198,29 +324,58 @@ class WhatsAppParser:
         
         return '\n'.join(context_parts)
     
-    def _find_media_files(self, extract_dir: str) -> List[Dict]:
-        """Находит все медиафайлы в распакованном архиве"""
+    def _extract_media_members(self, zip_ref: zipfile.ZipFile, extract_dir: str):
+        """
+        Извлекает медиафайлы поддерживаемых форматов в порядке архива,
+        пока не исчерпан бюджет max_extract_size
+        
+        Returns:
+            (список медиафайлов, список пропущенных из-за бюджета)
+        """
         media_files = []
+        skipped = []
+        budget = self.max_extract_size
+        used_names = set()
         
-        for root, dirs, files in os.walk(extract_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                file_ext = os.path.splitext(file)[1].lower()
-                
-                if file_ext in self.supported_image_formats:
-                    media_files.append({
-                        'path': file_path,
-                        'name': file,
-                        'type': 'image',
-                        'extension': file_ext
-                    })
-                elif file_ext in self.supported_audio_formats:
-                    media_files.append({
-                        'path': file_path,
-                        'name': file,
-                        'type': 'audio',
-                        'extension': file_ext
-                    })
-        
-        return media_files
-
+        for member in zip_ref.infolist():
+            if member.is_dir() or member.filename.startswith('__MACOSX/'):
+                continue
+            
+            # Берем только имя файла - пути внутри архива не доверяем
+            file = os.path.basename(member.filename)
+            file_ext = os.path.splitext(file)[1].lower()
+            
+            if file_ext in self.supported_image_formats:
+                media_type = 'image'
+            elif file_ext in self.supported_audio_formats:
+                media_type = 'audio'
+            else:
+                continue
+            
+            if member.file_size > budget:
+                skipped.append({'name': file, 'size': member.file_size})
+                continue
+            budget -= member.file_size
+            
+            name = file
+            counter = 1
+            while name in used_names:
+                name = f"{os.path.splitext(file)[0]}_{counter}{file_ext}"
+                counter += 1
+            used_names.add(name)
+            
+            file_path = os.path.join(extract_dir, name)
+            with zip_ref.open(member) as source, open(file_path, 'wb') as target:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+            
+            media_files.append({
+                'path': file_path,
+                'name': file,
+                'type': media_type,
+                'extension': file_ext
+            })
+        
+        if skipped:
+            logger.warning(f"Skipped {len(skipped)} media files over the extraction budget")
+        
+        return media_files, skipped